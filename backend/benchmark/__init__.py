@@ -0,0 +1,7 @@
+"""Offline benchmark and load test for the query API.
+
+Runs the backend against local stand-ins for Gemini (canned scripts) and the
+Mapache vehicle API (synthetic telemetry), drives ``/query`` at a configurable
+concurrency and saves latency, throughput and per-stage timings as JSON.
+Run from ``backend/`` with ``python -m benchmark --help``.
+"""
@@ -0,0 +1,291 @@
+"""Drive ``/query`` against local fakes and report latency, throughput and stage timings.
+
+    python -m benchmark --requests 200 --concurrency 8
+    python -m benchmark --baseline benchmark/results/<earlier run>.json
+
+Unless ``--backend-url`` points at a running server, the backend is started in
+a subprocess wired to the fake Gemini and Mapache servers, with a fresh signal
+cache directory.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import httpx
+import numpy as np
+
+from benchmark.fakes import BackgroundServer, create_gemini_app, create_mapache_app
+from signal_catalog import SignalCatalog
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BACKEND_DIR, "benchmark", "results")
+STAGES = ("generate", "queue", "fetch", "exec", "serialize")
+
+# Mix of fast-path aggregates and questions that need a generated script
+QUERY_TEMPLATES = [
+    "max {a} on trip {trip}",
+    "average {a} on trip {trip}",
+    "95th percentile of {a} on trip {trip}",
+    "top 5 {a} values on trip {trip}",
+    "summary of {a} and {b} on trip {trip}",
+    "correlation between {a} and {b} on trip {trip}",
+    "mean {a} in the last 5 minutes of trip {trip}",
+    "trend of {a} over trip {trip}",
+]
+
+
+def build_queries(count: int, trips: int, signals: List[str], seed: int) -> List[str]:
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        a, b = rng.sample(signals, 2)
+        template = rng.choice(QUERY_TEMPLATES)
+        queries.append(template.format(a=a, b=b, trip=rng.randint(1, trips)))
+    return queries
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def start_backend(port: int, env: Dict[str, str], timeout: float, api_workers: int = 1) -> subprocess.Popen:
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning",
+         "--workers", str(api_workers)],
+        cwd=BACKEND_DIR,
+        env={**os.environ, **env},
+    )
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"backend exited with code {process.returncode}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("backend did not become healthy in time")
+
+
+def free_port() -> int:
+    import socket
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def drive(base_url: str, queries: List[str], concurrency: int, timeout: float) -> List[Dict[str, Any]]:
+    """Send every query with at most ``concurrency`` in flight; one record per request."""
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        async def one(query: str) -> Dict[str, Any]:
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    response = await client.post("/query", json={"message": query})
+                    latency_ms = (time.perf_counter() - started) * 1000
+                    body = response.json()
+                except (httpx.HTTPError, ValueError) as e:
+                    return {"query": query, "ok": False, "latency_ms": (time.perf_counter() - started) * 1000, "error": repr(e)}
+            debug = (body.get("data") or {}).get("debug", {})
+            timings = dict(debug.get("timings", {}))
+            if "total_ms" in timings:
+                # Client-observed time not spent in the handler: response serialization and transport
+                timings["serialize_ms"] = max(0.0, latency_ms - timings["total_ms"])
+            return {
+                "query": query,
+                "ok": response.status_code == 200 and bool(body.get("success")),
+                "status": response.status_code,
+                "latency_ms": latency_ms,
+                "path": debug.get("path"),
+                "script_cache_hit": (debug.get("script_cache") or {}).get("hit"),
+                "timings": timings,
+                "error": body.get("error") or body.get("detail"),
+            }
+
+        return await asyncio.gather(*(one(q) for q in queries))
+
+
+def _percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "mean": None}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"p50": round(p50, 2), "p95": round(p95, 2), "p99": round(p99, 2), "mean": round(float(np.mean(values)), 2)}
+
+
+def summarize(records: List[Dict[str, Any]], elapsed_s: float) -> Dict[str, Any]:
+    ok = [r for r in records if r["ok"]]
+    paths: Dict[str, int] = {}
+    for r in records:
+        paths[r.get("path") or "none"] = paths.get(r.get("path") or "none", 0) + 1
+    return {
+        "requests": len(records),
+        "succeeded": len(ok),
+        "failed": len(records) - len(ok),
+        "elapsed_s": round(elapsed_s, 3),
+        "throughput_rps": round(len(records) / elapsed_s, 2) if elapsed_s else None,
+        "latency_ms": _percentiles([r["latency_ms"] for r in records]),
+        "stages_ms": {
+            stage: _percentiles([r["timings"][f"{stage}_ms"] for r in ok if f"{stage}_ms" in r["timings"]])
+            for stage in STAGES
+        },
+        "by_path": {
+            path: _percentiles([r["latency_ms"] for r in records if (r.get("path") or "none") == path])
+            for path in paths
+        },
+        "paths": paths,
+        "script_cache_hits": sum(1 for r in records if r.get("script_cache_hit")),
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    lines = []
+    for label, path in (
+        ("latency p50", ("latency_ms", "p50")),
+        ("latency p95", ("latency_ms", "p95")),
+        ("latency p99", ("latency_ms", "p99")),
+        ("throughput", ("throughput_rps",)),
+    ):
+        now, then = current, baseline
+        for key in path:
+            now, then = (now or {}).get(key), (then or {}).get(key)
+        if now is None or not then:
+            continue
+        lines.append(f"  {label:<12} {then:>10.2f} -> {now:>10.2f}  ({(now - then) / then * 100:+.1f}%)")
+    return lines
+
+
+def print_report(summary: Dict[str, Any]) -> None:
+    lat = summary["latency_ms"]
+    print(f"requests {summary['requests']} ok {summary['succeeded']} failed {summary['failed']} "
+          f"in {summary['elapsed_s']}s -> {summary['throughput_rps']} req/s")
+    print(f"latency ms  p50 {lat['p50']}  p95 {lat['p95']}  p99 {lat['p99']}  mean {lat['mean']}")
+    print("stage ms        p50       p95       p99")
+    for stage, stats in summary["stages_ms"].items():
+        if stats["p50"] is not None:
+            print(f"  {stage:<10} {stats['p50']:>9} {stats['p95']:>9} {stats['p99']:>9}")
+    print(f"paths {summary['paths']}  script cache hits {summary['script_cache_hits']}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmark", description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=0, help="requests sent first and left out of the results")
+    parser.add_argument("--trips", type=int, default=5, help="distinct trip ids in the query mix")
+    parser.add_argument("--trip-seconds", type=float, default=600.0, help="length of each synthetic trip")
+    parser.add_argument("--hz", type=float, default=10.0, help="synthetic sample rate per signal")
+    parser.add_argument("--signals", default="mobile_speed,acu_cell1_temp,acu_cell2_temp,acu_cell1_voltage,acu_cell2_voltage",
+                        help="comma-separated signals used in the query mix")
+    parser.add_argument("--gemini-latency-ms", type=float, default=500.0)
+    parser.add_argument("--mapache-latency-ms", type=float, default=50.0)
+    parser.add_argument("--workers", type=int, default=None, help="SCRIPT_WORKERS for the backend")
+    parser.add_argument("--api-workers", type=int, default=1,
+                        help="uvicorn worker processes; more than one shares caches through CACHE_BACKEND=sqlite")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=120.0, help="per-request timeout in seconds")
+    parser.add_argument("--backend-url", help="benchmark an already running backend instead of starting one")
+    parser.add_argument("--out", help="result file (default: benchmark/results/<time>-<commit>.json)")
+    parser.add_argument("--baseline", help="earlier result file to compare against")
+    args = parser.parse_args(argv)
+
+    catalog = SignalCatalog.load()
+    signals = [s.strip() for s in args.signals.split(",") if s.strip()]
+    unknown = [s for s in signals if s not in catalog]
+    if unknown or len(signals) < 2:
+        parser.error(f"--signals needs at least two catalog signals (unknown: {unknown})")
+    queries = build_queries(args.warmup + args.requests, args.trips, signals, args.seed)
+
+    fakes: List[BackgroundServer] = []
+    backend: Optional[subprocess.Popen] = None
+    base_url = args.backend_url
+    try:
+        if base_url is None:
+            gemini = BackgroundServer(create_gemini_app(catalog, args.gemini_latency_ms / 1000)).start()
+            mapache = BackgroundServer(create_mapache_app(args.trip_seconds, args.hz, args.mapache_latency_ms / 1000)).start()
+            fakes = [gemini, mapache]
+            port = free_port()
+            env = {
+                "GEMINI_API_KEY": "benchmark",
+                "GEMINI_BASE_URL": f"{gemini.url}/v1",
+                "GEMINI_RPM": "0",
+                "VEHICLE_API_URL": f"{mapache.url}/api/query/signals",
+                "SIGNAL_CACHE_DIR": tempfile.mkdtemp(prefix="signal-cache-"),
+                "SCRIPT_CACHE_PATH": "",
+            }
+            if args.workers:
+                env["SCRIPT_WORKERS"] = str(args.workers)
+            if args.api_workers > 1:
+                env["CACHE_BACKEND"] = "sqlite"
+            backend = start_backend(port, env, timeout=60, api_workers=args.api_workers)
+            base_url = f"http://127.0.0.1:{port}"
+
+        if args.warmup:
+            asyncio.run(drive(base_url, queries[:args.warmup], 1, args.timeout))
+        started = time.perf_counter()
+        records = asyncio.run(drive(base_url, queries[args.warmup:], args.concurrency, args.timeout))
+        summary = summarize(records, time.perf_counter() - started)
+    finally:
+        if backend is not None:
+            backend.terminate()
+            try:
+                backend.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                backend.kill()
+        for server in fakes:
+            server.stop()
+
+    commit = git_commit()
+    result = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": commit,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": vars(args),
+        },
+        "summary": summary,
+        "upstream_calls": {"gemini": fakes[0].app.state.calls, "mapache": fakes[1].app.state.calls} if fakes else None,
+        "errors": [{"query": r["query"], "error": r["error"]} for r in records if not r["ok"]][:20],
+        "requests": records,
+    }
+    out = args.out or os.path.join(
+        RESULTS_DIR, f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}-{commit or 'nocommit'}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as fh:
+        json.dump(result, fh, indent=2)
+
+    print_report(summary)
+    if result["upstream_calls"]:
+        print(f"upstream calls {result['upstream_calls']}")
+    if args.baseline:
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+        print(f"vs baseline {args.baseline} ({baseline['meta'].get('commit')}):")
+        print("\n".join(compare(summary, baseline["summary"])) or "  nothing comparable")
+    print(f"saved {out}")
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
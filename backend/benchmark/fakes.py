@@ -0,0 +1,153 @@
+"""Local stand-ins for the Gemini API and the Mapache vehicle API.
+
+``create_gemini_app`` answers ``generateContent`` with a canned analysis script
+chosen from the user query in the prompt, after an optional simulated model
+latency. ``create_mapache_app`` serves deterministic synthetic telemetry for
+any signal in ``signals.csv``: every trip has the same length and sample rate,
+and each signal is a seeded sine wave plus noise, so runs are comparable.
+"""
+import asyncio
+import hashlib
+import json
+import re
+import threading
+import time
+from functools import lru_cache
+from typing import List, Optional
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request, Response
+
+from signal_catalog import SignalCatalog
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_QUERY_RE = re.compile(r'User Query: "(.*)"')
+TRIP_EPOCH_S = 1_714_557_600  # 2024-05-01T10:00:00Z; trip N starts N hours later
+
+
+def _dumps(payload) -> bytes:
+    return orjson.dumps(payload) if orjson is not None else json.dumps(payload).encode()
+
+
+def canned_script(query: str, signals: List[str]) -> str:
+    """A script in the shape Gemini is asked for, picked by the kind of question."""
+    signals = signals or ["mobile_speed"]
+    text = query.lower()
+    header = f"signals = {signals!r}\ntrip = PARAMS['trip_ids'][0] if PARAMS.get('trip_ids') else None\n"
+    if ("correlation" in text or "correlate" in text) and len(signals) >= 2:
+        body = (
+            "df = fetch_signals(signals[:2], trip_id=trip)\n"
+            "corr = df[signals[0]].corr(df[signals[1]])\n"
+            "result = f'Correlation between {signals[0]} and {signals[1]}: {corr:.3f}'\n"
+        )
+    elif "last" in text and "min" in text:
+        body = (
+            "resp = http_get(build_url(signals, trip_id=trip, last='5min'))\n"
+            "df = pd.DataFrame(resp.json()['data'])\n"
+            "parts = [f'{s} mean over the last 5 min: {pd.to_numeric(df[s], errors=\"coerce\").mean():.3f}' for s in signals if s in df]\n"
+            "result = '; '.join(parts) or 'No data found'\n"
+        )
+    elif "trend" in text:
+        body = (
+            "df = fetch_signals(signals, trip_id=trip, resolution='1min')\n"
+            "slope = (df[signals[0]].iloc[-1] - df[signals[0]].iloc[0]) / max(len(df) - 1, 1)\n"
+            "result = f'{signals[0]} trend: {slope:+.4f} per minute over {len(df)} minutes'\n"
+        )
+    else:
+        body = (
+            "resp = http_get(build_url(signals, trip_id=trip))\n"
+            "resp.raise_for_status()\n"
+            "df = pd.DataFrame(resp.json()['data'])\n"
+            "parts = []\n"
+            "for s in signals:\n"
+            "    col = pd.to_numeric(df.get(s), errors='coerce').dropna()\n"
+            "    parts.append(f'{s}: mean {col.mean():.3f}, max {col.max():.3f}, n={len(col)}')\n"
+            "result = '; '.join(parts)\n"
+        )
+    return header + body + "print(result)\nset_result(result)\n"
+
+
+def create_gemini_app(catalog: SignalCatalog, latency_s: float = 0.0) -> FastAPI:
+    app = FastAPI()
+    app.state.calls = 0
+
+    @app.post("/{version}/models/{model_action}")
+    async def generate_content(version: str, model_action: str, request: Request):
+        body = await request.json()
+        prompt = "".join(part.get("text", "") for content in body.get("contents", []) for part in content.get("parts", []))
+        match = _QUERY_RE.search(prompt)
+        query = match.group(1) if match else ""
+        app.state.calls += 1
+        if latency_s:
+            await asyncio.sleep(latency_s)
+        script = canned_script(query, catalog.resolve(query))
+        return {"candidates": [{"content": {"parts": [{"text": f"```python\n{script}```"}]}}]}
+
+    return app
+
+
+def _signal_values(signal: str, trip_id: str, timestamps_s: np.ndarray) -> np.ndarray:
+    seed = int.from_bytes(hashlib.sha256(f"{signal}:{trip_id}".encode()).digest()[:8], "little")
+    rng = np.random.default_rng(seed)
+    offset, amplitude, period = rng.uniform(0, 100), rng.uniform(1, 20), rng.uniform(30, 600)
+    t = timestamps_s - timestamps_s[0]
+    return np.round(offset + amplitude * np.sin(2 * np.pi * t / period) + rng.normal(0, amplitude / 10, t.size), 3)
+
+
+def create_mapache_app(trip_seconds: float = 600.0, hz: float = 10.0, latency_s: float = 0.0) -> FastAPI:
+    app = FastAPI()
+    app.state.calls = 0
+    app.state.bytes = 0
+
+    @lru_cache(maxsize=256)
+    def render(trip_id: str, signals: tuple) -> bytes:
+        start = TRIP_EPOCH_S + (int(trip_id) if trip_id.isdigit() else 0) * 3600
+        timestamps = start + np.arange(int(trip_seconds * hz)) / hz
+        stamps = np.datetime_as_string((timestamps * 1000).astype("datetime64[ms]"), unit="ms", timezone="UTC").tolist()
+        columns = {name: _signal_values(name, trip_id, timestamps).tolist() for name in signals}
+        rows = [{"produced_at": ts, **{name: col[i] for name, col in columns.items()}} for i, ts in enumerate(stamps)]
+        return _dumps({"data": rows})
+
+    @app.get("/api/query/signals")
+    async def query_signals(vehicle_id: str, trip_id: str, signals: str, token: Optional[str] = None):
+        names = tuple(s for s in signals.split(",") if s)
+        app.state.calls += 1
+        if latency_s:
+            await asyncio.sleep(latency_s)
+        body = await asyncio.to_thread(render, trip_id, names)
+        app.state.bytes += len(body)
+        return Response(body, media_type="application/json")
+
+    return app
+
+
+class BackgroundServer:
+    """Run an ASGI app with uvicorn on a background thread."""
+
+    def __init__(self, app: FastAPI, host: str = "127.0.0.1", port: int = 0):
+        self.app = app
+        self.server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning", lifespan="off"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.servers[0].sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    def start(self, timeout: float = 10.0) -> "BackgroundServer":
+        self.thread.start()
+        deadline = time.monotonic() + timeout
+        while not self.server.started:
+            if time.monotonic() > deadline or not self.thread.is_alive():
+                raise RuntimeError("fake server failed to start")
+            time.sleep(0.02)
+        return self
+
+    def stop(self) -> None:
+        self.server.should_exit = True
+        self.thread.join(timeout=5)
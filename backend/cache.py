@@ -0,0 +1,426 @@
+"""Bounded LRU + TTL caches with hit/miss/eviction counters, plus single-flight
+coalescing of identical in-flight work.
+
+``LRUCache`` keeps entries in the process (optionally persisted to JSON);
+``SQLiteCache`` keeps them in a SQLite database in WAL mode, so every API worker
+process on a host shares one cache. ``create_cache`` picks the backend.
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from time import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class CacheBackend(ABC):
+    """Key/value cache interface shared by the in-process and shared backends."""
+
+    @abstractmethod
+    def get_with_age(self, key: str) -> Optional[Tuple[Any, float]]:
+        """``(value, age_seconds)``, or None when missing or expired."""
+
+    @abstractmethod
+    def set(self, key: str, value: Any) -> None: ...
+
+    @abstractmethod
+    def delete(self, key: str) -> None: ...
+
+    @abstractmethod
+    def clear(self) -> None: ...
+
+    @abstractmethod
+    def __len__(self) -> int: ...
+
+    @abstractmethod
+    def stats(self) -> Dict[str, Any]: ...
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self.get_with_age(key)
+        return entry[0] if entry is not None else None
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def save(self) -> None:
+        """Flush pending writes (no-op for backends that write through)."""
+
+
+class LRUCache(CacheBackend):
+    """Thread-safe LRU cache whose entries also expire after ``ttl_seconds``.
+
+    With ``persist_path`` set, entries (which must be JSON-serializable) are
+    loaded at construction and written back by ``save``; ``set`` saves at most
+    once every ``save_interval`` seconds so a restart keeps the cache warm.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl_seconds: Optional[float] = None,
+        persist_path: Optional[str] = None,
+        save_interval: float = 10.0,
+    ):
+        self.maxsize = max(1, maxsize)
+        self.ttl_seconds = ttl_seconds
+        self.persist_path = persist_path
+        self.save_interval = save_interval
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._last_save = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        if persist_path:
+            self.load()
+
+    def _expired(self, stored_at: float, now: float) -> bool:
+        return self.ttl_seconds is not None and (now - stored_at) >= self.ttl_seconds
+
+    def get_with_age(self, key: str) -> Optional[Tuple[Any, float]]:
+        now = time()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if self._expired(entry[0], now):
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                self._dirty = True
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1], now - entry[0]
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (time(), value)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+            self._dirty = True
+        if self.persist_path and time() - self._last_save >= self.save_interval:
+            self.save()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            if self._data.pop(key, None) is not None:
+                self._dirty = True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._dirty = True
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def load(self) -> None:
+        try:
+            with open(self.persist_path) as fh:
+                entries = json.load(fh)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable cache file {self.persist_path}: {e}")
+            return
+        now = time()
+        with self._lock:
+            for key, stored_at, value in entries[-self.maxsize:]:
+                if not self._expired(stored_at, now):
+                    self._data[key] = (stored_at, value)
+        logger.info(f"Loaded {len(self._data)} cache entries from {self.persist_path}")
+
+    def save(self) -> None:
+        if not self.persist_path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            entries = [[key, stored_at, value] for key, (stored_at, value) in self._data.items()]
+            self._dirty = False
+            self._last_save = time()
+        tmp_path = f"{self.persist_path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.persist_path)), exist_ok=True)
+            with open(tmp_path, "w") as fh:
+                json.dump(entries, fh)
+            os.replace(tmp_path, self.persist_path)
+        except (OSError, TypeError) as e:
+            logger.warning(f"Cache persistence to {self.persist_path} failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "memory",
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class SQLiteCache(CacheBackend):
+    """LRU + TTL cache in a SQLite database shared by every process that opens it.
+
+    Several caches live in one file under different ``namespace`` values.
+    Values must be JSON-serializable. WAL mode lets readers proceed while
+    another process writes. Lookups only read: the LRU position of a hit is
+    remembered in the process and written with its next ``set`` (or ``save``),
+    so hot-path reads never wait for the write lock. The cache is best-effort:
+    a SQLite error (e.g. the database stays locked for longer than ``timeout``)
+    is logged and counted, and the lookup is a miss or the write is skipped.
+    Hit and miss counters are per process; size and evictions cover all
+    processes.
+    """
+
+    def __init__(self, path: str, namespace: str, maxsize: int, ttl_seconds: Optional[float] = None, timeout: float = 1.0):
+        self.path = path
+        self.namespace = namespace
+        self.maxsize = max(1, maxsize)
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._touched: Dict[str, float] = {}  # key -> last hit, not yet written
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.errors = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " namespace TEXT NOT NULL, key TEXT NOT NULL, stored_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL, value TEXT NOT NULL, PRIMARY KEY (namespace, key)"
+                ") WITHOUT ROWID"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS cache_lru ON cache (namespace, accessed_at)")
+
+    def _expired(self, stored_at: float, now: float) -> bool:
+        return self.ttl_seconds is not None and (now - stored_at) >= self.ttl_seconds
+
+    def _failed(self, operation: str, error: sqlite3.Error) -> None:
+        self.errors += 1
+        logger.warning(f"Cache {self.namespace!r} {operation} failed, continuing without it: {error}")
+
+    def get_with_age(self, key: str) -> Optional[Tuple[Any, float]]:
+        now = time()
+        with self._lock:
+            try:
+                row = self._conn.execute(
+                    "SELECT stored_at, value FROM cache WHERE namespace = ? AND key = ?", (self.namespace, key)
+                ).fetchone()
+            except sqlite3.Error as e:
+                self._failed("lookup", e)
+                self.misses += 1
+                return None
+            if row is None or self._expired(row[0], now):
+                # Expired rows are removed by the next write
+                self.misses += 1
+                return None
+            self._touched[key] = now
+            self.hits += 1
+        return json.loads(row[1]), now - row[0]
+
+    def _write(self, statements: Callable[[], None]) -> bool:
+        """Run ``statements`` in one write transaction with the pending LRU touches; False if it failed."""
+        try:
+            self._conn.execute("BEGIN IMMEDIATE")
+        except sqlite3.Error as e:
+            self._failed("write", e)
+            return False
+        try:
+            if self._touched:
+                self._conn.executemany(
+                    "UPDATE cache SET accessed_at = MAX(accessed_at, ?) WHERE namespace = ? AND key = ?",
+                    [(at, self.namespace, key) for key, at in self._touched.items()],
+                )
+            statements()
+            self._conn.execute("COMMIT")
+        except BaseException as e:
+            try:
+                self._conn.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+            if not isinstance(e, sqlite3.Error):
+                raise
+            self._failed("write", e)
+            return False
+        self._touched.clear()
+        return True
+
+    def set(self, key: str, value: Any) -> None:
+        now = time()
+        encoded = json.dumps(value)
+        counts = {}
+
+        def statements() -> None:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (namespace, key, stored_at, accessed_at, value) VALUES (?, ?, ?, ?, ?)",
+                (self.namespace, key, now, now, encoded),
+            )
+            if self.ttl_seconds is not None:
+                counts["expired"] = self._conn.execute(
+                    "DELETE FROM cache WHERE namespace = ? AND stored_at <= ?", (self.namespace, now - self.ttl_seconds)
+                ).rowcount
+            counts["evicted"] = self._conn.execute(
+                "DELETE FROM cache WHERE namespace = ? AND key IN ("
+                " SELECT key FROM cache WHERE namespace = ? ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.namespace, self.namespace, self.maxsize),
+            ).rowcount
+
+        with self._lock:
+            if self._write(statements):
+                self.expirations += max(0, counts.get("expired", 0))
+                self.evictions += max(0, counts["evicted"])
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._touched.pop(key, None)
+            self._write(lambda: self._conn.execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (self.namespace, key)))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._touched.clear()
+            self._write(lambda: self._conn.execute("DELETE FROM cache WHERE namespace = ?", (self.namespace,)))
+
+    def save(self) -> None:
+        """Write the LRU positions of recent hits."""
+        with self._lock:
+            if self._touched:
+                self._write(lambda: None)
+
+    def __len__(self) -> int:
+        with self._lock:
+            try:
+                return self._conn.execute("SELECT COUNT(*) FROM cache WHERE namespace = ?", (self.namespace,)).fetchone()[0]
+            except sqlite3.Error as e:
+                self._failed("count", e)
+                return 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "sqlite",
+            "size": len(self),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "errors": self.errors,
+        }
+
+
+def create_cache(
+    backend: str,
+    namespace: str,
+    maxsize: int,
+    ttl_seconds: Optional[float] = None,
+    persist_path: Optional[str] = None,
+    sqlite_path: Optional[str] = None,
+) -> CacheBackend:
+    """``"memory"``: an ``LRUCache`` per process (JSON-persisted to ``persist_path`` if set).
+    ``"sqlite"``: a ``SQLiteCache`` namespace in ``sqlite_path``, shared by all processes."""
+    if backend == "memory":
+        return LRUCache(maxsize, ttl_seconds=ttl_seconds, persist_path=persist_path)
+    if backend == "sqlite":
+        if not sqlite_path:
+            raise ValueError("the sqlite cache backend needs a database path")
+        return SQLiteCache(sqlite_path, namespace, maxsize, ttl_seconds=ttl_seconds)
+    raise ValueError(f"unknown cache backend {backend!r} (expected 'memory' or 'sqlite')")
+
+
+class SingleFlight:
+    """Coalesce concurrent identical calls into one shared awaitable.
+
+    The first caller for a key starts the work; callers arriving while it is in
+    flight await the same task. The work is only cancelled once every waiter
+    has been cancelled.
+    """
+
+    # A single cancel can be swallowed by a library the work is in (anyio's
+    # connect_tcp inside httpx uncancels its task when a cancel lands while the
+    # connection is being opened), so it is re-delivered until the work stops
+    CANCEL_RETRY_SECONDS = 0.05
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self._waiters: Dict[Hashable, int] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Run ``fn`` once per key at a time; returns ``(result, shared)``."""
+        task = self._inflight.get(key)
+        shared = task is not None
+        if shared:
+            self.coalesced += 1
+        else:
+            self.started += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            self._waiters[key] = 0
+            task.add_done_callback(lambda _t, k=key: self._forget(k, _t))
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            return await asyncio.shield(task), shared
+        except asyncio.CancelledError:
+            if not task.done():
+                self._waiters[key] -= 1
+                if self._waiters[key] <= 0:
+                    self._abandon(task)
+            raise
+
+    async def do_batch(self, keys: Iterable[Hashable], fn: Callable[[List[Hashable]], Awaitable[Any]]) -> int:
+        """Ensure work for every key is done, starting one shared call for keys not in flight.
+
+        Returns how many keys were already in flight. The work is never
+        cancelled by a waiter: its results (e.g. fetched data) stay useful.
+        """
+        keys = list(dict.fromkeys(keys))
+        tasks = {self._inflight[k] for k in keys if k in self._inflight}
+        fresh = [k for k in keys if k not in self._inflight]
+        self.coalesced += len(keys) - len(fresh)
+        if fresh:
+            self.started += 1
+            task = asyncio.ensure_future(fn(fresh))
+            for key in fresh:
+                self._inflight[key] = task
+                task.add_done_callback(lambda _t, k=key: self._forget(k, _t))
+            tasks.add(task)
+        for task in tasks:
+            await asyncio.shield(task)
+        return len(keys) - len(fresh)
+
+    def _abandon(self, task: asyncio.Task) -> None:
+        if task.done():
+            return
+        task.cancel()
+        asyncio.get_running_loop().call_later(self.CANCEL_RETRY_SECONDS, self._abandon, task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+            self._waiters.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            # Retrieve the exception so asyncio does not warn about it being unobserved
+            logger.debug(f"{self.name} flight for {key!r} failed: {task.exception()}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {"in_flight": len(self._inflight), "started": self.started, "coalesced": self.coalesced}
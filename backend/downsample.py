@@ -0,0 +1,230 @@
+"""Time windows and multi-resolution bucket pyramids for cached signal series.
+
+Scripts can ask for part of a trip (``start``/``end``, or the ``last`` N
+minutes) and/or a coarser ``resolution``. Each cached signal keeps a pyramid of
+fixed-width buckets (min/max/sum/count per bucket, aligned to the epoch so all
+signals share one grid); a requested resolution is served by re-aggregating
+the coarsest stored level that divides it, so long trips read kilobytes instead
+of the full-rate series.
+"""
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+HINT_PARAMS = ("start", "end", "last", "resolution")
+DEFAULT_PYRAMID_LEVELS = "1s,10s,1min,10min"
+_NS_MIN = np.iinfo(np.int64).min
+_NS_MAX = np.iinfo(np.int64).max
+
+
+def epoch_scale(magnitude: float) -> int:
+    """Nanoseconds per unit for an epoch number, guessed from its magnitude."""
+    if magnitude > 1e17:
+        return 1
+    if magnitude > 1e14:
+        return 1_000
+    if magnitude > 1e11:
+        return 1_000_000
+    return 1_000_000_000
+
+
+def parse_time_ns(value: Any) -> int:
+    """Epoch ns from an ISO string, a datetime/Timestamp, or an epoch number (s/ms/us/ns)."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return int(value * epoch_scale(abs(value)))
+    text = str(value).strip()
+    try:
+        number = float(text)
+    except ValueError:
+        stamp = pd.Timestamp(text)
+        stamp = stamp.tz_localize("UTC") if stamp.tzinfo is None else stamp.tz_convert("UTC")
+        return int(stamp.value)
+    return int(number * epoch_scale(abs(number)))
+
+
+def parse_duration_ns(value: Any) -> int:
+    """Positive duration in ns from seconds (number) or a pandas Timedelta string like ``"5min"``."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        ns = int(value * 1_000_000_000)
+    else:
+        text = str(value).strip()
+        try:
+            ns = int(float(text) * 1_000_000_000)
+        except ValueError:
+            ns = int(pd.Timedelta(text).value)
+    if ns <= 0:
+        raise ValueError(f"duration must be positive, got {value!r}")
+    return ns
+
+
+def parse_levels(spec: str) -> List[int]:
+    """Pyramid bucket widths in ns from a comma-separated list such as ``"1s,10s,1min"``."""
+    return sorted({parse_duration_ns(part) for part in spec.split(",") if part.strip()})
+
+
+@dataclass(frozen=True)
+class TimeWindow:
+    """Absolute ``start``/``end`` bounds and/or the ``last`` N ns of the data (all epoch ns)."""
+    start_ns: Optional[int] = None
+    end_ns: Optional[int] = None
+    last_ns: Optional[int] = None
+
+    @classmethod
+    def from_params(cls, params: Dict[str, Any]) -> "TimeWindow":
+        return cls(
+            start_ns=parse_time_ns(params["start"]) if params.get("start") not in (None, "") else None,
+            end_ns=parse_time_ns(params["end"]) if params.get("end") not in (None, "") else None,
+            last_ns=parse_duration_ns(params["last"]) if params.get("last") not in (None, "") else None,
+        )
+
+    @property
+    def is_unbounded(self) -> bool:
+        return self.start_ns is None and self.end_ns is None and self.last_ns is None
+
+    def bounds(self, data_end_ns: Optional[int]) -> Tuple[int, int]:
+        """Inclusive ``(lo, hi)``; ``last`` counts back from ``end`` or the end of the data."""
+        lo = self.start_ns if self.start_ns is not None else _NS_MIN
+        hi = self.end_ns if self.end_ns is not None else _NS_MAX
+        if self.last_ns is not None:
+            anchor = self.end_ns if self.end_ns is not None else data_end_ns
+            if anchor is not None:
+                lo = max(lo, anchor - self.last_ns)
+        return lo, hi
+
+
+@dataclass(frozen=True)
+class BucketLevel:
+    """Per-bucket aggregates of one signal at one bucket width."""
+    width_ns: int
+    starts: np.ndarray  # int64 epoch ns of each non-empty bucket
+    min: np.ndarray
+    max: np.ndarray
+    sum: np.ndarray  # float64
+    count: np.ndarray  # int64
+    fetched_at: float
+
+    @property
+    def nbytes(self) -> int:
+        return int(sum(a.nbytes for a in (self.starts, self.min, self.max, self.sum, self.count)))
+
+    def __len__(self) -> int:
+        return int(self.starts.shape[0])
+
+    @property
+    def mean(self) -> np.ndarray:
+        return self.sum / np.maximum(self.count, 1)
+
+    @property
+    def end_ns(self) -> Optional[int]:
+        return int(self.starts[-1]) + self.width_ns - 1 if len(self) else None
+
+    def window(self, lo: int, hi: int) -> "BucketLevel":
+        """Buckets overlapping ``[lo, hi]``; edges are rounded out to whole buckets."""
+        first = np.searchsorted(self.starts, lo - self.width_ns, side="right") if lo > _NS_MIN + self.width_ns else 0
+        last = np.searchsorted(self.starts, hi, side="right")
+        return BucketLevel(
+            self.width_ns, self.starts[first:last], self.min[first:last], self.max[first:last],
+            self.sum[first:last], self.count[first:last], self.fetched_at,
+        )
+
+    def append(self, later: "BucketLevel") -> "BucketLevel":
+        """This level followed by ``later``, whose buckets start no earlier than this level's last one.
+
+        A bucket present in both (samples on either side of a poll) is combined.
+        """
+        if not len(self):
+            return later
+        if not len(later):
+            return BucketLevel(self.width_ns, self.starts, self.min, self.max, self.sum, self.count, later.fetched_at)
+        tail = _reduce(
+            self.width_ns,
+            np.concatenate((self.starts[-1:], later.starts)),
+            np.concatenate((self.min[-1:], later.min)),
+            np.concatenate((self.max[-1:], later.max)),
+            np.concatenate((self.sum[-1:], later.sum)),
+            np.concatenate((self.count[-1:], later.count)),
+            later.fetched_at,
+        )
+        return BucketLevel(
+            self.width_ns,
+            np.concatenate((self.starts[:-1], tail.starts)),
+            np.concatenate((self.min[:-1], tail.min)),
+            np.concatenate((self.max[:-1], tail.max)),
+            np.concatenate((self.sum[:-1], tail.sum)),
+            np.concatenate((self.count[:-1], tail.count)),
+            later.fetched_at,
+        )
+
+    def rebucket(self, width_ns: int) -> "BucketLevel":
+        """Merge into coarser buckets; ``width_ns`` must be a multiple of this level's width."""
+        if width_ns == self.width_ns:
+            return self
+        if width_ns % self.width_ns:
+            raise ValueError(f"{width_ns} ns is not a multiple of {self.width_ns} ns")
+        return _reduce(width_ns, self.starts, self.min, self.max, self.sum, self.count, self.fetched_at)
+
+    def to_arrays(self, prefix: str) -> Dict[str, np.ndarray]:
+        return {
+            f"{prefix}starts": self.starts, f"{prefix}min": self.min, f"{prefix}max": self.max,
+            f"{prefix}sum": self.sum, f"{prefix}count": self.count,
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays: Any, prefix: str, width_ns: int, fetched_at: float) -> "BucketLevel":
+        return cls(
+            width_ns, arrays[f"{prefix}starts"], arrays[f"{prefix}min"], arrays[f"{prefix}max"],
+            arrays[f"{prefix}sum"], arrays[f"{prefix}count"], fetched_at,
+        )
+
+
+def _reduce(
+    width_ns: int,
+    timestamps: np.ndarray,
+    mins: np.ndarray,
+    maxs: np.ndarray,
+    sums: np.ndarray,
+    counts: np.ndarray,
+    fetched_at: float,
+) -> BucketLevel:
+    if timestamps.size == 0:
+        return BucketLevel(
+            width_ns, np.empty(0, dtype=np.int64), mins[:0], maxs[:0],
+            np.empty(0, dtype=np.float64), np.empty(0, dtype=np.int64), fetched_at,
+        )
+    # np.mod follows the divisor's sign, so this floors pre-1970 stamps too
+    keys = timestamps - np.mod(timestamps, width_ns)
+    edges = np.concatenate(([0], np.flatnonzero(keys[1:] != keys[:-1]) + 1))
+    return BucketLevel(
+        width_ns=width_ns,
+        starts=keys[edges],
+        min=np.minimum.reduceat(mins, edges),
+        max=np.maximum.reduceat(maxs, edges),
+        sum=np.add.reduceat(sums.astype(np.float64, copy=False), edges),
+        count=np.add.reduceat(counts, edges).astype(np.int64, copy=False),
+        fetched_at=fetched_at,
+    )
+
+
+def bucket_series(timestamps: np.ndarray, values: np.ndarray, width_ns: int, fetched_at: float) -> BucketLevel:
+    """Aggregate a sorted series into epoch-aligned buckets of ``width_ns``."""
+    return _reduce(width_ns, timestamps, values, values, values, np.ones(values.shape[0], dtype=np.int64), fetched_at)
+
+
+def build_pyramid(timestamps: np.ndarray, values: np.ndarray, widths_ns: Iterable[int], fetched_at: float) -> List[BucketLevel]:
+    """Bucket levels for each width, each built from the finest level that divides it."""
+    levels: List[BucketLevel] = []
+    for width in sorted(set(widths_ns)):
+        base = next((level for level in reversed(levels) if width % level.width_ns == 0), None)
+        if base is None:
+            levels.append(bucket_series(timestamps, values, width, fetched_at))
+        else:
+            levels.append(base.rebucket(width))
+    return levels
+
+
+def best_level_width(widths_ns: Iterable[int], resolution_ns: int) -> Optional[int]:
+    """Coarsest stored width that divides the requested resolution, if any."""
+    usable = [w for w in widths_ns if resolution_ns % w == 0]
+    return max(usable) if usable else None
@@ -0,0 +1,731 @@
+"""Pooled worker processes for running generated analysis scripts.
+
+Scripts run in pre-warmed worker processes (pandas already imported) instead of
+on the event loop. Each job gets its own timeout; a worker that times out,
+crashes or hits its memory cap is killed and replaced. Workers serve vehicle
+API reads through their own SignalStore over the shared on-disk cache.
+"""
+import asyncio
+import builtins
+import io
+import logging
+import marshal
+import os
+import signal
+from contextlib import redirect_stderr, redirect_stdout
+from dataclasses import dataclass, field
+from time import perf_counter, time
+from types import CodeType
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+import multiprocessing as mp
+
+from downsample import TimeWindow, bucket_series, parse_duration_ns
+from upstream import json_loads
+
+logger = logging.getLogger(__name__)
+
+
+class ScriptError(Exception):
+    """Base class for failures while running a generated script."""
+
+
+class ScriptTimeoutError(ScriptError):
+    """The script exceeded its per-job timeout and its worker was killed."""
+
+
+class ScriptFailedError(ScriptError):
+    """The script raised, or its worker died while running it."""
+
+
+@dataclass
+class ScriptRun:
+    output: str
+    debug: Dict[str, Any]
+    queue_wait_ms: int
+    run_ms: int
+    # Timing spans recorded in the worker (data reads), offsets from the start of the job
+    spans: List[Dict[str, Any]] = field(default_factory=list)
+
+
+@dataclass
+class _Worker:
+    process: Any
+    conn: Any
+    jobs: int = 0
+    started_at: float = field(default_factory=time)
+
+
+# ---------------------------------------------------------------------------
+# Worker process side
+# ---------------------------------------------------------------------------
+
+def _limit_memory(limit_mb: int) -> None:
+    if limit_mb <= 0:
+        return
+    try:
+        import resource
+        limit = limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ImportError, ValueError, OSError) as e:
+        logger.warning(f"Script worker memory cap not applied: {e}")
+
+
+def _reset_peak_rss() -> None:
+    """Reset the kernel's resident-set high-water mark (Linux), so it measures one job."""
+    try:
+        with open("/proc/self/clear_refs", "w") as fh:
+            fh.write("5")
+    except OSError:
+        pass
+
+
+def _peak_rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/status") as fh:
+            for line in fh:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        import sys
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Process lifetime peak: kB on Linux, bytes on macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+    except (ImportError, OSError):
+        return None
+
+
+class ScriptRuntime:
+    """Helpers injected into generated scripts (build_url, http_get, fetch_signals, signal_summaries,
+    signal_names, set_result)."""
+
+    def __init__(self, config: Dict[str, Any]):
+        import httpx
+        from signal_catalog import SignalCatalog
+        from signal_store import SignalStore
+
+        self.config = config
+        self.catalog = SignalCatalog.load(config["catalog_path"])
+        # Set per job by the worker loop; forwards progress events to the parent
+        self.emit: Callable[[Dict[str, Any]], None] = lambda event: None
+        # Per job: time spent reading signal data, bytes downloaded, timing spans and signals read per trip
+        self.fetch_ms = 0.0
+        self.upstream_bytes = 0
+        self.spans: List[Dict[str, Any]] = []
+        self.signals_read: Dict[str, Dict[str, int]] = {}  # trip -> signal -> samples (before any window)
+        self.job_started = perf_counter()
+        try:
+            import h2  # noqa: F401
+            http2 = True
+        except ImportError:
+            http2 = False
+        # One persistent client per worker so connections are reused across jobs
+        self.client = httpx.Client(http2=http2, timeout=config["data_timeout"])
+        self.store = SignalStore(
+            config["cache_dir"],
+            memory_budget_bytes=config["cache_memory_bytes"],
+            live_trip_ids=config["live_trip_ids"],
+            live_ttl_seconds=config["live_ttl_seconds"],
+            pyramid_widths_ns=config["pyramid_widths_ns"],
+            empty_ttl_seconds=config["empty_ttl_seconds"],
+        )
+
+    def fetch_upstream(
+        self, vehicle_id: str, trip_id: str, signals: List[str], hints: Optional[Dict[str, str]] = None
+    ) -> Any:
+        """Fetch raw JSON for the given signals in a single vehicle API request"""
+        params = {
+            "vehicle_id": vehicle_id,
+            "trip_id": trip_id,
+            "signals": ",".join(signals),
+            **(hints or {}),
+            "token": self.config["api_token"],
+        }
+        logger.info(f"Vehicle API fetch vehicle={vehicle_id} trip={trip_id} signals={len(signals)}")
+        response = self.client.get(self.config["api_url"], params=params)
+        response.raise_for_status()
+        self.upstream_bytes += len(response.content)
+        return json_loads(response.content)
+
+    def build_url(
+        self,
+        signals: List[str],
+        context: Dict[str, Any],
+        trip_id: Optional[Any] = None,
+        **hints: Any,
+    ) -> str:
+        # Construct signals query (comma-separated, no spaces)
+        sig_param = ",".join(s.strip() for s in signals if s and isinstance(s, str))
+        trip_id = context["trip_id"] if trip_id is None else str(trip_id)
+        # Optional start/end/last/resolution hints; Timestamps and Timedeltas go as ISO 8601
+        hint_param = "".join(
+            f"&{name}={quote(value.isoformat() if hasattr(value, 'isoformat') else str(value))}"
+            for name, value in hints.items()
+            if value is not None
+        )
+        base = (
+            f"{self.config['api_url']}?vehicle_id={context['vehicle_id']}&trip_id={trip_id}"
+            f"&signals={sig_param}{hint_param}&token={self.config['api_token']}"
+        )
+        logger.info(f"AI script build_url: {base}")
+        return base
+
+    def read_signals(
+        self,
+        vehicle_id: str,
+        trip_id: str,
+        signals: List[str],
+        hints: Dict[str, Any],
+        batch_size: int = 0,
+    ) -> Tuple[Dict[str, Any], bool]:
+        """Series for the requested time window, or bucket levels when a resolution is given.
+
+        Cached signals are cut locally (raw series or their bucket pyramid).
+        Missing ones are fetched with the hints the vehicle API supports pushed
+        upstream (that partial result is not cached), or else fetched whole into
+        the store. Returns ``(data, bucketed)``.
+        """
+        from signal_store import decode_signals_payload
+
+        started = perf_counter()
+        downloaded = self.upstream_bytes
+        window = TimeWindow.from_params(hints)
+        resolution = hints.get("resolution")
+        resolution_ns = parse_duration_ns(resolution) if resolution not in (None, "") else None
+        found: Dict[str, Any] = {}
+        for name in signals:
+            if resolution_ns is not None:
+                cached = self.store.get_buckets(vehicle_id, trip_id, name, resolution_ns)
+            else:
+                cached = self.store.get(vehicle_id, trip_id, name)
+            if cached is not None:
+                found[name] = cached
+        missing = [name for name in signals if name not in found]
+
+        pushed = {
+            name: str(hints[name])
+            for name in self.config["pushdown"]
+            if hints.get(name) not in (None, "")
+        }
+        if missing and pushed:
+            logger.info(f"Pushing {sorted(pushed)} down to the vehicle API for {len(missing)} signals")
+            decoded = decode_signals_payload(self.fetch_upstream(vehicle_id, trip_id, missing, pushed), missing)
+            for name, series in decoded.items():
+                found[name] = series if resolution_ns is None else bucket_series(
+                    series.timestamps, series.values, resolution_ns, series.fetched_at
+                )
+        elif missing:
+            fetched = self.store.ensure(
+                vehicle_id,
+                trip_id,
+                missing,
+                fetch=lambda batch: self.fetch_upstream(vehicle_id, trip_id, batch),
+                batch_size=batch_size,
+            )
+            for name, series in fetched.items():
+                level = None if resolution_ns is None else self.store.get_buckets(vehicle_id, trip_id, name, resolution_ns)
+                if resolution_ns is not None and level is None:
+                    # Store write failed; bucket what we just fetched
+                    level = bucket_series(series.timestamps, series.values, resolution_ns, series.fetched_at)
+                found[name] = series if resolution_ns is None else level
+
+        data = {name: found[name] for name in signals}
+        # Before the window cut: an empty window is an answer, an empty signal may not be uploaded yet
+        self._note_read(trip_id, {name: len(d) for name, d in data.items()})
+        if not window.is_unbounded:
+            ends = [d.end_ns for d in data.values() if d.end_ns is not None]
+            lo, hi = window.bounds(max(ends) if ends else None)
+            data = {name: d.window(lo, hi) if resolution_ns is not None else d.between(lo, hi) for name, d in data.items()}
+        self.fetch_ms += (perf_counter() - started) * 1000
+        self._span(
+            "data_read",
+            started,
+            signals=len(signals),
+            bytes=sum(d.nbytes for d in data.values()),
+            upstream_bytes=self.upstream_bytes - downloaded,
+            bucketed=resolution_ns is not None,
+        )
+        return data, resolution_ns is not None
+
+    def _note_read(self, trip_id: str, rows: Dict[str, int]) -> None:
+        read = self.signals_read.setdefault(trip_id, {})
+        for name, count in rows.items():
+            read[name] = max(read.get(name, 0), int(count))
+
+    def _span(self, name: str, started: float, **attrs: Any) -> None:
+        self.spans.append({
+            "name": name,
+            "start_ms": round((started - self.job_started) * 1000, 2),
+            "duration_ms": round((perf_counter() - started) * 1000, 2),
+            **attrs,
+        })
+
+    def http_get(self, url: str):
+        from signal_store import CachedResponse, buckets_to_series, parse_signals_url, series_to_payload
+
+        logger.info(f"AI script HTTP GET: {url}")
+        request = parse_signals_url(url, self.config["api_url"])
+        if request is None:
+            started = perf_counter()
+            response = self.client.get(url)
+            self._span("http_get", started, bytes=len(response.content), status=response.status_code, cached=False)
+            return response
+        started = perf_counter()
+        downloaded = self.upstream_bytes
+        # Vehicle API reads are served from the local signal store
+        data, bucketed = self.read_signals(request.vehicle_id, request.trip_id, request.signals, request.params)
+        payload = series_to_payload(buckets_to_series(data) if bucketed else data)
+        self._span(
+            "http_get",
+            started,
+            signals=len(request.signals),
+            rows=len(payload["data"]),
+            bytes=sum(d.nbytes for d in data.values()),
+            upstream_bytes=self.upstream_bytes - downloaded,
+            cached=self.upstream_bytes == downloaded,
+        )
+        self.emit({
+            "event": "data_fetched",
+            "trip_id": request.trip_id,
+            "signals": request.signals,
+            "rows": len(payload["data"]),
+        })
+        return CachedResponse(url, payload)
+
+    def fetch_signals(
+        self,
+        signals: List[str],
+        context: Dict[str, Any],
+        trip_id: Optional[Any] = None,
+        tolerance: Any = None,
+        reference: Optional[str] = None,
+        direction: str = "backward",
+        dtype: str = "float32",
+        start: Any = None,
+        end: Any = None,
+        last: Any = None,
+        resolution: Any = None,
+        agg: str = "mean",
+    ):
+        """Fetch many signals in batched requests and return one timestamp-aligned DataFrame.
+
+        With ``resolution`` the columns are the per-bucket ``agg`` (mean, min,
+        max, sum or count) on a shared bucket grid instead of raw samples.
+        """
+        import pandas as pd
+        from signal_store import TIMESTAMP_FIELD, align_series
+
+        trip_id = context["trip_id"] if trip_id is None else str(trip_id)
+        signals = [s.strip() for s in signals if s and isinstance(s, str)]
+        hints = {"start": start, "end": end, "last": last, "resolution": resolution}
+        data, bucketed = self.read_signals(
+            context["vehicle_id"], trip_id, signals, hints, batch_size=self.config["fetch_batch_size"]
+        )
+        if bucketed:
+            if agg not in ("mean", "min", "max", "sum", "count"):
+                raise ValueError("agg must be one of mean, min, max, sum, count")
+            frame = pd.concat(
+                {name: pd.Series(getattr(level, agg), index=level.starts) for name, level in data.items()},
+                axis=1,
+            ).sort_index() if data else pd.DataFrame()
+            frame.index = pd.DatetimeIndex(frame.index.to_numpy(dtype="datetime64[ns]"), name=TIMESTAMP_FIELD).tz_localize("UTC")
+            self.emit({"event": "data_fetched", "trip_id": trip_id, "signals": signals, "rows": len(frame)})
+            return frame
+        series = data
+        if tolerance is None:
+            tolerance_ns = int(self.config["align_tolerance_ms"] * 1_000_000)
+        elif isinstance(tolerance, (int, float)):
+            tolerance_ns = int(tolerance * 1_000_000_000)  # seconds
+        else:
+            tolerance_ns = int(pd.Timedelta(tolerance).value)
+        frame = align_series(series, tolerance_ns, reference=reference, direction=direction, dtype=dtype)
+        self.emit({"event": "data_fetched", "trip_id": trip_id, "signals": signals, "rows": len(frame)})
+        return frame
+
+    def signal_summaries(self, signals: List[str], context: Dict[str, Any], trip_id: Optional[Any] = None):
+        """One row of precomputed summary statistics per signal (count, min, max, mean, stddev, ...)."""
+        import pandas as pd
+
+        started = perf_counter()
+        downloaded = self.upstream_bytes
+        trip_id = context["trip_id"] if trip_id is None else str(trip_id)
+        signals = [s.strip() for s in signals if s and isinstance(s, str)]
+        vehicle_id = context["vehicle_id"]
+        summaries = self.store.summaries(vehicle_id, trip_id, signals)
+        missing = [name for name, s in summaries.items() if s is None]
+        if missing:
+            # Fetching stores the series, which builds their summaries
+            self.store.ensure(
+                vehicle_id,
+                trip_id,
+                missing,
+                fetch=lambda batch: self.fetch_upstream(vehicle_id, trip_id, batch),
+                batch_size=self.config["fetch_batch_size"],
+            )
+            summaries.update(self.store.summaries(vehicle_id, trip_id, missing))
+        self._note_read(trip_id, {name: s.count if s is not None else 0 for name, s in summaries.items()})
+        self.fetch_ms += (perf_counter() - started) * 1000
+        self._span(
+            "data_read",
+            started,
+            signals=len(signals),
+            bytes=sum(s.nbytes for s in summaries.values() if s is not None),
+            upstream_bytes=self.upstream_bytes - downloaded,
+            summaries=True,
+        )
+        rows = {name: s.describe() for name, s in summaries.items() if s is not None}
+        self.emit({"event": "data_fetched", "trip_id": trip_id, "signals": signals, "rows": len(rows)})
+        return pd.DataFrame.from_dict(rows, orient="index")
+
+    def signal_names(self, pattern: str = "*") -> List[str]:
+        """Catalog signal names matching a glob pattern, e.g. ``acu_cell*_temp``."""
+        import fnmatch
+        return [name for name in self.catalog.names if fnmatch.fnmatchcase(name, pattern)]
+
+    def run(self, code: CodeType, context: Dict[str, Any]) -> Dict[str, Any]:
+        """Execute one compiled script and collect its result and debug info."""
+        import json
+        import httpx
+        import pandas as pd
+
+        captured: Dict[str, Any] = {"__captured_result": None}
+        self.fetch_ms = 0.0
+        self.upstream_bytes = 0
+        self.spans = []
+        self.signals_read = {}
+        self.job_started = perf_counter()
+        _reset_peak_rss()
+
+        def set_result(value: Any) -> None:
+            captured["__captured_result"] = value
+
+        safe_globals = {
+            'pd': pd,
+            'json': json,
+            'httpx': httpx,
+            'print': print,
+            'set_result': set_result,
+            'http_get': self.http_get,
+            'build_url': lambda signals, trip_id=None, **hints: self.build_url(signals, context, trip_id, **hints),
+            'fetch_signals': lambda signals, trip_id=None, **kwargs: self.fetch_signals(signals, context, trip_id, **kwargs),
+            'signal_names': self.signal_names,
+            'signal_summaries': lambda signals, trip_id=None: self.signal_summaries(signals, context, trip_id),
+            'PARAMS': context.get("params", {}),
+        }
+        output = io.StringIO()
+        err_output = io.StringIO()
+        start_ts = perf_counter()
+        try:
+            with redirect_stdout(output), redirect_stderr(err_output):
+                exec(code, safe_globals)
+        except SystemExit:
+            pass
+        duration_ms = int((perf_counter() - start_ts) * 1000)
+        result = output.getvalue().strip()
+        stderr = err_output.getvalue().strip()
+        debug: Dict[str, Any] = {
+            "stdout_len": len(result),
+            "stderr_len": len(stderr),
+            "duration_ms": duration_ms,
+            "fetch_ms": round(self.fetch_ms, 2),
+            "upstream_bytes": self.upstream_bytes,
+            "peak_rss_bytes": _peak_rss_bytes(),
+            "signals_read": self.signals_read,
+            "worker_pid": os.getpid(),
+        }
+        if result:
+            return {"output": result, "debug": debug, "spans": self.spans}
+
+        # Fallback: try to read common result variables if nothing was printed
+        for var_name in ("result", "answer", "output"):
+            if safe_globals.get(var_name) is not None:
+                try:
+                    debug["fallback_var"] = var_name
+                    return {"output": str(safe_globals[var_name]), "debug": debug, "spans": self.spans}
+                except Exception:
+                    continue
+        # Fallback 2: captured result via set_result
+        if captured.get("__captured_result") is not None:
+            debug["fallback_var"] = "__captured_result"
+            return {"output": str(captured["__captured_result"]), "debug": debug, "spans": self.spans}
+
+        debug["reason"] = "no stdout and no fallback variable"
+        return {"output": "No output generated", "debug": debug, "spans": self.spans}
+
+
+def _worker_main(conn, config: Dict[str, Any], memory_limit_mb: int) -> None:
+    """Entry point of a worker process: warm up, then serve jobs until told to stop."""
+    # Ctrl+C is handled by the parent, which kills the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(level=logging.INFO)
+    _limit_memory(memory_limit_mb)
+
+    # Pre-warm: pay for the heavy imports once per worker, not per job
+    import numpy  # noqa: F401
+    import pandas  # noqa: F401
+
+    def _no_op(*args, **kwargs):
+        return None
+
+    # Scripts must not be able to exit the worker
+    builtins.exit = _no_op  # type: ignore
+    builtins.quit = _no_op  # type: ignore
+
+    runtime = ScriptRuntime(config)
+    runtime.emit = lambda event: conn.send(("event", event))
+    conn.send(("ready", os.getpid()))
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+        if message[0] == "stop":
+            break
+        _, code_bytes, context = message
+        try:
+            reply = ("ok", runtime.run(marshal.loads(code_bytes), context))
+        except MemoryError:
+            reply = ("error", "MemoryError", "Script exceeded the worker memory limit")
+        except BaseException as e:
+            reply = ("error", e.__class__.__name__, str(e))
+        try:
+            conn.send(reply)
+        except (OSError, ValueError):
+            break
+
+
+# ---------------------------------------------------------------------------
+# Parent process side
+# ---------------------------------------------------------------------------
+
+class ScriptExecutor:
+    """Awaitable pool of pre-warmed script worker processes."""
+
+    # Delay before retrying a failed respawn, doubled per failure up to the maximum
+    RESPAWN_BACKOFF_SECONDS = 1.0
+    RESPAWN_BACKOFF_MAX_SECONDS = 30.0
+
+    def __init__(
+        self,
+        size: int,
+        config: Dict[str, Any],
+        timeout: float,
+        memory_limit_mb: int = 0,
+        max_jobs_per_worker: int = 200,
+        start_timeout: float = 60.0,
+    ):
+        self.size = max(1, size)
+        self.config = config
+        self.timeout = timeout
+        self.memory_limit_mb = memory_limit_mb
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.start_timeout = start_timeout
+        self._ctx = mp.get_context("spawn")
+        self._idle: Optional[asyncio.Queue] = None
+        self._workers: List[_Worker] = []
+        self._start_lock: Optional[asyncio.Lock] = None
+        self._started = False
+        self._closing = False
+        self.completed = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.respawns = 0
+        self.respawn_failures = 0
+
+    async def start(self) -> None:
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            if self._started:
+                return
+            self._idle = asyncio.Queue()
+            self._closing = False
+            workers = await asyncio.gather(*(self._spawn() for _ in range(self.size)), return_exceptions=True)
+            for worker in workers:
+                if isinstance(worker, BaseException):
+                    logger.error(f"Script worker failed to start: {worker}")
+                    continue
+                self._idle.put_nowait(worker)
+            if self._idle.empty():
+                raise ScriptFailedError("No script workers could be started")
+            self._started = True
+            logger.info(f"Script executor started with {self._idle.qsize()} workers")
+
+    async def _spawn(self) -> _Worker:
+        parent_conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(child_conn, self.config, self.memory_limit_mb),
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        worker = _Worker(process=process, conn=parent_conn)
+        self._workers.append(worker)
+        loop = asyncio.get_running_loop()
+        ready = await loop.run_in_executor(None, parent_conn.poll, self.start_timeout)
+        if not ready:
+            await self._discard(worker)
+            raise ScriptFailedError("Script worker did not become ready in time")
+        try:
+            parent_conn.recv()
+        except (EOFError, OSError) as e:
+            await self._discard(worker)
+            raise ScriptFailedError(f"Script worker exited during startup: {e}")
+        return worker
+
+    async def _discard(self, worker: _Worker, pending: Optional[asyncio.Future] = None, grace: float = 0) -> None:
+        loop = asyncio.get_running_loop()
+        if grace > 0:
+            await loop.run_in_executor(None, worker.process.join, grace)
+        if worker.process.is_alive():
+            worker.process.kill()
+        if pending is not None:
+            # Let the thread polling the pipe observe EOF before closing it
+            try:
+                await asyncio.wait_for(asyncio.shield(pending), timeout=5)
+            except Exception:
+                pass
+        await loop.run_in_executor(None, worker.process.join, 5)
+        worker.conn.close()
+        if worker in self._workers:
+            self._workers.remove(worker)
+
+    async def _replace(self, worker: _Worker, pending: Optional[asyncio.Future] = None) -> None:
+        await self._discard(worker, pending)
+        if self._closing:
+            return
+        self.respawns += 1
+        delay = self.RESPAWN_BACKOFF_SECONDS
+        # Keep trying: a worker that is never replaced shrinks the pool for good
+        while not self._closing:
+            try:
+                replacement = await self._spawn()
+            except (ScriptFailedError, OSError) as e:
+                self.respawn_failures += 1
+                logger.error(f"Script worker respawn failed, retrying in {delay:g}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.RESPAWN_BACKOFF_MAX_SECONDS)
+                continue
+            if self._closing:
+                await self._discard(replacement)
+            else:
+                self._idle.put_nowait(replacement)
+            return
+
+    async def _next_idle(self, timeout: float) -> _Worker:
+        """The next free worker; raises ScriptFailedError if none is free within ``timeout``.
+
+        Unlike ``wait_for(queue.get())``, a worker dequeued just as the wait
+        times out or is cancelled goes back to the queue instead of being lost.
+        """
+        getter = asyncio.ensure_future(self._idle.get())
+        try:
+            await asyncio.wait({getter}, timeout=timeout)
+        except asyncio.CancelledError:
+            self._give_back(getter)
+            raise
+        if getter.done():
+            return getter.result()
+        self._give_back(getter)
+        raise ScriptFailedError(f"No script worker became free within {timeout:g}s ({len(self._workers)} running)")
+
+    def _give_back(self, getter: asyncio.Future) -> None:
+        if getter.cancel():
+            return  # still waiting: Queue.get leaves the item for the next getter
+        if not getter.cancelled() and getter.exception() is None:
+            self._idle.put_nowait(getter.result())
+
+    async def run(
+        self,
+        code: CodeType,
+        context: Dict[str, Any],
+        timeout: Optional[float] = None,
+        on_event: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ) -> ScriptRun:
+        """Run a compiled script on the next free worker.
+
+        Progress events sent by the worker (e.g. data fetched) are passed to
+        ``on_event``. Raises ScriptTimeoutError or ScriptFailedError (also when
+        no worker becomes free within the timeout); cancelling the awaiting task
+        kills the worker running the job.
+        """
+        if not self._started:
+            await self.start()
+        timeout = self.timeout if timeout is None else timeout
+        queued_at = perf_counter()
+        worker = await self._next_idle(timeout)
+        queue_wait_ms = int((perf_counter() - queued_at) * 1000)
+
+        loop = asyncio.get_running_loop()
+        started_at = perf_counter()
+        pending: Optional[asyncio.Future] = None
+        try:
+            worker.conn.send(("run", marshal.dumps(code), context))
+            deadline = started_at + timeout
+            while True:
+                pending = loop.run_in_executor(None, worker.conn.poll, max(0.0, deadline - perf_counter()))
+                ready = await asyncio.shield(pending)
+                if not ready:
+                    self.timeouts += 1
+                    asyncio.create_task(self._replace(worker, pending))
+                    raise ScriptTimeoutError("Script execution timed out")
+                reply = worker.conn.recv()
+                if reply[0] != "event":
+                    break
+                if on_event is not None:
+                    on_event(reply[1])
+        except asyncio.CancelledError:
+            asyncio.create_task(self._replace(worker, pending))
+            raise
+        except (EOFError, OSError) as e:
+            self.failures += 1
+            asyncio.create_task(self._replace(worker, pending))
+            raise ScriptFailedError(f"Script worker died: {e.__class__.__name__}")
+        run_ms = int((perf_counter() - started_at) * 1000)
+
+        worker.jobs += 1
+        if worker.jobs >= self.max_jobs_per_worker:
+            # Recycle long-lived workers so leaks in pandas/user code do not accumulate
+            asyncio.create_task(self._replace(worker))
+        else:
+            self._idle.put_nowait(worker)
+
+        if reply[0] == "error":
+            _, error_type, error_message = reply
+            self.failures += 1
+            raise ScriptFailedError(f"{error_type}: {error_message}")
+        self.completed += 1
+        payload = reply[1]
+        return ScriptRun(
+            output=payload["output"],
+            debug=payload["debug"],
+            queue_wait_ms=queue_wait_ms,
+            run_ms=run_ms,
+            spans=payload.get("spans", []),
+        )
+
+    async def shutdown(self) -> None:
+        self._closing = True
+        for worker in list(self._workers):
+            try:
+                worker.conn.send(("stop",))
+            except (OSError, ValueError):
+                pass
+        await asyncio.gather(*(self._discard(w, grace=2) for w in list(self._workers)), return_exceptions=True)
+        self._started = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": len(self._workers),
+            "idle": self._idle.qsize() if self._idle is not None else 0,
+            "completed": self.completed,
+            "timeouts": self.timeouts,
+            "failures": self.failures,
+            "respawns": self.respawns,
+            "respawn_failures": self.respawn_failures,
+        }
@@ -0,0 +1,170 @@
+"""Deterministic planner for simple single-signal aggregate questions.
+
+Questions like "max mobile_speed", "95th percentile of cell 12 temp on trip 5"
+or "top 10 mobile_speed values" are planned from their canonical form and
+answered from the signal's summary index when possible, else with vectorized
+NumPy over the cached series, skipping Gemini and the script workers. Anything
+the planner does not fully understand returns None and goes down the LLM path
+instead.
+"""
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from query_parser import CanonicalQuery
+from signal_store import SignalSeries
+from summary import SignalSummary
+
+SIMPLE_OPS = {"max", "min", "mean", "median", "stddev", "count", "range"}
+RANKING_OPS = {"top", "bottom"}
+# Answered exactly by the summary index; median/percentiles only approximately
+SUMMARY_OPS = {"max", "min", "mean", "stddev", "count", "range"}
+# Words that may accompany an aggregate without changing its meaning
+NEUTRAL_WORDS = {
+    "how", "many", "much", "number", "does", "did", "reach", "reached", "vehicle",
+    "car", "signal", "sensor", "whole", "entire", "recorded", "measured", "overall",
+    "th", "st", "nd", "rd", "p", "percentile", "trip", "<trip>", "<n>", "by", "with",
+}
+OP_LABELS = {
+    "max": "Max", "min": "Min", "mean": "Mean", "median": "Median",
+    "stddev": "Std dev", "count": "Sample count", "range": "Range",
+}
+DEFAULT_TOP_N = 10
+MAX_TOP_N = 100
+
+
+@dataclass
+class QueryPlan:
+    signal: str
+    trip_id: str
+    ops: List[str] = field(default_factory=list)
+    percentile: Optional[float] = None
+    top_n: Optional[int] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {k: v for k, v in asdict(self).items() if v not in (None, [])}
+
+
+def plan_query(canonical: CanonicalQuery, default_trip_id: str) -> Optional[QueryPlan]:
+    """Plan a single-signal aggregate, or return None if the query needs the LLM."""
+    if len(canonical.signals) != 1 or len(canonical.params.get("trip_ids", [])) > 1:
+        return None
+    signal_name = canonical.signals[0]
+    words = [w for w in canonical.key.split() if w != signal_name]
+    numbers = canonical.params.get("numbers", [])
+
+    ops: List[str] = []
+    for word in words:
+        if word in SIMPLE_OPS or word in RANKING_OPS:
+            if word not in ops:
+                ops.append(word)
+        elif word not in NEUTRAL_WORDS:
+            return None
+
+    plan = QueryPlan(
+        signal=signal_name,
+        trip_id=str(canonical.params["trip_ids"][0]) if canonical.params.get("trip_ids") else default_trip_id,
+    )
+    has_percentile = "percentile" in words or ("p" in words and numbers)
+    if has_percentile:
+        if len(numbers) != 1 or not 0 <= float(numbers[0]) <= 100 or any(op in RANKING_OPS for op in ops):
+            return None
+        plan.percentile = float(numbers[0])
+        plan.ops = [op for op in ops if op in SIMPLE_OPS]
+        return plan
+
+    ranking = [op for op in ops if op in RANKING_OPS]
+    if ranking:
+        if len(ranking) > 1 or len(ops) > 1 or len(numbers) > 1:
+            return None
+        plan.top_n = int(numbers[0]) if numbers else DEFAULT_TOP_N
+        if not 0 < plan.top_n <= MAX_TOP_N:
+            return None
+        plan.ops = ranking
+        return plan
+
+    if not ops or numbers:
+        return None
+    plan.ops = ops
+    return plan
+
+
+def _fmt(value: float) -> str:
+    if value != value:
+        return "n/a"
+    if float(value).is_integer() and abs(value) < 1e15:
+        return f"{int(value):,}"
+    return f"{value:,.3f}".rstrip("0").rstrip(".")
+
+
+def execute_plan(plan: QueryPlan, series: Optional[SignalSeries]) -> str:
+    """Compute the planned aggregates and format a single-line answer (None: no data)."""
+    where = f"{plan.signal} for trip {plan.trip_id}"
+    if series is None or len(series) == 0:
+        return f"No data found for {where}."
+    values = series.values.astype(np.float64, copy=False)
+
+    parts: List[str] = []
+    for op in plan.ops:
+        if op == "max":
+            parts.append(f"Max: {_fmt(values.max())}")
+        elif op == "min":
+            parts.append(f"Min: {_fmt(values.min())}")
+        elif op == "mean":
+            parts.append(f"Mean: {_fmt(values.mean())}")
+        elif op == "median":
+            parts.append(f"Median: {_fmt(np.median(values))}")
+        elif op == "stddev":
+            parts.append(f"Std dev: {_fmt(values.std(ddof=1) if values.size > 1 else 0.0)}")
+        elif op == "count":
+            parts.append(f"Sample count: {_fmt(values.size)}")
+        elif op == "range":
+            parts.append(f"Range: {_fmt(values.max() - values.min())}")
+        elif op in RANKING_OPS:
+            n = min(plan.top_n or DEFAULT_TOP_N, values.size)
+            if op == "top":
+                idx = np.argpartition(values, -n)[-n:]
+                ranked = values[idx][np.argsort(-values[idx], kind="stable")]
+            else:
+                idx = np.argpartition(values, n - 1)[:n]
+                ranked = values[idx][np.argsort(values[idx], kind="stable")]
+            parts.append(f"{'Top' if op == 'top' else 'Bottom'} {n}: " + ", ".join(_fmt(v) for v in ranked))
+    if plan.percentile is not None:
+        parts.append(f"P{_fmt(plan.percentile)}: {_fmt(np.percentile(values, plan.percentile))}")
+    return f"{where} — " + "; ".join(parts)
+
+
+def summary_supports(plan: QueryPlan, approx_quantiles: bool = False) -> bool:
+    """Whether the plan can be answered from a SignalSummary instead of the samples."""
+    quantile_ops = {"median"} if approx_quantiles else set()
+    if plan.percentile is not None and not approx_quantiles:
+        return False
+    return all(op in SUMMARY_OPS or op in quantile_ops for op in plan.ops)
+
+
+def execute_plan_from_summary(plan: QueryPlan, summary: SignalSummary) -> str:
+    """Format the planned aggregates from a precomputed summary (see ``summary_supports``)."""
+    where = f"{plan.signal} for trip {plan.trip_id}"
+    if summary.count == 0:
+        return f"No data found for {where}."
+
+    parts: List[str] = []
+    for op in plan.ops:
+        if op == "max":
+            parts.append(f"Max: {_fmt(summary.max)}")
+        elif op == "min":
+            parts.append(f"Min: {_fmt(summary.min)}")
+        elif op == "mean":
+            parts.append(f"Mean: {_fmt(summary.mean)}")
+        elif op == "median":
+            parts.append(f"Median (approx.): {_fmt(summary.quantile(0.5))}")
+        elif op == "stddev":
+            parts.append(f"Std dev: {_fmt(summary.stddev)}")
+        elif op == "count":
+            parts.append(f"Sample count: {_fmt(summary.count)}")
+        elif op == "range":
+            parts.append(f"Range: {_fmt(summary.max - summary.min)}")
+    if plan.percentile is not None:
+        parts.append(f"P{_fmt(plan.percentile)} (approx.): {_fmt(summary.quantile(plan.percentile / 100))}")
+    return f"{where} — " + "; ".join(parts)
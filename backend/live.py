@@ -0,0 +1,165 @@
+"""Tail-following ingestion for live trips.
+
+A ``TripFollower`` polls the vehicle API every ``interval_s`` for the signals
+of a live trip that are already in the signal store, asks only for samples
+after the latest one stored, and appends them with ``SignalStore.append``. Pyramids and summaries are extended
+incrementally, so a summary or bucketed query costs the same at minute 90 of a
+session as at minute 1, and while the follower's heartbeat is recent the store
+treats the trip as current instead of refetching it after the live TTL.
+
+Without a ``start`` hint every poll downloads the whole trip so far, so
+followers for an API that cannot filter by start poll at ``full_interval_s``
+instead.
+
+One process per host follows a given trip (a non-blocking file lock); the
+others keep trying each interval and take over if it goes away.
+"""
+import asyncio
+import logging
+import os
+from time import monotonic
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from metrics import LIVE_POLLS, LIVE_SAMPLES, span
+from signal_store import SignalStore, decode_signals_payload
+
+try:
+    import fcntl
+except ImportError:  # Windows: every process follows on its own
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# fetch(signals, trip_id, hints) -> decoded JSON payload of the vehicle API
+FetchSignals = Callable[[List[str], str, Dict[str, str]], Awaitable[Any]]
+
+
+def _iso_ms(ns: int) -> str:
+    return str(np.datetime_as_string(np.datetime64(ns, "ns"), unit="ms", timezone="UTC"))
+
+
+class TripFollower:
+    """Keep the cached signals of live trips current by appending only new samples."""
+
+    def __init__(
+        self,
+        store: SignalStore,
+        vehicle_id: str,
+        fetch: FetchSignals,
+        interval_s: float,
+        batch_size: int = 0,
+        push_start: bool = False,
+        full_interval_s: float = 60.0,
+    ):
+        self.store = store
+        self.vehicle_id = vehicle_id
+        self.fetch = fetch
+        self.interval_s = interval_s if push_start else max(interval_s, full_interval_s)
+        self.batch_size = batch_size
+        self.push_start = push_start  # the vehicle API filters by start itself
+        self._claims: Dict[str, Any] = {}
+        self.polls = 0
+        self.samples = 0
+        self.errors = 0
+        self.last_poll_ms: Dict[str, float] = {}
+
+    def _claim(self, trip_id: str) -> bool:
+        """Whether this process follows the trip (takes the host-wide follow lock if it is free)."""
+        if trip_id in self._claims:
+            return True
+        if fcntl is None:
+            self._claims[trip_id] = None
+            return True
+        path = os.path.join(self.store.trip_dir(self.vehicle_id, trip_id), ".follow.lock")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handle = open(path, "a+")
+        try:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            return False
+        self._claims[trip_id] = handle
+        return True
+
+    def release(self) -> None:
+        for handle in self._claims.values():
+            if handle is not None:
+                handle.close()  # closing drops the flock
+        self._claims.clear()
+
+    def _append(self, trip_id: str, payload: Any, signals: List[str]) -> int:
+        decoded = decode_signals_payload(payload, signals)
+        return sum(self.store.append(self.vehicle_id, trip_id, name, series) for name, series in decoded.items())
+
+    def _since(self, trip_id: str, signals: List[str]) -> Optional[int]:
+        """Latest timestamp every signal of the batch already has (None if one has no samples)."""
+        lasts = [self.store.last_timestamp(self.vehicle_id, trip_id, name) for name in signals]
+        return None if any(last is None for last in lasts) else min(lasts)
+
+    async def poll(self, trip_id: str) -> int:
+        """Append the new samples of every cached signal of the trip; returns how many."""
+        signals = await asyncio.to_thread(self.store.cached_signals, self.vehicle_id, trip_id)
+        appended = 0
+        step = self.batch_size if self.batch_size > 0 else max(1, len(signals))
+        with span("live_poll", trip_id=trip_id, signals=len(signals)) as poll_span:
+            for i in range(0, len(signals), step):
+                batch = signals[i:i + step]
+                # Same per-signal locks as regular fetches, so a full refetch never races an append
+                lock = self.store.fetch_lock(self.vehicle_id, trip_id, batch)
+                await asyncio.to_thread(lock.__enter__)
+                try:
+                    since = await asyncio.to_thread(self._since, trip_id, batch)
+                    hints = {"start": _iso_ms(since)} if self.push_start and since is not None else {}
+                    payload = await self.fetch(batch, trip_id, hints)
+                    appended += await asyncio.to_thread(self._append, trip_id, payload, batch)
+                finally:
+                    await asyncio.to_thread(lock.__exit__, None, None, None)
+            poll_span["samples"] = appended
+        # Heartbeat only after a successful poll: if the API goes away the trip falls back to the live TTL
+        await asyncio.to_thread(self.store.mark_followed, self.vehicle_id, trip_id)
+        return appended
+
+    async def run(self, trip_ids: Iterable[str]) -> None:
+        """Poll every trip each interval until cancelled."""
+        trip_ids = list(trip_ids)
+        if not self.push_start:
+            logger.warning(
+                f"Vehicle API does not filter by start: each live poll downloads whole trips, "
+                f"polling every {self.interval_s:g}s instead of tail-following"
+            )
+        try:
+            while True:
+                started = monotonic()
+                for trip_id in trip_ids:
+                    if not await asyncio.to_thread(self._claim, trip_id):
+                        continue
+                    try:
+                        samples = await self.poll(trip_id)
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        self.errors += 1
+                        LIVE_POLLS.inc(outcome="error")
+                        logger.warning(f"Live follow poll failed for trip {trip_id}: {e}")
+                        continue
+                    self.polls += 1
+                    self.samples += samples
+                    self.last_poll_ms[trip_id] = round((monotonic() - started) * 1000, 2)
+                    LIVE_POLLS.inc(outcome="ok")
+                    LIVE_SAMPLES.inc(samples)
+                await asyncio.sleep(max(0.0, self.interval_s - (monotonic() - started)))
+        finally:
+            self.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "interval_s": self.interval_s,
+            "following": sorted(self._claims),
+            "polls": self.polls,
+            "samples_appended": self.samples,
+            "errors": self.errors,
+            "push_start": self.push_start,
+            "last_poll_ms": dict(self.last_poll_ms),
+        }
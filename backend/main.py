@@ -1,21 +1,59 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 import httpx
-import pandas as pd
 import json
 import logging
-from typing import Dict, Any
-from time import time, sleep
-import signal
+from typing import Dict, Any, Callable, List, Optional
+from time import perf_counter
 import os
-from dotenv import load_dotenv
+import asyncio
+import contextvars
+import hashlib
 import re
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+from executor import ScriptExecutor, ScriptRun, ScriptTimeoutError
+from upstream import AsyncRateLimiter, create_http_client, json_loads, parse_retry_after, retry_delay
+from cache import LRUCache, SingleFlight, create_cache
+from signal_catalog import DEFAULT_CATALOG_PATH, SignalCatalog
+from query_parser import AGGREGATE_SYNONYMS, TRIP_WORDS, CanonicalQuery, canonicalize_query
+from signal_store import SignalSeries, SignalStore
+from live import TripFollower
+from fast_path import QueryPlan, execute_plan, execute_plan_from_summary, plan_query, summary_supports
+from downsample import DEFAULT_PYRAMID_LEVELS, parse_levels
+from script_analysis import SIGNAL_HELPERS, CompiledScript, ScriptAnalysis, compile_script, script_digest
+from metrics import (
+    GEMINI_ATTEMPTS, GEMINI_CALL_ATTEMPTS, DATA_READ_BYTES, QUERY_DURATION, QUERY_REQUESTS, REGISTRY,
+    RESULT_CACHE_LOOKUPS, SCRIPT_CACHE_LOOKUPS, SCRIPT_PEAK_MEMORY, SPECULATIVE_QUERIES, SPECULATIVE_SIGNALS, UPSTREAM_BYTES,
+    Trace, current_trace, span,
+)
 
 # Load environment variables
 load_dotenv()
 
-app = FastAPI(title="Vehicle Data Chatbot API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Pre-warm the script workers and open the shared upstream client before serving traffic
+    get_http_client()
+    await script_executor.start()
+    follow_task = None
+    if LIVE_TRIP_IDS and LIVE_FOLLOW_INTERVAL_SECONDS > 0:
+        follow_task = asyncio.ensure_future(trip_follower.run(LIVE_TRIP_IDS))
+    try:
+        yield
+    finally:
+        if follow_task is not None:
+            follow_task.cancel()
+            await asyncio.gather(follow_task, return_exceptions=True)
+        await script_executor.shutdown()
+        if _http_client is not None:
+            await _http_client.aclose()
+        _script_cache.save()
+        _result_cache.save()
+
+app = FastAPI(title="Vehicle Data Chatbot API", version="1.0.0", lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -33,6 +71,7 @@ logger = logging.getLogger(__name__)
 # Request/Response models
 class ChatRequest(BaseModel):
     message: str
+    trace: bool = False  # include per-stage timing spans in ChatResponse.data["trace"]
 
 class ChatResponse(BaseModel):
     success: bool
@@ -40,6 +79,10 @@ class ChatResponse(BaseModel):
     data: Dict[str, Any] = None
     error: str = None
 
+class BatchQueryRequest(BaseModel):
+    messages: List[str]
+    trace: bool = False
+
 class LogRequest(BaseModel):
     error: str
     timestamp: str
@@ -53,24 +96,195 @@ GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
 GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "2"))
 GEMINI_RETRY_BACKOFF = float(os.getenv("GEMINI_RETRY_BACKOFF", "1.0"))
 GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "60"))
+GEMINI_MAX_RETRY_AFTER = float(os.getenv("GEMINI_MAX_RETRY_AFTER", "30"))
+# Client-side quota: requests per minute (0 = unlimited), burst size and max in-flight calls
+GEMINI_RPM = float(os.getenv("GEMINI_RPM", "15"))
+GEMINI_BURST = int(os.getenv("GEMINI_BURST", "5"))
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "4"))
+
+# Shared upstream HTTP client pool
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "10"))
+_http_client: httpx.AsyncClient = None
+gemini_limiter = AsyncRateLimiter(GEMINI_RPM, GEMINI_BURST, GEMINI_MAX_CONCURRENCY)
 
 # Debug diagnostics toggle
 DEBUG_ANALYSIS = os.getenv("DEBUG_ANALYSIS", "false").lower() == "true"
 
 # Vehicle data API configuration
-VEHICLE_API_URL = "https://mapache.gauchoracing.com/api/query/signals"
-VEHICLE_API_TOKEN = "01b3939d-678f-44ac-93ff-0d54e09ba3d6"
+VEHICLE_API_URL = os.getenv("VEHICLE_API_URL", "https://mapache.gauchoracing.com/api/query/signals")
+VEHICLE_API_TOKEN = os.getenv("VEHICLE_API_TOKEN", "01b3939d-678f-44ac-93ff-0d54e09ba3d6")
 VEHICLE_ID = "gr24-main"
 TRIP_ID = "4"
 VEHICLE_DATA_TIMEOUT = float(os.getenv("VEHICLE_DATA_TIMEOUT", "30"))
 SCRIPT_TIMEOUT = int(os.getenv("SCRIPT_TIMEOUT", "20"))
 
-# Script generation cache (to reduce OpenRouter calls)
-SCRIPT_CACHE_TTL_SECONDS = 3600  # 1 hour
-_script_cache: Dict[str, Dict[str, Any]] = {}
+# Local signal cache (finished trips never change, so cached series never expire)
+SIGNAL_CACHE_DIR = os.getenv("SIGNAL_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".signal_cache"))
+SIGNAL_CACHE_MEMORY_MB = int(os.getenv("SIGNAL_CACHE_MEMORY_MB", "256"))
+LIVE_TRIP_IDS = [t.strip() for t in os.getenv("LIVE_TRIP_IDS", "").split(",") if t.strip()]
+LIVE_TRIP_CACHE_TTL = float(os.getenv("LIVE_TRIP_CACHE_TTL", "30"))
+# Seconds before a signal cached with no samples is fetched again (it may not be uploaded yet)
+SIGNAL_EMPTY_TTL_SECONDS = float(os.getenv("SIGNAL_EMPTY_TTL_SECONDS", "300"))
+
+# Multi-signal fetches: signals per upstream request, and default as-of join tolerance
+SIGNAL_CATALOG_PATH = os.getenv("SIGNAL_CATALOG_PATH", DEFAULT_CATALOG_PATH)
+SIGNAL_FETCH_BATCH_SIZE = int(os.getenv("SIGNAL_FETCH_BATCH_SIZE", "64"))
+SIGNAL_ALIGN_TOLERANCE_MS = float(os.getenv("SIGNAL_ALIGN_TOLERANCE_MS", "1000"))
+
+# Time-window / resolution hints: bucket widths kept per cached signal, and the hints
+# (start, end, resolution) the vehicle API accepts itself; anything else is applied locally
+SIGNAL_PYRAMID_LEVELS = parse_levels(os.getenv("SIGNAL_PYRAMID_LEVELS", DEFAULT_PYRAMID_LEVELS))
+VEHICLE_API_PUSHDOWN = [h.strip() for h in os.getenv("VEHICLE_API_PUSHDOWN", "").split(",") if h.strip() in ("start", "end", "resolution")]
+
+# API-process view of the signal cache (fast path); workers open their own over the same directory
+signal_store = SignalStore(
+    SIGNAL_CACHE_DIR,
+    memory_budget_bytes=SIGNAL_CACHE_MEMORY_MB * 1024 * 1024,
+    live_trip_ids=LIVE_TRIP_IDS,
+    live_ttl_seconds=LIVE_TRIP_CACHE_TTL,
+    pyramid_widths_ns=SIGNAL_PYRAMID_LEVELS,
+    empty_ttl_seconds=SIGNAL_EMPTY_TTL_SECONDS,
+)
+
+# Live trips: seconds between polls for new samples of their cached signals (0 disables
+# following, so live data is refetched in full once LIVE_TRIP_CACHE_TTL has passed)
+LIVE_FOLLOW_INTERVAL_SECONDS = float(os.getenv("LIVE_FOLLOW_INTERVAL_SECONDS", "2"))
+# Poll interval used instead when "start" is not in VEHICLE_API_PUSHDOWN (each poll is a full download)
+LIVE_FOLLOW_FULL_INTERVAL_SECONDS = float(os.getenv("LIVE_FOLLOW_FULL_INTERVAL_SECONDS", "60"))
+
+async def _fetch_new_samples(signals: List[str], trip_id: str, hints: Dict[str, str]) -> Any:
+    return await fetch_vehicle_data(",".join(signals), trip_id, hints)
+
+trip_follower = TripFollower(
+    signal_store,
+    VEHICLE_ID,
+    _fetch_new_samples,
+    LIVE_FOLLOW_INTERVAL_SECONDS,
+    batch_size=SIGNAL_FETCH_BATCH_SIZE,
+    push_start="start" in VEHICLE_API_PUSHDOWN,
+    full_interval_s=LIVE_FOLLOW_FULL_INTERVAL_SECONDS,
+)
+
+# Deterministic fast path for simple single-signal aggregates
+FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "true").lower() == "true"
+# Answer median/percentile questions from the summary index's quantile sketch (approximate)
+FAST_PATH_APPROX_QUANTILES = os.getenv("FAST_PATH_APPROX_QUANTILES", "false").lower() == "true"
+
+# Fetch the signals a cached script is known to read while it waits for a worker
+SCRIPT_PREFETCH_ENABLED = os.getenv("SCRIPT_PREFETCH_ENABLED", "true").lower() == "true"
+
+# Speculative prefetch: while Gemini writes a script, fetch the signals the message most likely refers to
+SPECULATIVE_PREFETCH_ENABLED = os.getenv("SPECULATIVE_PREFETCH_ENABLED", "true").lower() == "true"
+SPECULATIVE_PREFETCH_MAX_SIGNALS = int(os.getenv("SPECULATIVE_PREFETCH_MAX_SIGNALS", "8"))
+# Words that are no hint of a signal on their own ("max" in "max cell 12 temp")
+_SPECULATION_IGNORED_WORDS = set(AGGREGATE_SYNONYMS) | set(AGGREGATE_SYNONYMS.values()) | TRIP_WORDS | {"max", "min", "median", "range"}
+
+# /query/batch: most questions per request, and how many are answered at once
+QUERY_BATCH_MAX_MESSAGES = int(os.getenv("QUERY_BATCH_MAX_MESSAGES", "100"))
+QUERY_BATCH_CONCURRENCY = int(os.getenv("QUERY_BATCH_CONCURRENCY", "8"))
+# Signals per trip the current /query/batch request already prefetched for all of its questions
+batch_prefetched: contextvars.ContextVar[Optional[Dict[str, List[str]]]] = contextvars.ContextVar("batch_prefetched", default=None)
+
+# Seconds between keep-alive events on /query/stream while a stage is running
+STREAM_HEARTBEAT_SECONDS = float(os.getenv("STREAM_HEARTBEAT_SECONDS", "5"))
+
+# Progress events ({"event": <stage>, ...}) emitted while a query is processed
+EventSink = Callable[[Dict[str, Any]], None]
+
+def _ignore_event(event: Dict[str, Any]) -> None:
+    return None
+
+# Script worker pool (generated scripts never run on the event loop)
+SCRIPT_WORKERS = int(os.getenv("SCRIPT_WORKERS", str(min(4, os.cpu_count() or 1))))
+SCRIPT_MEMORY_LIMIT_MB = int(os.getenv("SCRIPT_MEMORY_LIMIT_MB", "2048"))
+SCRIPT_WORKER_MAX_JOBS = int(os.getenv("SCRIPT_WORKER_MAX_JOBS", "200"))
+
+script_executor = ScriptExecutor(
+    SCRIPT_WORKERS,
+    config={
+        "api_url": VEHICLE_API_URL,
+        "api_token": VEHICLE_API_TOKEN,
+        "data_timeout": VEHICLE_DATA_TIMEOUT,
+        "cache_dir": SIGNAL_CACHE_DIR,
+        "cache_memory_bytes": SIGNAL_CACHE_MEMORY_MB * 1024 * 1024,
+        "live_trip_ids": LIVE_TRIP_IDS,
+        "live_ttl_seconds": LIVE_TRIP_CACHE_TTL,
+        "empty_ttl_seconds": SIGNAL_EMPTY_TTL_SECONDS,
+        "catalog_path": SIGNAL_CATALOG_PATH,
+        "fetch_batch_size": SIGNAL_FETCH_BATCH_SIZE,
+        "align_tolerance_ms": SIGNAL_ALIGN_TOLERANCE_MS,
+        "pyramid_widths_ns": SIGNAL_PYRAMID_LEVELS,
+        "pushdown": VEHICLE_API_PUSHDOWN,
+    },
+    timeout=SCRIPT_TIMEOUT,
+    memory_limit_mb=SCRIPT_MEMORY_LIMIT_MB,
+    max_jobs_per_worker=SCRIPT_WORKER_MAX_JOBS,
+)
+
+# Script generation cache (to reduce Gemini calls), keyed on the canonical query template
+SCRIPT_CACHE_TTL_SECONDS = float(os.getenv("SCRIPT_CACHE_TTL_SECONDS", "3600"))  # 1 hour
+SCRIPT_CACHE_MAX_ENTRIES = int(os.getenv("SCRIPT_CACHE_MAX_ENTRIES", "1000"))
+SCRIPT_CACHE_PATH = os.getenv("SCRIPT_CACHE_PATH") or None  # e.g. .cache/scripts.json
+
+# Cache backend: "memory" (per API process) or "sqlite" (one WAL database shared by every
+# API worker on the host, e.g. with `uvicorn main:app --workers N`). Signal data is always
+# shared through SIGNAL_CACHE_DIR.
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory").lower()
+CACHE_SQLITE_PATH = os.getenv("CACHE_SQLITE_PATH", os.path.join(SIGNAL_CACHE_DIR, "cache.sqlite3"))
+
+signal_catalog = SignalCatalog.load(SIGNAL_CATALOG_PATH)
+_script_cache = create_cache(
+    CACHE_BACKEND,
+    "scripts",
+    SCRIPT_CACHE_MAX_ENTRIES,
+    ttl_seconds=SCRIPT_CACHE_TTL_SECONDS,
+    persist_path=SCRIPT_CACHE_PATH,
+    sqlite_path=CACHE_SQLITE_PATH,
+)
+# Sanitized source, code object and static analysis per distinct script text (in-process only)
+_compiled_scripts = LRUCache(SCRIPT_CACHE_MAX_ENTRIES)
+
+# Results of generated scripts, keyed by (script hash, vehicle, trips, parameters, data version).
+# Finished trips never change; results that read live trips also expire after LIVE_TRIP_CACHE_TTL,
+# and runs that did not finish cleanly (see is_clean_run) after RESULT_CACHE_FAILURE_TTL_SECONDS.
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "true").lower() == "true"
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "5000"))
+RESULT_CACHE_TTL_SECONDS = float(os.getenv("RESULT_CACHE_TTL_SECONDS", "86400"))
+RESULT_CACHE_FAILURE_TTL_SECONDS = float(os.getenv("RESULT_CACHE_FAILURE_TTL_SECONDS", "30"))  # 0 = never store
+# Output of a script that caught its own exception and printed it
+_ERROR_OUTPUT = re.compile(r"^\s*(error|exception|failed|traceback)\b", re.IGNORECASE)
+_result_cache = create_cache(
+    CACHE_BACKEND,
+    "results",
+    RESULT_CACHE_MAX_ENTRIES,
+    ttl_seconds=RESULT_CACHE_TTL_SECONDS,
+    sqlite_path=CACHE_SQLITE_PATH,
+)
+
+# Single-flight coalescing: identical concurrent work shares one awaitable
+_generation_flights = SingleFlight("script_generation")
+_fetch_flights = SingleFlight("vehicle_fetch")
+_result_flights = SingleFlight("query_result")
+
+def get_http_client() -> httpx.AsyncClient:
+    """Shared pooled client for Gemini and the vehicle API (created in the lifespan)"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = create_http_client(HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE, GEMINI_TIMEOUT)
+    return _http_client
 
 async def call_gemini(prompt: str) -> str:
-    """Call Gemini API to generate content"""
+    """Call Gemini API to generate content, timed as the "gemini" stage with its attempt count"""
+    attempts = [0]
+    with span("gemini", prompt_chars=len(prompt)) as gemini_span:
+        try:
+            return await _request_gemini(prompt, attempts)
+        finally:
+            gemini_span["attempts"] = attempts[0]
+            GEMINI_CALL_ATTEMPTS.observe(attempts[0])
+
+async def _request_gemini(prompt: str, attempts: list) -> str:
     if not GEMINI_API_KEY:
         raise HTTPException(status_code=500, detail="Gemini API key not configured")
 
@@ -85,87 +299,130 @@ async def call_gemini(prompt: str) -> str:
         ]
     }
 
-    async with httpx.AsyncClient() as client:
-        attempt = 0
-        while True:
-            try:
+    client = get_http_client()
+    attempt = 0
+    while True:
+        try:
+            # Queue behind the limiter rather than exceeding the Gemini quota
+            async with gemini_limiter:
                 logger.info(f"Gemini request model={GEMINI_MODEL} prompt_len={len(prompt)} attempt={attempt}")
+                attempts[0] += 1
                 response = await client.post(url, params=params, json=payload, timeout=GEMINI_TIMEOUT)
-                if response.status_code == 429:
-                    retry_after = response.headers.get("Retry-After", "60")
-                    logger.warning(f"Gemini rate limited. Retry-After: {retry_after}")
-                    raise HTTPException(status_code=429, detail="Rate limited by AI service", headers={"Retry-After": retry_after})
-
-                if response.status_code == 404:
-                    # Likely invalid model or wrong base URL version
-                    raise HTTPException(status_code=404, detail=f"Gemini model not found or unavailable: {GEMINI_MODEL}")
-
-                # Retry on transient 5xx
-                if 500 <= response.status_code < 600 and attempt < GEMINI_MAX_RETRIES:
-                    backoff = GEMINI_RETRY_BACKOFF * (2 ** attempt)
-                    logger.warning(f"Gemini 5xx {response.status_code}, retrying in {backoff:.1f}s")
-                    sleep(backoff)
+            GEMINI_ATTEMPTS.inc(outcome=str(response.status_code) if response.status_code < 500 else "5xx")
+            if response.status_code == 429:
+                # Gemini usually omits Retry-After: then back off exponentially; only an
+                # explicit wait longer than GEMINI_MAX_RETRY_AFTER is passed on to the caller
+                retry_after = response.headers.get("Retry-After")
+                delay = retry_delay(attempt, GEMINI_RETRY_BACKOFF, retry_after, cap=GEMINI_MAX_RETRY_AFTER)
+                if attempt < GEMINI_MAX_RETRIES and (parse_retry_after(retry_after) or 0) <= GEMINI_MAX_RETRY_AFTER:
+                    logger.warning(f"Gemini rate limited, holding queue for {delay:.1f}s (Retry-After: {retry_after})")
+                    gemini_limiter.pause(delay)
+                    await asyncio.sleep(delay)
                     attempt += 1
                     continue
+                logger.warning(f"Gemini rate limited. Retry-After: {retry_after}")
+                raise HTTPException(
+                    status_code=429,
+                    detail="Rate limited by AI service",
+                    headers={"Retry-After": retry_after} if retry_after else None,
+                )
 
-                response.raise_for_status()
-                data = response.json()
-                # Extract text from candidates
-                candidates = data.get("candidates", [])
-                if not candidates:
-                    raise HTTPException(status_code=500, detail="No candidates returned by Gemini")
-                parts = candidates[0].get("content", {}).get("parts", [])
-                text = "".join(part.get("text", "") for part in parts)
-                logger.info(f"Gemini response chars={len(text)}")
-                return text
-            except httpx.HTTPStatusError as e:
-                status = e.response.status_code if e.response else 500
-                if status == 429:
-                    retry_after = e.response.headers.get("Retry-After", "60") if e.response else "60"
-                    raise HTTPException(status_code=429, detail="Rate limited by AI service", headers={"Retry-After": retry_after})
-                if status == 404:
-                    raise HTTPException(status_code=404, detail=f"Gemini model not found or unavailable: {GEMINI_MODEL}")
-                if 500 <= status < 600 and attempt < GEMINI_MAX_RETRIES:
-                    backoff = GEMINI_RETRY_BACKOFF * (2 ** attempt)
-                    logger.warning(f"Gemini HTTP error {status}, retrying in {backoff:.1f}s")
-                    sleep(backoff)
-                    attempt += 1
-                    continue
+            if response.status_code == 404:
+                # Likely invalid model or wrong base URL version
+                raise HTTPException(status_code=404, detail=f"Gemini model not found or unavailable: {GEMINI_MODEL}")
+
+            # Retry on transient 5xx
+            if 500 <= response.status_code < 600 and attempt < GEMINI_MAX_RETRIES:
+                backoff = retry_delay(attempt, GEMINI_RETRY_BACKOFF, response.headers.get("Retry-After"), cap=GEMINI_MAX_RETRY_AFTER)
+                logger.warning(f"Gemini 5xx {response.status_code}, retrying in {backoff:.1f}s")
+                await asyncio.sleep(backoff)
+                attempt += 1
+                continue
+
+            response.raise_for_status()
+            data = response.json()
+            # Extract text from candidates
+            candidates = data.get("candidates", [])
+            if not candidates:
+                raise HTTPException(status_code=500, detail="No candidates returned by Gemini")
+            parts = candidates[0].get("content", {}).get("parts", [])
+            text = "".join(part.get("text", "") for part in parts)
+            logger.info(f"Gemini response chars={len(text)}")
+            return text
+        except HTTPException:
+            raise
+        except httpx.HTTPStatusError as e:
+            status = e.response.status_code if e.response else 500
+            body_preview = ""
+            try:
+                body_preview = (e.response.text or "")[:500]
+            except Exception:
                 body_preview = ""
-                try:
-                    body_preview = (e.response.text or "")[:500]
-                except Exception:
-                    body_preview = ""
-                logger.error(f"Gemini HTTP error: {e} body={body_preview}")
-                detail = f"AI service error: {str(e)}"
-                if body_preview:
-                    detail += f" | body: {body_preview}"
-                raise HTTPException(status_code=status, detail=detail)
-            except httpx.RequestError as e:
-                if attempt < GEMINI_MAX_RETRIES:
-                    backoff = GEMINI_RETRY_BACKOFF * (2 ** attempt)
-                    logger.warning(f"Gemini request error {e.__class__.__name__}, retrying in {backoff:.1f}s")
-                    sleep(backoff)
-                    attempt += 1
-                    continue
-                logger.error(f"Gemini request error: {repr(e)}")
-                raise HTTPException(status_code=503, detail=f"AI service network error: {e.__class__.__name__}: {str(e)}")
-            except Exception as e:
-                logger.error(f"Gemini API error: {e}")
-                raise HTTPException(status_code=500, detail=f"AI service error: {str(e)}")
+            logger.error(f"Gemini HTTP error: {e} body={body_preview}")
+            detail = f"AI service error: {str(e)}"
+            if body_preview:
+                detail += f" | body: {body_preview}"
+            raise HTTPException(status_code=status, detail=detail)
+        except httpx.RequestError as e:
+            GEMINI_ATTEMPTS.inc(outcome="network_error")
+            if attempt < GEMINI_MAX_RETRIES:
+                backoff = retry_delay(attempt, GEMINI_RETRY_BACKOFF)
+                logger.warning(f"Gemini request error {e.__class__.__name__}, retrying in {backoff:.1f}s")
+                await asyncio.sleep(backoff)
+                attempt += 1
+                continue
+            logger.error(f"Gemini request error: {repr(e)}")
+            raise HTTPException(status_code=503, detail=f"AI service network error: {e.__class__.__name__}: {str(e)}")
+        except Exception as e:
+            logger.error(f"Gemini API error: {e}")
+            raise HTTPException(status_code=500, detail=f"AI service error: {str(e)}")
 
-async def fetch_vehicle_data(signals: str = "mobile_speed") -> Dict[str, Any]:
-    """Deprecated direct fetch; retained for reference. The analysis script now fetches the data itself."""
+async def fetch_vehicle_data(
+    signals: str = "mobile_speed", trip_id: str = TRIP_ID, hints: Optional[Dict[str, str]] = None
+) -> Dict[str, Any]:
+    """Fetch raw signal JSON over the shared client (generated scripts fetch through their own helper)."""
     params = {
         "vehicle_id": VEHICLE_ID,
-        "trip_id": TRIP_ID,
+        "trip_id": trip_id,
         "signals": signals,
-        "token": VEHICLE_API_TOKEN
+        "token": VEHICLE_API_TOKEN,
+        **(hints or {}),
     }
-    async with httpx.AsyncClient() as client:
-        response = await client.get(VEHICLE_API_URL, params=params, timeout=30.0)
+    with span("vehicle_fetch", signals=signals.count(",") + 1) as fetch_span:
+        response = await get_http_client().get(VEHICLE_API_URL, params=params, timeout=VEHICLE_DATA_TIMEOUT)
         response.raise_for_status()
-        return response.json()
+        fetch_span["bytes"] = len(response.content)
+    UPSTREAM_BYTES.inc(len(response.content), caller="api")
+    return json_loads(response.content)
+
+async def ensure_signals(trip_id: str, signals: list[str]) -> int:
+    """Make sure the signal store holds every signal, fetching the missing ones; returns how many were missing"""
+    missing = await asyncio.to_thread(signal_store.missing, VEHICLE_ID, trip_id, signals)
+    if missing:
+        async def fetch(keys: list) -> None:
+            names = [name for _, _, name in keys]
+            # Same per-signal file locks as the script workers, so a signal is downloaded once across processes
+            lock = signal_store.fetch_lock(VEHICLE_ID, trip_id, names)
+            await asyncio.to_thread(lock.__enter__)
+            try:
+                names = await asyncio.to_thread(signal_store.missing, VEHICLE_ID, trip_id, names)
+                step = SIGNAL_FETCH_BATCH_SIZE if SIGNAL_FETCH_BATCH_SIZE > 0 else max(1, len(names))
+                for i in range(0, len(names), step):
+                    payload = await fetch_vehicle_data(",".join(names[i:i + step]), trip_id)
+                    await asyncio.to_thread(signal_store.ingest, VEHICLE_ID, trip_id, payload, names[i:i + step])
+            finally:
+                await asyncio.to_thread(lock.__exit__, None, None, None)
+
+        # Signals already being fetched by another request are awaited, not re-fetched
+        await _fetch_flights.do_batch([(VEHICLE_ID, trip_id, name) for name in missing], fetch)
+    return len(missing)
+
+async def load_signal_series(trip_id: str, signals: list[str]) -> Dict[str, Optional[SignalSeries]]:
+    """Read series from the signal store, fetching any missing ones first (None for a signal
+    the store did not keep, e.g. when the vehicle API returned an error for the trip)"""
+    await ensure_signals(trip_id, signals)
+    series = await asyncio.gather(*(asyncio.to_thread(signal_store.get, VEHICLE_ID, trip_id, name) for name in signals))
+    return dict(zip(signals, series))
 
 def is_vehicle_data_query(message: str) -> bool:
     """Simple keyword-based detection for vehicle data queries"""
@@ -178,17 +435,21 @@ def is_vehicle_data_query(message: str) -> bool:
     message_lower = message.lower()
     return any(keyword in message_lower for keyword in vehicle_keywords)
 
-async def generate_pandas_script(query: str) -> str:
+async def generate_pandas_script(query: str, params: Dict[str, Any] = None) -> str:
     """Generate a Pandas script to process vehicle data.
     The generated script MUST fetch the JSON from the vehicle API itself using httpx (or requests),
     parse into pandas, compute the requested metric, and print a concise result.
+    Trip ids and numbers from the query are passed in `params` and exposed to the script as PARAMS,
+    so the script can be cached as a template and reused for other values.
     """
+    params = params or {"trip_ids": [], "numbers": []}
     prompt = f"""
 You are a data analysis expert. Generate a Python script that:
 
 1. Infers the relevant signal names from the user request (e.g., mobile_speed, acu_cellX_temp, acu_cellY_voltage, etc.).
    Build the signals parameter as a comma-separated list (no spaces).
-   Use the provided helper `build_url(signals: list[str])` to construct the URL.
+   Use the provided helper `build_url(signals: list[str], trip_id=None)` to construct the URL.
+   It targets PARAMS["trip_ids"][0] (or the default trip) unless `trip_id` is given.
    Then use `http_get(url)` to fetch the JSON.
 2. Loads the JSON into a pandas DataFrame (extract the relevant arrays/fields as needed)
 3. Computes the metric requested by the user query below
@@ -201,6 +462,7 @@ Support advanced queries like:
 - "compare average mobile_speed between trip 4 and trip 5"
 - "min/median/max of mobile_speed"
  - "correlation between temperature and voltage signals"
+ - "hottest cell over the trip"
 
 Make your script resilient and efficient.
 
@@ -208,7 +470,32 @@ Requirements:
 - Use: import pandas as pd
 - Use the provided helper: http_get(url) instead of calling httpx directly (this logs the URL and returns a Response for .json()).
 - Make the HTTP GET within the script to fetch the JSON data.
-- Do not use any external variables; construct the URL with params inside the script.
+- Do not use any external variables other than the provided helpers and PARAMS; construct the URL with build_url inside the script.
+- A dict `PARAMS` is available at runtime. For this query it is: {json.dumps(params)}
+  "trip_ids" are the trips mentioned in the query, "numbers" are the other numbers in the order they appear.
+  Never hard-code these values: read them from PARAMS (e.g. `n = int(PARAMS["numbers"][0])`,
+  `build_url(signals, trip_id=PARAMS["trip_ids"][1])`), because the script is reused for other values.
+- `http_get` on a `build_url` URL returns JSON shaped like
+  {{"data": [{{"produced_at": "2024-05-04T18:21:07.120Z", "mobile_speed": 12.5}}, ...]}}
+  (one row per timestamp; a signal key is omitted from rows where it has no sample).
+- Only fetch what the question needs: `build_url` also takes `start=`, `end=` (ISO timestamps or epoch
+  seconds), `last=` (a duration counted back from the end of the data, e.g. "5min") and `resolution=`
+  (a bucket width such as "10s" or "1min"). For "in the last 5 minutes" use `last="5min"`; for trends,
+  charts or min/max/mean/count over a long trip use a resolution instead of raw samples. With a
+  resolution each row is one bucket: "produced_at" is the bucket start, <signal> is the bucket mean,
+  and <signal>_min, <signal>_max, <signal>_count hold the other aggregates (weight means by _count).
+- For queries that need several signals (comparisons, correlations, pack-wide questions such as
+  "hottest cell"), prefer `fetch_signals(signals, trip_id=None, tolerance=None, direction="backward")`.
+  It fetches all signals in batched requests and returns ONE pandas DataFrame indexed by produced_at
+  (UTC) with one float32 column per signal, already aligned with an as-of join (tolerance in seconds
+  or a pandas Timedelta string like "500ms"; unmatched samples are NaN). Do not re-align its output.
+  `signal_names(pattern)` returns catalog signal names matching a glob, e.g. signal_names("acu_cell*_temp").
+  It accepts the same start/end/last/resolution keywords; with a resolution, `agg="mean"|"min"|"max"|"sum"|"count"`
+  picks the per-bucket value.
+- For whole-trip statistics of one or many signals (max/min/mean/stddev/count, "which cell is hottest"),
+  use `signal_summaries(signals, trip_id=None)`: a DataFrame indexed by signal name with columns
+  count, min, max, mean, stddev, first, last (ISO timestamps) and p50, p95, p99 (approximate),
+  read from a precomputed index without loading samples.
 - Parse the JSON robustly. Possible shapes include:
   * {{"signals": {{"mobile_speed": [...]}}}}
   * {{"data": {{"mobile_speed": [...]}}}}
@@ -217,7 +504,7 @@ Requirements:
   * A list of dicts containing fields like "mobile_speed", "value" or similar.
   Try these paths in order and handle missing keys gracefully. Flatten into a numeric series.
 - Clean the series: coerce to numeric, drop nulls, then compute the metric requested by the user query (e.g., average/mean, min, max, median).
- - For correlation tasks, align signals on produced_at timestamps when applicable; compute Pearson correlation.
+ - For correlation tasks, use fetch_signals (already aligned on produced_at); compute Pearson correlation.
 - At the end, set a variable named `result` to the final one-line string AND call both `print(result)` and `set_result(result)` (available at runtime).
 - Do not include explanations or markdown. Output ONLY executable Python code.
 """
@@ -227,133 +514,329 @@ Requirements:
         logger.info(f"Generated script length={len(script)} for query='{query[:60]}'...")
     return script
 
-async def execute_pandas_script(script: str) -> tuple[str, Dict[str, Any]]:
-    """Execute the generated Pandas script safely"""
-    def sanitize_generated_code(raw: str) -> str:
-        # Extract code from triple backtick fences if present, drop language tag
-        matches = re.findall(r"```(?:[\w+-]*)?\n([\s\S]*?)```", raw)
-        if matches:
-            code = "\n\n".join(matches)
-        else:
-            code = raw
-        # Remove any stray triple backticks and leading 'python' markers
-        code = code.replace("```", "")
-        code = re.sub(r"^\s*python\n", "", code, flags=re.IGNORECASE)
-        return code.strip()
+def query_trip_id(params: Dict[str, Any]) -> str:
+    """The trip a query is about: the first trip it mentions, or the default trip"""
+    return str(params["trip_ids"][0]) if params.get("trip_ids") else TRIP_ID
+
+def get_compiled_script(script: str) -> tuple[CompiledScript, bool]:
+    """Sanitized, compiled and analysed form of a generated script, cached by its text (raises SyntaxError)"""
+    digest = script_digest(script)
+    compiled = _compiled_scripts.get(digest)
+    if compiled is not None:
+        return compiled, True
+    compiled = compile_script(script, signal_catalog, digest)
+    _compiled_scripts.set(digest, compiled)
+    return compiled, False
+
+def fetch_in_background(stage: str, by_trip: Dict[str, List[str]]) -> None:
+    """Fetch signals per trip into the store without waiting, timed as `stage`.
+
+    Not tied to the query that started it: fetched data stays useful even if
+    the client goes away, and a failure is not fatal because whoever needs the
+    data fetches what is still missing itself.
+    """
+    async def fetch() -> None:
+        with span(stage, signals=sum(len(names) for names in by_trip.values())) as fetch_span:
+            counts = await asyncio.gather(*(ensure_signals(trip_id, names) for trip_id, names in by_trip.items()))
+            fetch_span["fetched"] = sum(counts)
+
+    def done(task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Background signal fetch ({stage}) failed: {task.exception()}")
+
+    asyncio.ensure_future(fetch()).add_done_callback(done)
+
+def result_cache_key(compiled: CompiledScript, context: Dict[str, Any]) -> tuple[str, bool]:
+    """Result cache key of one script run, and whether the run reads live-trip data"""
+    analysis = compiled.analysis
+    trips = {context["trip_id"], *(str(t) for t in context["params"].get("trip_ids", []))}
+    if analysis.complete and analysis.trip_reusable:
+        live_trips = sorted(trips & set(LIVE_TRIP_IDS))
+    else:
+        # The script may read trips it does not show statically: any live trip counts
+        live_trips = sorted(LIVE_TRIP_IDS)
+    versions = {trip_id: signal_store.data_version(VEHICLE_ID, trip_id) for trip_id in live_trips}
+    raw = json.dumps([compiled.digest, context, versions], sort_keys=True)
+    return hashlib.sha256(raw.encode()).hexdigest(), bool(live_trips)
 
+def is_clean_run(run: ScriptRun, analysis: ScriptAnalysis) -> bool:
+    """Whether a run produced a real answer: output, nothing on stderr, no error message,
+    and (for a script that reads vehicle data) at least one signal read, none of them empty.
+    An empty signal may just not be uploaded yet, and the store refetches it after
+    SIGNAL_EMPTY_TTL_SECONDS, so an answer built on it must not outlive that."""
+    if "reason" in run.debug or run.debug.get("stderr_len") or _ERROR_OUTPUT.match(run.output):
+        return False
+    reads_data = any(helper in SIGNAL_HELPERS or helper == "http_get" for helper in analysis.helpers)
+    rows = [count for names in run.debug.get("signals_read", {}).values() for count in names.values()]
+    return not reads_data or (bool(rows) and all(rows))
+
+def cached_result(key: str, live: bool) -> Optional[tuple[Dict[str, Any], float]]:
+    """A stored result and its age, unless it read live data that has since gone stale
+    or is a failed run older than RESULT_CACHE_FAILURE_TTL_SECONDS"""
+    with span("result_cache_lookup") as lookup:
+        entry = _result_cache.get_with_age(key)
+        if entry is not None:
+            result, age = entry
+            if (live and age >= LIVE_TRIP_CACHE_TTL) or (
+                not result.get("clean", True) and age >= RESULT_CACHE_FAILURE_TTL_SECONDS
+            ):
+                entry = None
+        lookup["hit"] = entry is not None
+    RESULT_CACHE_LOOKUPS.inc(result="hit" if entry is not None else "miss")
+    return entry
+
+def prefetch_script_signals(analysis: ScriptAnalysis, context: Dict[str, Any]) -> Dict[str, Any]:
+    """Start fetching the signals a script reads, so the fetch overlaps the worker queue
+    and script start-up; the worker then finds them in the store."""
+    # Reads with hints the vehicle API applies itself are left to the worker: it fetches only the window
+    by_trip = analysis.signals_by_trip(context, skip_hints=tuple(VEHICLE_API_PUSHDOWN))
+    if not SCRIPT_PREFETCH_ENABLED or not by_trip:
+        return {"signals": 0}
+    fetch_in_background("prefetch", by_trip)
+    return {"signals": sum(len(names) for names in by_trip.values()), "trips": sorted(by_trip)}
+
+async def execute_pandas_script(
+    script: str,
+    params: Dict[str, Any] = None,
+    emit: EventSink = _ignore_event,
+) -> tuple[str, Dict[str, Any]]:
+    """Execute the generated Pandas script on the worker pool"""
     try:
-        sanitized = sanitize_generated_code(script)
-        # Create a safe execution environment
-        captured: Dict[str, Any] = {"__captured_result": None}
-        def set_result(value: Any) -> None:
-            try:
-                captured["__captured_result"] = value
-            except Exception:
-                captured["__captured_result"] = None
-
-        def http_get(url: str):
-            logger.info(f"AI script HTTP GET: {url}")
-            resp = httpx.get(url, timeout=VEHICLE_DATA_TIMEOUT)
-            return resp
-
-        def build_url(signals: list[str]):
-            # Construct signals query (comma-separated, no spaces)
-            sig_param = ",".join(s.strip() for s in signals if s and isinstance(s, str))
-            base = (
-                f"{VEHICLE_API_URL}?vehicle_id={VEHICLE_ID}&trip_id={TRIP_ID}"
-                f"&signals={sig_param}&token={VEHICLE_API_TOKEN}"
-            )
-            logger.info(f"AI script build_url: {base}")
-            return base
-
-        safe_globals = {
-            'pd': pd,
-            'json': json,
-            'httpx': httpx,
-            'print': print,
-            'set_result': set_result,
-            'http_get': http_get,
-            'build_url': build_url,
+        params = params or {"trip_ids": [], "numbers": []}
+        with span("compile") as compile_span:
+            # Compile first to surface SyntaxError clearly; repeat scripts come from the cache
+            compiled, compiled_hit = get_compiled_script(script)
+            compile_span["cached"] = compiled_hit
+        context = {
+            "vehicle_id": VEHICLE_ID,
+            "trip_id": query_trip_id(params),
+            "params": params,
         }
-        
-        # Capture the output
-        import io
-        import sys
-        from contextlib import redirect_stdout, redirect_stderr
-        
-        output = io.StringIO()
-        err_output = io.StringIO()
-        # Compile first to surface SyntaxError clearly
-        code_object = compile(sanitized, '<generated>', 'exec')
-        start_ts = time()
-        # Temporarily disable built-in exit/quit to prevent SystemExit from scripts
-        import builtins as _bi
-        def _no_op(*args, **kwargs):
-            return None
-        old_exit = getattr(_bi, 'exit', None)
-        old_quit = getattr(_bi, 'quit', None)
-        _bi.exit = _no_op  # type: ignore
-        _bi.quit = _no_op  # type: ignore
-        # Setup a hard timeout using SIGALRM (Unix-only)
-        def _on_timeout(signum, frame):  # type: ignore[no-redef]
-            raise TimeoutError("Script execution timed out")
-        old_handler = signal.getsignal(signal.SIGALRM)
-        signal.signal(signal.SIGALRM, _on_timeout)
-        signal.alarm(SCRIPT_TIMEOUT)
-        try:
-            with redirect_stdout(output), redirect_stderr(err_output):
-                exec(code_object, safe_globals)
-        finally:
-            signal.alarm(0)
-            if old_handler is not None:
-                signal.signal(signal.SIGALRM, old_handler)
-            if old_exit is not None:
-                _bi.exit = old_exit  # type: ignore
-            if old_quit is not None:
-                _bi.quit = old_quit  # type: ignore
-        duration_ms = int((time() - start_ts) * 1000)
-        result = output.getvalue().strip()
-        stderr = err_output.getvalue().strip()
         debug: Dict[str, Any] = {
-            "sanitized_len": len(sanitized),
-            "stdout_len": len(result),
-            "stderr_len": len(stderr),
-            "duration_ms": duration_ms,
+            "sanitized_len": len(compiled.source),
+            "compiled_cache_hit": compiled_hit,
+            "analysis": compiled.analysis.to_dict(),
         }
-        if result:
-            return result, debug
-
-        # Fallback: try to read common result variables if nothing was printed
-        for var_name in ("result", "answer", "output"):
-            if var_name in safe_globals and safe_globals[var_name] is not None:
-                try:
-                    debug["fallback_var"] = var_name
-                    return str(safe_globals[var_name]), debug
-                except Exception:
-                    continue
-        # Fallback 2: captured result via set_result
-        if captured.get("__captured_result") is not None:
-            debug["fallback_var"] = "__captured_result"
-            return str(captured["__captured_result"]), debug
+        result_key, live = result_cache_key(compiled, context)
+        if RESULT_CACHE_ENABLED:
+            entry = cached_result(result_key, live)
+            if entry is not None:
+                result, age = entry
+                debug.update(result["debug"])
+                debug.update({
+                    "queue_wait_ms": 0,
+                    "run_ms": 0,
+                    "fetch_ms": 0.0,
+                    "coalesced": False,
+                    "result_cache": {"hit": True, "age_s": round(age, 3), "live": live, "clean": result.get("clean", True)},
+                })
+                return result["output"], debug
+
+        # Identical script + trip + parameters in flight: share the one run
+        flight_key = (compiled.digest, json.dumps(context, sort_keys=True))
+        emit({"event": "executing"})
+
+        async def run_script():
+            prefetch = prefetch_script_signals(compiled.analysis, context)
+            run = await script_executor.run(compiled.code, context, on_event=emit)
+            run.debug["prefetch"] = prefetch
+            record_script_run(run)
+            run.debug["clean"] = clean = is_clean_run(run, compiled.analysis)
+            if RESULT_CACHE_ENABLED and (clean or RESULT_CACHE_FAILURE_TTL_SECONDS > 0):
+                # Keyed by the data version after the run, which includes any live data the
+                # script itself just fetched; failed runs are only kept briefly
+                _result_cache.set(result_cache_key(compiled, context)[0] if live else result_key, {
+                    "output": run.output,
+                    "clean": clean,
+                    "debug": {"signals_read": run.debug.get("signals_read", {}), "computed_run_ms": run.run_ms},
+                })
+            return run
+
+        run, shared = await _result_flights.do(flight_key, run_script)
+        debug.update({
+            **run.debug,
+            "queue_wait_ms": run.queue_wait_ms,
+            "run_ms": run.run_ms,
+            "coalesced": shared,
+            "result_cache": {"hit": False, "age_s": None, "live": live, "clean": run.debug["clean"]},
+        })
+        return run.output, debug
 
-        debug["reason"] = "no stdout and no fallback variable"
-        return "No output generated", debug
-        
     except SyntaxError as e:
         logger.error(f"Pandas script syntax error: {e}\nOriginal script:\n{script}")
         raise HTTPException(status_code=500, detail=f"Script execution failed: {e}")
-    except TimeoutError as e:
+    except ScriptTimeoutError as e:
         logger.error(f"Pandas script execution timeout: {e}")
         raise HTTPException(status_code=504, detail="Script execution timed out")
     except Exception as e:
         logger.error(f"Pandas script execution error: {e}")
         raise HTTPException(status_code=500, detail=f"Script execution failed: {str(e)}")
 
+def speculate_signals(message: str, canonical: CanonicalQuery) -> Dict[str, Any]:
+    """Start fetching the signals the message most likely needs, so the download overlaps the
+    Gemini call; the script then finds them in the signal store.
+
+    Inside /query/batch the guesses were already fetched once for the whole
+    batch, so they are only recorded."""
+    trip_id = query_trip_id(canonical.params)
+    names = signal_catalog.suggest(message, SPECULATIVE_PREFETCH_MAX_SIGNALS, _SPECULATION_IGNORED_WORDS)
+    if not SPECULATIVE_PREFETCH_ENABLED or not names:
+        return {"trip_id": trip_id, "signals": []}
+    if batch_prefetched.get() is None:
+        fetch_in_background("speculative_prefetch", {trip_id: names})
+    return {"trip_id": trip_id, "signals": names}
+
+def record_speculation(speculation: Dict[str, Any], signals_read: Dict[str, list]) -> Dict[str, Any]:
+    """Compare the speculatively fetched signals with the ones the script read"""
+    guessed = set(speculation["signals"])
+    hits = guessed & set(signals_read.get(speculation["trip_id"], []))
+    read = sum(len(names) for names in signals_read.values())
+    outcome = {"hit": len(hits), "wasted": len(guessed) - len(hits), "missed": read - len(hits)}
+    if guessed:
+        SPECULATIVE_QUERIES.inc(result="hit" if hits else "miss")
+    for name, count in outcome.items():
+        SPECULATIVE_SIGNALS.inc(count, outcome=name)
+    return {**speculation, **outcome}
+
+def speculation_stats() -> Dict[str, Any]:
+    hit, wasted, missed = (SPECULATIVE_SIGNALS.value(outcome=o) for o in ("hit", "wasted", "missed"))
+    return {
+        "queries": {r: int(SPECULATIVE_QUERIES.value(result=r)) for r in ("hit", "miss")},
+        "signals": {"hit": int(hit), "wasted": int(wasted), "missed": int(missed)},
+        # Share of guessed signals that were used, and of used signals that were guessed
+        "precision": round(hit / (hit + wasted), 3) if hit + wasted else None,
+        "recall": round(hit / (hit + missed), 3) if hit + missed else None,
+    }
+
+def record_script_run(run: ScriptRun) -> None:
+    """Add a finished script run's stages (and the worker's data-read spans) to the trace and metrics"""
+    trace = current_trace.get()
+    if trace is not None:
+        exec_span = trace.add("exec", run.run_ms, peak_rss_bytes=run.debug.get("peak_rss_bytes"))
+        trace.add("queue_wait", run.queue_wait_ms, start_ms=exec_span["start_ms"] - run.queue_wait_ms)
+        for worker_span in run.spans:
+            trace.add(**{**worker_span, "start_ms": exec_span["start_ms"] + worker_span["start_ms"]})
+    for worker_span in run.spans:
+        if worker_span["name"] == "data_read":
+            DATA_READ_BYTES.observe(worker_span["bytes"])
+    if run.debug.get("upstream_bytes"):
+        UPSTREAM_BYTES.inc(run.debug["upstream_bytes"], caller="script")
+    if run.debug.get("peak_rss_bytes"):
+        SCRIPT_PEAK_MEMORY.observe(run.debug["peak_rss_bytes"])
+
+async def get_or_generate_script(message: str, canonical: CanonicalQuery) -> tuple[str, bool, Dict[str, Any]]:
+    """Return (script, cache_hit, speculation), calling Gemini only when no cached template fits.
+
+    While Gemini is called, the signals the message most likely needs are
+    prefetched; ``speculation`` says which (None on a cache hit).
+    """
+    with span("script_cache_lookup") as lookup:
+        cached = None
+        for key in dict.fromkeys((canonical.key, canonical.literal_key)):
+            cached = _script_cache.get(key)
+            if cached is not None:
+                break
+        lookup["hit"] = cached is not None
+    SCRIPT_CACHE_LOOKUPS.inc(result="hit" if cached is not None else "miss")
+    if cached is not None:
+        return cached["script"], True, None
+
+    async def generate() -> tuple[str, Dict[str, Any]]:
+        speculation = speculate_signals(message, canonical)
+        script = await generate_pandas_script(message, canonical.params)
+        try:
+            analysis = get_compiled_script(script)[0].analysis
+        except SyntaxError:
+            # Not cached; execution reports the error
+            return script, speculation
+        # Only cache as a reusable template if the script reads every kind of parameter
+        # from PARAMS and hard-codes none of them; otherwise it only fits the literal query
+        templated = analysis.fits_template(canonical.params)
+        key = canonical.key if templated else canonical.literal_key
+        _script_cache.set(key, {
+            "script": script,
+            "signals": canonical.signals,
+            "templated": templated,
+            "analysis": analysis.to_dict(),
+        })
+        return script, speculation
+
+    # Concurrent identical questions share one Gemini call
+    (script, speculation), _ = await _generation_flights.do(canonical.literal_key, generate)
+    return script, False, speculation
+
+async def answer_with_plan(plan: QueryPlan, emit: EventSink = _ignore_event) -> ChatResponse:
+    """Answer a planned aggregate directly from the signal store (summary index first)"""
+    start = perf_counter()
+    summary = series = None
+    use_summary = summary_supports(plan, FAST_PATH_APPROX_QUANTILES)
+    if use_summary:
+        summary = await asyncio.to_thread(signal_store.get_summary, VEHICLE_ID, plan.trip_id, plan.signal)
+    if summary is None:
+        # Fetched at most once; None when the vehicle API has no data for the trip or signal
+        series = (await load_signal_series(plan.trip_id, [plan.signal]))[plan.signal]
+        if use_summary and series is not None:
+            # First query for this signal: fetching it built the summary at ingest
+            summary = await asyncio.to_thread(signal_store.get_summary, VEHICLE_ID, plan.trip_id, plan.signal)
+    if summary is not None:
+        fetched = perf_counter()
+        emit({"event": "data_fetched", "trip_id": plan.trip_id, "signals": [plan.signal], "rows": summary.count})
+        result = execute_plan_from_summary(plan, summary)
+        samples = summary.count
+    else:
+        samples = len(series) if series is not None else 0
+        fetched = perf_counter()
+        emit({"event": "data_fetched", "trip_id": plan.trip_id, "signals": [plan.signal], "rows": samples})
+        result = execute_plan(plan, series)
+    debug = {
+        "path": "fast_path",
+        "source": "summary_index" if summary is not None else "samples",
+        "plan": plan.to_dict(),
+        "samples": samples,
+        "load_ms": round((fetched - start) * 1000, 2),
+        "compute_ms": round((perf_counter() - fetched) * 1000, 2),
+    }
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add("fast_path_load", debug["load_ms"], start_ms=(start - trace.started) * 1000, source=debug["source"])
+        trace.add("fast_path_compute", debug["compute_ms"])
+    debug["timings"] = {
+        "generate_ms": 0.0,
+        "fetch_ms": debug["load_ms"],
+        "exec_ms": debug["compute_ms"],
+        "total_ms": round((perf_counter() - start) * 1000, 2),
+    }
+    return ChatResponse(success=True, message=result, data={"debug": debug})
+
 @app.post("/query", response_model=ChatResponse)
 async def handle_query(request: ChatRequest):
     """Handle user queries and process vehicle data"""
+    return await process_query(request.message, include_trace=request.trace)
+
+async def process_query(message: str, emit: EventSink = _ignore_event, include_trace: bool = False) -> ChatResponse:
+    """Answer a query while recording its timing spans and request metrics"""
+    trace = Trace()
+    token = current_trace.set(trace)
+    path, outcome = "none", "error"
+    try:
+        response = await _process_query(message, emit)
+        path = ((response.data or {}).get("debug") or {}).get("path", "none")
+        outcome = "ok" if response.success else "error"
+    finally:
+        current_trace.reset(token)
+        QUERY_REQUESTS.inc(path=path, outcome=outcome)
+        QUERY_DURATION.observe(trace.elapsed_ms() / 1000, path=path)
+    if include_trace:
+        # Copy: coalesced requests may share one response object
+        data = {**(response.data or {}), "trace": {"total_ms": round(trace.elapsed_ms(), 2), "spans": trace.spans}}
+        response = response.model_copy(update={"data": data})
+    return response
+
+async def _process_query(message: str, emit: EventSink = _ignore_event) -> ChatResponse:
+    """Run a query through the fast path or the Gemini pipeline, reporting stages to `emit`"""
+    started = perf_counter()
     try:
-        message = request.message.strip()
+        message = message.strip()
         
         if not message:
             return ChatResponse(
@@ -362,39 +845,46 @@ async def handle_query(request: ChatRequest):
                 error="Empty message"
             )
         
+        with span("keyword_filter"):
+            canonical = canonicalize_query(message, signal_catalog)
+            is_vehicle_query = is_vehicle_data_query(message) or bool(canonical.signals)
+
         # Check if it's a vehicle data query
-        if not is_vehicle_data_query(message):
+        if not is_vehicle_query:
             return ChatResponse(
                 success=True,
                 message="Sorry, I can't help you with that. I can only assist with vehicle data queries."
             )
         
-        # Fetch vehicle data
-        try:
-            # Do not fetch data here to avoid extra API calls; the generated script will fetch directly
-            vehicle_data = None
-        except HTTPException as e:
-            # Propagate HTTPExceptions (e.g., 429 with Retry-After)
-            raise e
-        except Exception as e:
-            logger.error(f"Failed to fetch vehicle data: {e}")
-            return ChatResponse(
-                success=False,
-                message="Sorry, I couldn't fetch the data.",
-                error=str(e)
-            )
+        # Fast path: plan simple aggregates and answer them without Gemini
+        plan = plan_query(canonical, TRIP_ID) if FAST_PATH_ENABLED else None
+        emit({
+            "event": "planned",
+            "path": "fast_path" if plan is not None else "llm",
+            "signals": canonical.signals,
+            "plan": plan.to_dict() if plan is not None else None,
+        })
+        if plan is not None:
+            try:
+                response, _ = await _result_flights.do(("plan", json.dumps(plan.to_dict(), sort_keys=True)), lambda: answer_with_plan(plan, emit))
+                return response
+            except httpx.HTTPError as e:
+                logger.error(f"Failed to fetch vehicle data: {e}")
+                return ChatResponse(
+                    success=False,
+                    message="Sorry, I couldn't fetch the data.",
+                    error=str(e)
+                )
+            except Exception as e:
+                logger.warning(f"Fast path failed for {plan.to_dict()}, falling back to Gemini: {e}")
         
         # Generate Pandas script
         try:
-            # Cache by normalized query to reduce model usage
-            normalized = message.strip().lower()
-            cached = _script_cache.get(normalized)
-            now = time()
-            if cached and (now - cached["ts"]) < SCRIPT_CACHE_TTL_SECONDS:
-                pandas_script = cached["script"]
-            else:
-                pandas_script = await generate_pandas_script(message)
-                _script_cache[normalized] = {"script": pandas_script, "ts": now}
+            # Cache by canonical query template to reduce model usage
+            generate_started = perf_counter()
+            pandas_script, cache_hit, speculation = await get_or_generate_script(message, canonical)
+            generate_ms = round((perf_counter() - generate_started) * 1000, 2)
+            emit({"event": "script_generated", "cache_hit": cache_hit})
         except HTTPException as e:
             # Propagate rate limit or other HTTP errors with headers
             raise e
@@ -408,7 +898,19 @@ async def handle_query(request: ChatRequest):
         
         # Execute the script
         try:
-            result, debug_info = await execute_pandas_script(pandas_script)
+            result, debug_info = await execute_pandas_script(pandas_script, canonical.params, emit)
+            debug_info["path"] = "llm"
+            debug_info["script_cache"] = {"hit": cache_hit, "key": canonical.key}
+            if speculation is not None:
+                debug_info["speculative_prefetch"] = record_speculation(speculation, debug_info.get("signals_read", {}))
+            # Per-stage wall time; exec excludes the data reads done inside the script
+            debug_info["timings"] = {
+                "generate_ms": generate_ms,
+                "queue_ms": debug_info["queue_wait_ms"],
+                "fetch_ms": debug_info.get("fetch_ms", 0.0),
+                "exec_ms": round(max(0.0, debug_info["run_ms"] - debug_info.get("fetch_ms", 0.0)), 2),
+                "total_ms": round((perf_counter() - started) * 1000, 2),
+            }
             data_payload: Dict[str, Any] = {"script": pandas_script, "debug": debug_info}
             return ChatResponse(
                 success=True,
@@ -431,6 +933,114 @@ async def handle_query(request: ChatRequest):
             error=str(e)
         )
 
+async def wait_for_disconnect(http_request: Request) -> None:
+    """Return once the client has closed the connection (the request body is already read)."""
+    while True:
+        message = await http_request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+@app.post("/query/stream")
+async def handle_query_stream(request: ChatRequest, http_request: Request):
+    """Stream query progress as NDJSON stage events, ending with a "result" event.
+
+    Events: accepted, planned, script_generated, executing, data_fetched, result
+    (plus heartbeat while a stage runs). Closing the connection cancels the
+    query, including Gemini calls and the script worker running it; the
+    disconnect is watched for directly, not only noticed on the next write.
+    """
+    events: asyncio.Queue = asyncio.Queue()
+    started = perf_counter()
+
+    def emit(event: Dict[str, Any]) -> None:
+        events.put_nowait({**event, "elapsed_ms": int((perf_counter() - started) * 1000)})
+
+    async def run() -> None:
+        try:
+            response = await process_query(request.message, emit, include_trace=request.trace)
+            emit({"event": "result", "response": response.model_dump()})
+        except Exception as e:
+            logger.error(f"Unexpected error in query stream: {e}")
+            failure = ChatResponse(success=False, message="Sorry, an unexpected error occurred.", error=str(e))
+            emit({"event": "result", "response": failure.model_dump()})
+        finally:
+            events.put_nowait(None)
+
+    async def body():
+        task = asyncio.create_task(run())
+        disconnected = asyncio.ensure_future(wait_for_disconnect(http_request))
+        try:
+            # First byte goes out immediately, before any slow stage starts
+            yield json.dumps({"event": "accepted", "elapsed_ms": 0}) + "\n"
+            while True:
+                getter = asyncio.ensure_future(events.get())
+                done, _ = await asyncio.wait(
+                    {getter, disconnected}, timeout=STREAM_HEARTBEAT_SECONDS, return_when=asyncio.FIRST_COMPLETED
+                )
+                if getter not in done:
+                    getter.cancel()
+                if disconnected in done:
+                    break
+                if getter in done:
+                    event = getter.result()
+                else:
+                    event = {"event": "heartbeat", "elapsed_ms": int((perf_counter() - started) * 1000)}
+                if event is None:
+                    break
+                yield json.dumps(event) + "\n"
+        finally:
+            disconnected.cancel()
+            # Client cancelled or disconnected mid-stream: stop the server-side work too
+            if not task.done():
+                logger.info("Query stream closed by client; cancelling query")
+                task.cancel()
+
+    return StreamingResponse(
+        body(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/query/batch", response_model=List[ChatResponse])
+async def handle_query_batch(request: BatchQueryRequest):
+    """Answer a list of questions (e.g. a post-run report), returning one response per message, in order.
+
+    The signals the whole batch is likely to need are fetched first in shared
+    per-trip requests (the questions do not speculate again on their own); the
+    questions are then answered QUERY_BATCH_CONCURRENCY at a time, so Gemini calls (still bounded by the Gemini limiter) and script runs
+    on the worker pool overlap. A question that fails does not fail the batch.
+    """
+    if len(request.messages) > QUERY_BATCH_MAX_MESSAGES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {QUERY_BATCH_MAX_MESSAGES} messages per batch, got {len(request.messages)}",
+        )
+    by_trip: Dict[str, List[str]] = {}
+    for message in request.messages:
+        canonical = canonicalize_query(message, signal_catalog)
+        names = canonical.signals
+        if SPECULATIVE_PREFETCH_ENABLED:
+            names = signal_catalog.suggest(message, SPECULATIVE_PREFETCH_MAX_SIGNALS, _SPECULATION_IGNORED_WORDS)
+        trip_names = by_trip.setdefault(query_trip_id(canonical.params), [])
+        trip_names.extend(name for name in names if name not in trip_names)
+    by_trip = {trip_id: names for trip_id, names in by_trip.items() if names}
+    if by_trip:
+        # Per-question fetches of these signals join the in-flight batch fetch instead of repeating it
+        fetch_in_background("batch_prefetch", by_trip)
+    # Copied into each question's task by gather below
+    batch_prefetched.set(by_trip)
+
+    semaphore = asyncio.Semaphore(max(1, QUERY_BATCH_CONCURRENCY))
+
+    async def answer(message: str) -> ChatResponse:
+        async with semaphore:
+            try:
+                return await process_query(message, include_trace=request.trace)
+            except HTTPException as e:
+                return ChatResponse(success=False, message="Sorry, I couldn't process your query.", error=str(e.detail))
+
+    return await asyncio.gather(*(answer(message) for message in request.messages))
+
 @app.post("/log")
 async def log_error(request: LogRequest):
     """Log frontend errors"""
@@ -443,11 +1053,66 @@ async def log_error(request: LogRequest):
         logger.error(f"Failed to log error: {e}")
         return {"success": False, "message": "Failed to log error"}
 
+@app.get("/summary/{trip_id}")
+async def get_summary_index(trip_id: str, signals: str = ""):
+    """Summary index of a trip: one entry per catalog signal (null until it has been fetched)"""
+    names = [s.strip() for s in signals.split(",") if s.strip()] or signal_catalog.names
+    summaries = await asyncio.to_thread(signal_store.summaries, VEHICLE_ID, trip_id, names)
+    return {
+        "vehicle_id": VEHICLE_ID,
+        "trip_id": trip_id,
+        "indexed": sum(1 for s in summaries.values() if s is not None),
+        "total": len(names),
+        "signals": {name: s.describe() if s is not None else None for name, s in summaries.items()},
+    }
+
+@app.post("/summary/{trip_id}/build")
+async def build_summary_index(trip_id: str):
+    """Fetch every catalog signal not yet indexed for a trip, building its summary at ingest"""
+    start = perf_counter()
+    summaries = await asyncio.to_thread(signal_store.summaries, VEHICLE_ID, trip_id, signal_catalog.names)
+    missing = [name for name, s in summaries.items() if s is None]
+    try:
+        # Fetched in batches of SIGNAL_FETCH_BATCH_SIZE
+        await ensure_signals(trip_id, missing)
+    except httpx.HTTPError as e:
+        logger.error(f"Summary index build for trip {trip_id} failed: {e}")
+        raise HTTPException(status_code=502, detail=f"Vehicle data fetch failed: {e}")
+    return {
+        "vehicle_id": VEHICLE_ID,
+        "trip_id": trip_id,
+        "fetched": len(missing),
+        "total": len(signal_catalog.names),
+        "elapsed_ms": round((perf_counter() - start) * 1000, 2),
+    }
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: query/stage latency histograms, Gemini attempts, bytes read, script memory"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "message": "Vehicle Data Chatbot API is running"}
+    return {
+        "status": "healthy",
+        "message": "Vehicle Data Chatbot API is running",
+        "executor": script_executor.stats(),
+        "script_cache": _script_cache.stats(),
+        "compiled_scripts": _compiled_scripts.stats(),
+        "result_cache": _result_cache.stats(),
+        "signal_store": signal_store.stats(),
+        "live": trip_follower.stats(),
+        "speculative_prefetch": speculation_stats(),
+        "single_flight": {f.name: f.stats() for f in (_generation_flights, _fetch_flights, _result_flights)},
+    }
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Each API worker runs its own script pool of SCRIPT_WORKERS processes; use
+    # CACHE_BACKEND=sqlite so they share generated scripts and results
+    API_WORKERS = int(os.getenv("API_WORKERS", "1"))
+    if API_WORKERS > 1:
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=API_WORKERS)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
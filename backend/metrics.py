@@ -0,0 +1,204 @@
+"""Prometheus-style counters/histograms and per-query timing traces.
+
+Metrics live in one process-wide registry rendered in the Prometheus text
+exposition format by ``/metrics``. A ``Trace`` collects the timing spans of one
+query (keyword filter, cache lookup, Gemini, compile, exec, each data read in
+the script worker, ...); every span is also observed into the
+``query_stage_duration_seconds`` histogram, labelled by stage.
+"""
+import contextvars
+import math
+import threading
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+BYTES_BUCKETS = tuple(float(4 ** i * 1024) for i in range(10))  # 1 KiB .. 256 MiB
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: Any) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {_num(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series: Dict[Tuple[str, ...], List[float]] = {}  # bucket counts..., sum, count
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.setdefault(key, [0.0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    le = 'le="%s"' % _num(bound)
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {_num(count)}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_num(series[-2])}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {_num(series[-1])}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._metrics.setdefault(name, Counter(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._metrics.setdefault(name, Histogram(name, help_text, labelnames, buckets))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+QUERY_REQUESTS = REGISTRY.counter("query_requests_total", "Queries handled, by answering path and outcome.", ("path", "outcome"))
+QUERY_DURATION = REGISTRY.histogram("query_duration_seconds", "End-to-end query handling time.", ("path",))
+STAGE_DURATION = REGISTRY.histogram("query_stage_duration_seconds", "Time spent per query stage.", ("stage",))
+SCRIPT_CACHE_LOOKUPS = REGISTRY.counter("script_cache_lookups_total", "Generated-script cache lookups.", ("result",))
+RESULT_CACHE_LOOKUPS = REGISTRY.counter("result_cache_lookups_total", "Script result cache lookups.", ("result",))
+GEMINI_ATTEMPTS = REGISTRY.counter("gemini_attempts_total", "Gemini HTTP attempts, by outcome.", ("outcome",))
+GEMINI_CALL_ATTEMPTS = REGISTRY.histogram(
+    "gemini_call_attempts", "HTTP attempts needed per Gemini call.", buckets=(1, 2, 3, 4, 5, 8)
+)
+DATA_READ_BYTES = REGISTRY.histogram(
+    "script_data_read_bytes", "Bytes of signal data returned per data read in a script.", buckets=BYTES_BUCKETS
+)
+UPSTREAM_BYTES = REGISTRY.counter("vehicle_api_bytes_total", "Bytes downloaded from the vehicle API.", ("caller",))
+SCRIPT_PEAK_MEMORY = REGISTRY.histogram(
+    "script_peak_memory_bytes", "Peak resident memory of the worker while running a script.", buckets=BYTES_BUCKETS
+)
+SPECULATIVE_QUERIES = REGISTRY.counter(
+    "speculative_prefetch_queries_total",
+    "Generated-script queries with a speculative prefetch, by whether any guessed signal was read.",
+    ("result",),
+)
+SPECULATIVE_SIGNALS = REGISTRY.counter(
+    "speculative_prefetch_signals_total",
+    "Speculatively prefetched signals the script read (hit) or not (wasted), and signals it read that were not guessed (missed).",
+    ("outcome",),
+)
+LIVE_POLLS = REGISTRY.counter("live_follow_polls_total", "Live-trip follower polls, by outcome.", ("outcome",))
+LIVE_SAMPLES = REGISTRY.counter("live_follow_samples_total", "Samples appended to live trips by the follower.")
+
+
+class Trace:
+    """Timing spans of one query, as offsets from the start of the query."""
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+
+    def add(self, name: str, duration_ms: float, start_ms: Optional[float] = None, **attrs: Any) -> Dict[str, Any]:
+        span = {
+            "name": name,
+            "start_ms": round((perf_counter() - self.started) * 1000 - duration_ms if start_ms is None else start_ms, 2),
+            "duration_ms": round(duration_ms, 2),
+            **attrs,
+        }
+        self.spans.append(span)
+        STAGE_DURATION.observe(duration_ms / 1000, stage=name)
+        return span
+
+    @contextmanager
+    def span(self, name: str, **attrs: Any) -> Iterator[Dict[str, Any]]:
+        """Time a block; the yielded dict can be filled with attributes while it runs."""
+        started = perf_counter()
+        extra: Dict[str, Any] = dict(attrs)
+        try:
+            yield extra
+        finally:
+            self.add(name, (perf_counter() - started) * 1000, start_ms=(started - self.started) * 1000, **extra)
+
+    def elapsed_ms(self) -> float:
+        return (perf_counter() - self.started) * 1000
+
+
+# Trace of the query being handled by the current task (None outside a query)
+current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("current_trace", default=None)
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Dict[str, Any]]:
+    """``Trace.span`` on the current query's trace; only feeds the histogram outside a query."""
+    trace = current_trace.get()
+    if trace is not None:
+        with trace.span(name, **attrs) as extra:
+            yield extra
+        return
+    started = perf_counter()
+    try:
+        yield dict(attrs)
+    finally:
+        STAGE_DURATION.observe(perf_counter() - started, stage=name)
@@ -0,0 +1,100 @@
+"""Canonical forms of user queries.
+
+Phrasing differences ("max mobile_speed" vs "what's the maximum mobile speed?")
+collapse to one key: aggregate words are normalized, filler words dropped,
+signal mentions resolved against the catalog, and trip ids / other numbers
+pulled out as parameters so one generated script can serve them all.
+"""
+from dataclasses import dataclass, field
+from typing import Any, Dict, List
+
+from signal_catalog import SignalCatalog, tokenize
+
+AGGREGATE_SYNONYMS = {
+    "maximum": "max", "highest": "max", "largest": "max", "biggest": "max",
+    "greatest": "max", "peak": "max", "top": "top",
+    "minimum": "min", "lowest": "min", "smallest": "min", "bottom": "bottom",
+    "average": "mean", "averages": "mean", "avg": "mean", "mean": "mean",
+    "med": "median", "medians": "median",
+    "deviation": "stddev", "std": "stddev", "stdev": "stddev",
+    "percentiles": "percentile", "pct": "percentile", "quantile": "percentile",
+    "correlate": "correlation", "correlated": "correlation", "corr": "correlation",
+    "samples": "count", "readings": "count",
+}
+
+STOPWORDS = {
+    "what", "whats", "s", "is", "are", "was", "were", "the", "a", "an", "of", "me",
+    "give", "show", "tell", "please", "for", "during", "in", "on", "over", "across",
+    "can", "you", "i", "want", "to", "know", "find", "get", "compute", "calculate",
+    "value", "values", "data", "this", "that", "my", "our", "it", "be", "and",
+}
+
+TRIP_WORDS = {"trip", "trips", "run", "runs", "session"}
+TRIP_JOINERS = {"and", "vs", "versus", "or", "to"}
+
+
+def _number(token: str) -> Any:
+    value = float(token)
+    return int(value) if value.is_integer() else value
+
+
+@dataclass(frozen=True)
+class CanonicalQuery:
+    key: str  # template key: parameters replaced by placeholders
+    literal_key: str  # same form with the parameter values left in
+    signals: List[str] = field(default_factory=list)
+    params: Dict[str, List[Any]] = field(default_factory=dict)
+
+    @property
+    def has_params(self) -> bool:
+        return any(self.params.values())
+
+
+def canonicalize_query(message: str, catalog: SignalCatalog) -> CanonicalQuery:
+    """Reduce a query to its canonical template key plus extracted parameters."""
+    tokens = tokenize(message)
+    matches = {m.start: m for m in catalog.match_tokens(tokens)}
+    template: List[str] = []
+    literal: List[str] = []
+    signals: List[str] = []
+    trip_ids: List[str] = []
+    numbers: List[Any] = []
+
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if i in matches:
+            match = matches[i]
+            signals.append(match.name)
+            template.append(match.name)
+            literal.append(match.name)
+            i = match.end
+            continue
+        if token in TRIP_WORDS:
+            template.append("trip")
+            literal.append("trip")
+            i += 1
+            # "trip 4", "trips 4 and 5", "trip 4 vs 5"
+            while i < len(tokens) and (tokens[i][0].isdigit() or tokens[i] in TRIP_JOINERS):
+                if tokens[i][0].isdigit():
+                    trip_ids.append(tokens[i])
+                    template.append("<trip>")
+                    literal.append(tokens[i])
+                i += 1
+            continue
+        if token[0].isdigit():
+            numbers.append(_number(token))
+            template.append("<n>")
+            literal.append(token)
+        elif token not in STOPWORDS:
+            word = AGGREGATE_SYNONYMS.get(token, token)
+            template.append(word)
+            literal.append(word)
+        i += 1
+
+    return CanonicalQuery(
+        key=" ".join(template),
+        literal_key=" ".join(literal),
+        signals=list(dict.fromkeys(signals)),
+        params={"trip_ids": trip_ids, "numbers": numbers},
+    )
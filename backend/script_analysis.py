@@ -0,0 +1,324 @@
+"""Sanitized, compiled and statically analysed generated scripts.
+
+A ``CompiledScript`` is built once per distinct script text and cached, so a
+repeat query skips the fence-stripping regexes, ``compile`` and this analysis.
+The analysis walks the AST for calls to the data helpers (``build_url``,
+``fetch_signals``, ``signal_summaries``) and resolves their arguments where
+they are literals, ``signal_names`` globs or variables assigned once from
+those. That yields the signals the script will read, and for which trips, so
+they can be fetched while the script is still waiting for a worker. It also
+tells whether the script hard-codes a trip or a number from the query, or
+ignores a kind of parameter, which makes it unsafe to reuse as a template for
+other values.
+"""
+import ast
+import fnmatch
+import hashlib
+import re
+from dataclasses import dataclass
+from types import CodeType
+from typing import Any, Dict, List, Optional, Tuple
+
+from signal_catalog import SignalCatalog
+
+HELPERS = ("http_get", "build_url", "fetch_signals", "signal_names", "signal_summaries", "set_result")
+# Helpers that read signal data, and the position of their trip_id argument
+SIGNAL_HELPERS = {"build_url": 1, "fetch_signals": 1, "signal_summaries": 1}
+HINT_KEYWORDS = ("start", "end", "last", "resolution")
+DEFAULT_TRIP = "default"  # trip reference meaning the query's trip (PARAMS["trip_ids"][0] or the default)
+
+_UNRESOLVED = object()
+
+
+def sanitize_generated_code(raw: str) -> str:
+    # Extract code from triple backtick fences if present, drop language tag
+    matches = re.findall(r"```(?:[\w+-]*)?\n([\s\S]*?)```", raw)
+    if matches:
+        code = "\n\n".join(matches)
+    else:
+        code = raw
+    # Remove any stray triple backticks and leading 'python' markers
+    code = code.replace("```", "")
+    code = re.sub(r"^\s*python\n", "", code, flags=re.IGNORECASE)
+    return code.strip()
+
+
+def script_digest(raw: str) -> str:
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+@dataclass(frozen=True)
+class SignalRead:
+    """One data-helper call: the signals it reads, for which trips, with which hints."""
+    helper: str
+    signals: Tuple[str, ...]
+    trips: Tuple[Any, ...]  # DEFAULT_TRIP or an index into PARAMS["trip_ids"]
+    hints: Tuple[str, ...]
+
+
+@dataclass(frozen=True)
+class ScriptAnalysis:
+    reads: Tuple[SignalRead, ...]
+    helpers: Tuple[str, ...]
+    complete: bool  # every data read was resolved statically
+    uses_params: bool
+    trip_reusable: bool  # no trip id is hard-coded
+    params_read: Tuple[str, ...] = ()  # PARAMS keys the script reads ("trip_ids" also via the default trip)
+    constants: Tuple[float, ...] = ()  # numeric literals, other than subscript indexes
+
+    @property
+    def signals(self) -> List[str]:
+        return list(dict.fromkeys(name for read in self.reads for name in read.signals))
+
+    @property
+    def hints(self) -> List[str]:
+        return sorted({hint for read in self.reads for hint in read.hints})
+
+    def signals_by_trip(self, context: Dict[str, Any], skip_hints: Tuple[str, ...] = ()) -> Dict[str, List[str]]:
+        """Signals to read per concrete trip id for one run, leaving out reads that use ``skip_hints``."""
+        trip_ids = (context.get("params") or {}).get("trip_ids") or []
+        by_trip: Dict[str, List[str]] = {}
+        for read in self.reads:
+            if any(hint in skip_hints for hint in read.hints):
+                continue
+            for ref in read.trips:
+                if ref == DEFAULT_TRIP:
+                    trip_id = context["trip_id"]
+                elif ref < len(trip_ids):
+                    trip_id = str(trip_ids[ref])
+                else:
+                    continue
+                by_trip.setdefault(trip_id, [])
+                by_trip[trip_id].extend(s for s in read.signals if s not in by_trip[trip_id])
+        return by_trip
+
+    def fits_template(self, params: Dict[str, List[Any]]) -> bool:
+        """Whether the script can answer every query with the same template as the one it was written for.
+
+        Every kind of parameter the query has must be read from PARAMS, and
+        neither a trip nor a number of the query may be hard-coded.
+        """
+        if not self.trip_reusable:
+            return False
+        if any(values and kind not in self.params_read for kind, values in params.items()):
+            return False
+        constants = set(self.constants)
+        return not any(float(value) in constants for value in params.get("numbers") or [])
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "signals": self.signals,
+            "helpers": list(self.helpers),
+            "hints": self.hints,
+            "complete": self.complete,
+            "uses_params": self.uses_params,
+            "trip_reusable": self.trip_reusable,
+            "params_read": list(self.params_read),
+        }
+
+
+@dataclass(frozen=True)
+class CompiledScript:
+    digest: str  # sha256 of the raw generated text
+    source: str  # sanitized source
+    code: CodeType
+    analysis: ScriptAnalysis
+
+
+class _Analyzer:
+    def __init__(self, tree: ast.AST, catalog: Optional[SignalCatalog]):
+        self.catalog = catalog
+        self.assignments: Dict[str, List[ast.AST]] = {}
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Assign):
+                for target in node.targets:
+                    if isinstance(target, ast.Name):
+                        self.assignments.setdefault(target.id, []).append(node.value)
+                    else:
+                        for name in ast.walk(target):
+                            if isinstance(name, ast.Name):
+                                self.assignments.setdefault(name.id, []).append(None)
+            elif isinstance(node, ast.AnnAssign) and isinstance(node.target, ast.Name):
+                self.assignments.setdefault(node.target.id, []).append(node.value)
+            elif isinstance(node, ast.AugAssign) and isinstance(node.target, ast.Name):
+                # signals += [...]: the value depends on control flow
+                self.assignments.setdefault(node.target.id, []).append(None)
+            elif isinstance(node, (ast.For, ast.comprehension)):
+                for name in ast.walk(node.target):
+                    if isinstance(name, ast.Name):
+                        self.assignments.setdefault(name.id, []).append(None)
+        self._resolving: set = set()
+
+    def _variable(self, name: str) -> Optional[ast.AST]:
+        """The expression a variable is bound to, if it is bound exactly once."""
+        values = self.assignments.get(name, [])
+        return values[0] if len(values) == 1 else None
+
+    def signals(self, node: ast.AST) -> Any:
+        """Signal names an expression evaluates to, or ``_UNRESOLVED``."""
+        if isinstance(node, ast.Constant) and isinstance(node.value, str):
+            return [s.strip() for s in node.value.split(",") if s.strip()]
+        if isinstance(node, (ast.List, ast.Tuple, ast.Set)):
+            names: List[str] = []
+            for element in node.elts:
+                part = self.signals(element.value if isinstance(element, ast.Starred) else element)
+                if part is _UNRESOLVED:
+                    return _UNRESOLVED
+                names.extend(part)
+            return names
+        if isinstance(node, ast.Name):
+            value = self._variable(node.id)
+            if value is None or node.id in self._resolving:
+                return _UNRESOLVED
+            self._resolving.add(node.id)
+            try:
+                return self.signals(value)
+            finally:
+                self._resolving.discard(node.id)
+        if isinstance(node, ast.Subscript):
+            # signals[:2], signals[0]: a subset of the base list, so the base over-approximates it
+            return self.signals(node.value)
+        if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Add):
+            left, right = self.signals(node.left), self.signals(node.right)
+            return _UNRESOLVED if _UNRESOLVED in (left, right) else left + right
+        if isinstance(node, ast.Call):
+            func = node.func
+            if isinstance(func, ast.Name) and func.id == "signal_names" and self.catalog is not None:
+                pattern = self._string(node.args[0]) if node.args else "*"
+                if pattern is None:
+                    return _UNRESOLVED
+                return [name for name in self.catalog.names if fnmatch.fnmatchcase(name, pattern)]
+            if isinstance(func, ast.Name) and func.id in ("list", "tuple", "sorted", "set") and len(node.args) == 1:
+                return self.signals(node.args[0])
+            if isinstance(func, ast.Attribute) and func.attr == "join" and len(node.args) == 1:
+                return self.signals(node.args[0])
+        return _UNRESOLVED
+
+    def _string(self, node: ast.AST) -> Optional[str]:
+        if isinstance(node, ast.Constant) and isinstance(node.value, str):
+            return node.value
+        if isinstance(node, ast.Name):
+            value = self._variable(node.id)
+            return self._string(value) if value is not None else None
+        return None
+
+    @staticmethod
+    def param_key(node: ast.AST) -> Optional[str]:
+        """``k`` for ``PARAMS["k"]`` and ``PARAMS.get("k", ...)``."""
+        if (
+            isinstance(node, ast.Subscript)
+            and isinstance(node.value, ast.Name) and node.value.id == "PARAMS"
+            and isinstance(node.slice, ast.Constant) and isinstance(node.slice.value, str)
+        ):
+            return node.slice.value
+        if (
+            isinstance(node, ast.Call) and node.args
+            and isinstance(node.func, ast.Attribute) and node.func.attr == "get"
+            and isinstance(node.func.value, ast.Name) and node.func.value.id == "PARAMS"
+            and isinstance(node.args[0], ast.Constant) and isinstance(node.args[0].value, str)
+        ):
+            return node.args[0].value
+        return None
+
+    def trips(self, node: Optional[ast.AST]) -> Any:
+        """Trip references an expression can take, ``_UNRESOLVED``, or ``None`` if it is a literal trip."""
+        if node is None or (isinstance(node, ast.Constant) and node.value is None):
+            return [DEFAULT_TRIP]
+        if isinstance(node, ast.Constant):
+            return None
+        if isinstance(node, ast.IfExp):
+            body, orelse = self.trips(node.body), self.trips(node.orelse)
+            if body is None or orelse is None:
+                return None
+            return _UNRESOLVED if _UNRESOLVED in (body, orelse) else list(dict.fromkeys(body + orelse))
+        if isinstance(node, ast.Name):
+            value = self._variable(node.id)
+            if value is None or node.id in self._resolving:
+                return _UNRESOLVED
+            self._resolving.add(node.id)
+            try:
+                return self.trips(value)
+            finally:
+                self._resolving.discard(node.id)
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in ("str", "int") and node.args:
+            return self.trips(node.args[0])
+        # PARAMS["trip_ids"][k]
+        if (
+            isinstance(node, ast.Subscript)
+            and isinstance(node.slice, ast.Constant) and isinstance(node.slice.value, int)
+            and isinstance(node.value, ast.Subscript)
+            and isinstance(node.value.value, ast.Name) and node.value.value.id == "PARAMS"
+            and isinstance(node.value.slice, ast.Constant) and node.value.slice.value == "trip_ids"
+        ):
+            return [node.slice.value]
+        return _UNRESOLVED
+
+
+def analyze_script(tree: ast.AST, catalog: Optional[SignalCatalog] = None) -> ScriptAnalysis:
+    """Statically find the helpers a script calls and the signals and trips it reads."""
+    analyzer = _Analyzer(tree, catalog)
+    reads: List[SignalRead] = []
+    helpers: List[str] = []
+    complete = True
+    trip_reusable = True
+    uses_params = False
+    params_read: List[str] = []
+    constants: List[float] = []
+    indexes = {id(node.slice) for node in ast.walk(tree) if isinstance(node, ast.Subscript)}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and node.id == "PARAMS":
+            uses_params = True
+        key = analyzer.param_key(node)
+        if key is not None and key not in params_read:
+            params_read.append(key)
+        if (
+            isinstance(node, ast.Constant) and isinstance(node.value, (int, float))
+            and not isinstance(node.value, bool) and id(node) not in indexes
+        ):
+            constants.append(float(node.value))
+        elif isinstance(node, ast.Constant) and isinstance(node.value, str) and "trip_id=" in node.value:
+            # A hand-built vehicle API URL: its trip and signals are not visible here
+            trip_reusable = False
+            complete = False
+        if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in HELPERS):
+            continue
+        helper = node.func.id
+        if helper not in helpers:
+            helpers.append(helper)
+        if helper not in SIGNAL_HELPERS:
+            continue
+        keywords = {kw.arg: kw.value for kw in node.keywords if kw.arg}
+        position = SIGNAL_HELPERS[helper]
+        signals = analyzer.signals(node.args[0] if node.args else keywords.get("signals", ast.Constant(None)))
+        trip_node = node.args[position] if len(node.args) > position else keywords.get("trip_id")
+        trips = analyzer.trips(trip_node)
+        if trips is None:
+            trip_reusable = False
+            complete = False
+            continue
+        if trips is _UNRESOLVED:
+            complete = False
+            trips = [DEFAULT_TRIP]
+        elif DEFAULT_TRIP in trips and "trip_ids" not in params_read:
+            # The helpers read PARAMS["trip_ids"][0] when no trip is given
+            params_read.append("trip_ids")
+        if signals is _UNRESOLVED:
+            complete = False
+            continue
+        hints = tuple(hint for hint in HINT_KEYWORDS if hint in keywords)
+        reads.append(SignalRead(helper, tuple(dict.fromkeys(signals)), tuple(trips), hints))
+    return ScriptAnalysis(
+        tuple(reads), tuple(helpers), complete, uses_params, trip_reusable, tuple(params_read), tuple(constants)
+    )
+
+
+def compile_script(raw: str, catalog: Optional[SignalCatalog] = None, digest: Optional[str] = None) -> CompiledScript:
+    """Sanitize, compile and analyse generated script text (raises SyntaxError)."""
+    source = sanitize_generated_code(raw)
+    tree = ast.parse(source, "<generated>", "exec")
+    return CompiledScript(
+        digest=digest or script_digest(raw),
+        source=source,
+        code=compile(tree, "<generated>", "exec"),
+        analysis=analyze_script(tree, catalog),
+    )
@@ -0,0 +1,132 @@
+"""Signal catalog loaded from signals.csv and matching of signal mentions in text."""
+import csv
+import difflib
+import os
+import re
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_CATALOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "signals.csv")
+
+# Word-level synonyms applied to both user text and signal names before matching
+TOKEN_SYNONYMS = {
+    "temperature": "temp",
+    "temperatures": "temp",
+    "temps": "temp",
+    "voltages": "voltage",
+    "volts": "voltage",
+    "velocity": "speed",
+    "cells": "cell",
+    "fans": "fan",
+    "utilization": "util",
+    "frequency": "freq",
+    "acceleration": "accelerometer",
+}
+
+_TOKEN_RE = re.compile(r"[a-z]+|\d+(?:\.\d+)?")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word/number tokens; ``cell12`` splits into ``cell``, ``12``."""
+    return [TOKEN_SYNONYMS.get(t, t) for t in _TOKEN_RE.findall(text.lower().replace("_", " "))]
+
+
+@dataclass(frozen=True)
+class SignalMatch:
+    name: str
+    start: int  # token span in the tokenized text
+    end: int
+
+
+class SignalCatalog:
+    """All known signal names, indexed for mention matching."""
+
+    def __init__(self, names: List[str]):
+        self.names = list(dict.fromkeys(n.strip() for n in names if n and n.strip()))
+        self._name_set = set(self.names)
+        # Token sequences that identify each signal: the full name, and the name
+        # without its subsystem prefix when that is still specific (2+ tokens)
+        self._patterns: Dict[Tuple[str, ...], List[str]] = {}
+        for name in self.names:
+            tokens = tuple(tokenize(name))
+            self._patterns.setdefault(tokens, []).append(name)
+            if len(tokens) >= 3:
+                self._patterns.setdefault(tokens[1:], []).append(name)
+        self._max_len = max((len(p) for p in self._patterns), default=0)
+        # For fuzzy suggestions: each name's tokens without the subsystem prefix, and all known words
+        self._name_tokens = {
+            name: tuple(tokens[1:]) if len(tokens) >= 3 else tokens
+            for name, tokens in ((name, tuple(tokenize(name))) for name in self.names)
+        }
+        self._vocabulary = sorted({t for tokens in self._name_tokens.values() for t in tokens if t.isalpha()})
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_CATALOG_PATH) -> "SignalCatalog":
+        with open(path, newline="") as fh:
+            return cls([row["name"] for row in csv.DictReader(fh)])
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._name_set
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def match_tokens(self, tokens: List[str]) -> List[SignalMatch]:
+        """Longest non-overlapping signal mentions in a token list, left to right."""
+        matches: List[SignalMatch] = []
+        i = 0
+        while i < len(tokens):
+            found: Optional[SignalMatch] = None
+            for size in range(min(self._max_len, len(tokens) - i), 0, -1):
+                names = self._patterns.get(tuple(tokens[i:i + size]))
+                # Ambiguous short forms (e.g. "speed") are left to the model
+                if names and len(names) == 1:
+                    found = SignalMatch(names[0], i, i + size)
+                    break
+            if found:
+                matches.append(found)
+                i = found.end
+            else:
+                i += 1
+        return matches
+
+    def resolve(self, text: str) -> List[str]:
+        """Signal names mentioned in free text, in order of appearance."""
+        return list(dict.fromkeys(m.name for m in self.match_tokens(tokenize(text))))
+
+    def _correct(self, token: str) -> str:
+        """The catalog word a misspelled token most likely means (e.g. ``mobil`` -> ``mobile``)."""
+        if not token.isalpha() or len(token) < 4 or token in self._vocabulary:
+            return token
+        close = difflib.get_close_matches(token, self._vocabulary, n=1, cutoff=0.85)
+        return close[0] if close else token
+
+    def suggest(self, text: str, limit: int = 8, ignore: Iterable[str] = ()) -> List[str]:
+        """Likely signals for free text, best first, for speculative prefetching.
+
+        Exact mentions (as in ``resolve``) come first. Words they do not use are
+        then scored against every name: a name qualifies when at least half of
+        its words (subsystem prefix aside) appear, including any number in it,
+        so "cell 12" suggests both ``acu_cell12_temp`` and ``acu_cell12_voltage``
+        and "mobil sped" still finds ``mobile_speed``. Words in ``ignore`` (such
+        as aggregate words: "max" is not a hint for ``vdm_max_power``) only count
+        inside exact mentions.
+        """
+        tokens = [self._correct(t) for t in tokenize(text)]
+        matches = self.match_tokens(tokens)
+        names = list(dict.fromkeys(m.name for m in matches))
+        used = {i for m in matches for i in range(m.start, m.end)}
+        ignored = set(ignore)
+        words = {t for i, t in enumerate(tokens) if i not in used and t not in ignored}
+        scored = []
+        for position, (name, name_tokens) in enumerate(self._name_tokens.items()):
+            if name in names:
+                continue
+            if any(not t.isalpha() and t not in words for t in name_tokens):
+                continue
+            hits = [t for t in name_tokens if t in words]
+            if not any(t.isalpha() for t in hits) or 2 * len(hits) < len(name_tokens):
+                continue
+            scored.append((-len(hits) / len(name_tokens), position, name))
+        names.extend(name for _, _, name in sorted(scored))
+        return names[:limit]
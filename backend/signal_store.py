@@ -0,0 +1,805 @@
+"""Local columnar cache for Mapache signal series.
+
+Series fetched from the vehicle API are kept as typed NumPy columns keyed by
+(vehicle_id, trip_id, signal): one ``.npz`` file per signal on disk plus an
+in-memory LRU bounded by a byte budget. Finished trips never change, so once a
+signal is in the store repeat and overlapping queries need no network at all.
+Next to each series a ``.pyr.npz`` file holds its bucket pyramid (see
+``downsample``) for reduced-resolution reads, and a ``.summary.json`` file its
+summary statistics (see ``summary``), both built when the series is stored.
+
+Live trips are only trusted for ``live_ttl_seconds`` after a fetch, unless a
+follower (see ``live``) keeps them current: it appends new samples with
+``append``, which extends the pyramid and summary incrementally, and bumps the
+trip's data version so every process drops its stale in-memory copies.
+"""
+import json
+import logging
+import math
+import os
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from time import time, time_ns
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from downsample import BucketLevel, best_level_width, bucket_series, build_pyramid, epoch_scale
+from summary import DEFAULT_COMPRESSION, SignalSummary
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process fetch coalescing
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+TIMESTAMP_FIELD = "produced_at"
+_SAFE_NAME = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+@dataclass(frozen=True)
+class SignalSeries:
+    """One signal of one trip: sorted epoch-ns timestamps and their values."""
+    timestamps: np.ndarray
+    values: np.ndarray
+    fetched_at: float
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.timestamps.nbytes + self.values.nbytes)
+
+    def __len__(self) -> int:
+        return int(self.values.shape[0])
+
+    @property
+    def end_ns(self) -> Optional[int]:
+        return int(self.timestamps[-1]) if len(self) else None
+
+    def between(self, lo: int, hi: int) -> "SignalSeries":
+        """Samples with ``lo <= timestamp <= hi`` (views, no copy)."""
+        first = np.searchsorted(self.timestamps, lo, side="left")
+        last = np.searchsorted(self.timestamps, hi, side="right")
+        return SignalSeries(self.timestamps[first:last], self.values[first:last], self.fetched_at)
+
+
+@dataclass(frozen=True)
+class SignalRequest:
+    """A vehicle API URL broken down into the parts the store cares about."""
+    vehicle_id: str
+    trip_id: str
+    signals: List[str]
+    params: Dict[str, str]
+
+
+def parse_signals_url(url: str, api_url: str) -> Optional[SignalRequest]:
+    """Parse a signals API URL; returns None for URLs that are not the vehicle API."""
+    parts = urlsplit(url)
+    api = urlsplit(api_url)
+    if (parts.netloc, parts.path.rstrip("/")) != (api.netloc, api.path.rstrip("/")):
+        return None
+    query = {k: v[-1] for k, v in parse_qs(parts.query, keep_blank_values=True).items()}
+    signals = [s.strip() for s in query.get("signals", "").split(",") if s.strip()]
+    if not signals or not query.get("vehicle_id") or not query.get("trip_id"):
+        return None
+    return SignalRequest(
+        vehicle_id=query["vehicle_id"],
+        trip_id=query["trip_id"],
+        signals=signals,
+        params=query,
+    )
+
+
+def _to_float(value: Any) -> float:
+    if value is None:
+        return math.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def _column(records: List[Dict[str, Any]], key: str) -> np.ndarray:
+    """One float64 column from row dicts; missing/null/non-numeric values become NaN."""
+    try:
+        # Fast path: every value is already numeric (or absent)
+        return np.fromiter((r.get(key, math.nan) for r in records), dtype=np.float64, count=len(records))
+    except (TypeError, ValueError):
+        return np.fromiter((_to_float(r.get(key)) for r in records), dtype=np.float64, count=len(records))
+
+
+def _to_epoch_ns(raw: List[Any]) -> np.ndarray:
+    """Convert produced_at values (ISO strings or epoch numbers) to int64 epoch ns."""
+    if not raw:
+        return np.empty(0, dtype=np.int64)
+    if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in raw):
+        nums = np.asarray(raw, dtype=np.float64)
+        magnitude = np.nanmax(np.abs(nums)) if nums.size else 0.0
+        # Guess the unit from the magnitude of present-day epoch values
+        return (nums * epoch_scale(magnitude)).astype(np.int64)
+    parsed = pd.to_datetime(pd.Series(raw, dtype=object), utc=True, errors="coerce", format="ISO8601")
+    return parsed.dt.as_unit("ns").to_numpy(dtype="datetime64[ns]").view(np.int64)
+
+
+def _compact(values: np.ndarray) -> np.ndarray:
+    """Store as float32 when that round-trips exactly, float64 otherwise."""
+    narrow = values.astype(np.float32)
+    if np.array_equal(narrow.astype(np.float64), values, equal_nan=True):
+        return narrow
+    return values
+
+
+def _make_series(timestamps: np.ndarray, values: np.ndarray, fetched_at: float) -> SignalSeries:
+    keep = ~np.isnan(values)
+    # NaT coerces to the int64 minimum
+    keep &= timestamps != np.iinfo(np.int64).min
+    timestamps, values = timestamps[keep], values[keep]
+    order = np.argsort(timestamps, kind="stable")
+    timestamps, values = timestamps[order], values[order]
+    if timestamps.size > 1:
+        # Keep the last sample for duplicated timestamps
+        last = np.append(timestamps[1:] != timestamps[:-1], True)
+        timestamps, values = timestamps[last], values[last]
+    return SignalSeries(timestamps=timestamps, values=_compact(values), fetched_at=fetched_at)
+
+
+def _extract(payload: Any) -> Tuple[Optional[List[Dict[str, Any]]], Optional[Dict[str, Any]]]:
+    """Find either row records or a signal->samples mapping in a response body."""
+    node = payload
+    for _ in range(3):
+        if isinstance(node, list):
+            return node, None
+        if not isinstance(node, dict):
+            return None, None
+        if "data" in node and isinstance(node["data"], (list, dict)):
+            node = node["data"]
+            continue
+        if isinstance(node.get("signals"), dict):
+            return None, node["signals"]
+        return None, node
+    return None, None
+
+
+def decode_signals_payload(payload: Any, signals: Iterable[str], fetched_at: Optional[float] = None) -> Dict[str, SignalSeries]:
+    """Decode a vehicle API response into one SignalSeries per requested signal.
+
+    Signals absent from the payload decode to empty series.
+    """
+    return split_signals_payload(payload, signals, fetched_at)[0]
+
+
+def split_signals_payload(
+    payload: Any, signals: Iterable[str], fetched_at: Optional[float] = None
+) -> Tuple[Dict[str, SignalSeries], List[str]]:
+    """``decode_signals_payload`` plus the requested signals the payload does not mention at all
+    (an error body, a trip not uploaded yet, a partial or unrecognised response)."""
+    fetched_at = time() if fetched_at is None else fetched_at
+    signals = list(signals)
+    decoded = _decode(payload, signals, fetched_at)
+    rows, columns = _extract(payload)
+    if rows is not None:
+        rows = [r for r in rows if isinstance(r, dict)]
+        long_form = bool(rows) and "value" in rows[0] and ("name" in rows[0] or "signal" in rows[0])
+        present = {r.get("name", r.get("signal")) for r in rows} if long_form else {k for r in rows for k in r}
+    else:
+        present = {k for k, v in (columns or {}).items() if isinstance(v, list)}
+    return decoded, [sig for sig in signals if sig not in present]
+
+
+def _decode(payload: Any, signals: List[str], fetched_at: float) -> Dict[str, SignalSeries]:
+    rows, columns = _extract(payload)
+    decoded: Dict[str, SignalSeries] = {}
+    empty = SignalSeries(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32), fetched_at)
+
+    if rows is not None:
+        rows = [r for r in rows if isinstance(r, dict)]
+        long_form = bool(rows) and "value" in rows[0] and ("name" in rows[0] or "signal" in rows[0])
+        if long_form:
+            columns = {}
+            for row in rows:
+                name = row.get("name", row.get("signal"))
+                columns.setdefault(name, []).append(row)
+        else:
+            ts = _to_epoch_ns([r.get(TIMESTAMP_FIELD) for r in rows]) if rows else np.empty(0, dtype=np.int64)
+            for sig in signals:
+                decoded[sig] = _make_series(ts, _column(rows, sig), fetched_at) if rows else empty
+            return decoded
+
+    columns = columns or {}
+    for sig in signals:
+        samples = columns.get(sig)
+        if not isinstance(samples, list) or not samples:
+            decoded[sig] = empty
+            continue
+        if isinstance(samples[0], dict):
+            ts = _to_epoch_ns([s.get(TIMESTAMP_FIELD) for s in samples])
+            vals = np.fromiter(
+                (_to_float(s.get("value", s.get(sig))) for s in samples), dtype=np.float64, count=len(samples)
+            )
+        else:
+            # Bare value arrays carry no timestamps; keep sample order
+            ts = np.arange(len(samples), dtype=np.int64)
+            vals = np.fromiter((_to_float(v) for v in samples), dtype=np.float64, count=len(samples))
+        decoded[sig] = _make_series(ts, vals, fetched_at)
+    return decoded
+
+
+def buckets_to_series(levels: Dict[str, BucketLevel]) -> Dict[str, SignalSeries]:
+    """Flatten bucket levels into ``<signal>`` (mean), ``<signal>_min``, ``_max`` and ``_count`` series."""
+    flat: Dict[str, SignalSeries] = {}
+    for name, level in levels.items():
+        flat[name] = SignalSeries(level.starts, level.mean, level.fetched_at)
+        flat[f"{name}_min"] = SignalSeries(level.starts, level.min, level.fetched_at)
+        flat[f"{name}_max"] = SignalSeries(level.starts, level.max, level.fetched_at)
+        flat[f"{name}_count"] = SignalSeries(level.starts, level.count, level.fetched_at)
+    return flat
+
+
+def series_to_payload(series: Dict[str, SignalSeries]) -> Dict[str, Any]:
+    """Render cached series as ``{"data": [{"produced_at": ..., <signal>: value, ...}]}`` rows."""
+    if not series:
+        return {"data": []}
+    frame = pd.concat(
+        {name: pd.Series(s.values.astype(np.float64), index=s.timestamps) for name, s in series.items()},
+        axis=1,
+    ).sort_index()
+    stamps = np.datetime_as_string(frame.index.to_numpy().astype("datetime64[ns]"), unit="ms", timezone="UTC")
+    names = list(frame.columns)
+    rows: List[Dict[str, Any]] = []
+    for ts, values in zip(stamps.tolist(), frame.to_numpy().tolist()):
+        row: Dict[str, Any] = {TIMESTAMP_FIELD: ts}
+        for name, value in zip(names, values):
+            if value == value:
+                row[name] = value
+        rows.append(row)
+    return {"data": rows}
+
+
+def align_series(
+    series: Dict[str, SignalSeries],
+    tolerance_ns: Optional[int] = None,
+    reference: Optional[str] = None,
+    direction: str = "backward",
+    dtype: Any = np.float32,
+) -> pd.DataFrame:
+    """As-of join of several series onto one timeline, column by column.
+
+    The timeline is the ``reference`` signal's timestamps (by default the
+    densest signal). For each other signal the latest sample at or before each
+    timestamp (``direction="backward"``) or the closest one (``"nearest"``) is
+    taken, and left as NaN when further away than ``tolerance_ns``. Lookups are
+    vectorized with ``searchsorted`` so memory stays at one typed column per
+    signal, even for hundreds of signals.
+    """
+    if direction not in ("backward", "nearest"):
+        raise ValueError("direction must be 'backward' or 'nearest'")
+    index = pd.DatetimeIndex([], tz="UTC", name=TIMESTAMP_FIELD)
+    if not series:
+        return pd.DataFrame(index=index)
+    reference = reference or max(series, key=lambda name: len(series[name]))
+    base = series[reference].timestamps
+    columns: Dict[str, np.ndarray] = {}
+    for name, s in series.items():
+        if name == reference:
+            columns[name] = s.values.astype(dtype, copy=False)
+            continue
+        column = np.full(base.shape[0], np.nan, dtype=dtype)
+        if len(s) and base.size:
+            pos = np.searchsorted(s.timestamps, base, side="right") - 1
+            if direction == "nearest":
+                after = np.minimum(pos + 1, len(s) - 1)
+                before = np.maximum(pos, 0)
+                use_after = (pos < 0) | (
+                    np.abs(s.timestamps[after] - base) < np.abs(base - s.timestamps[before])
+                )
+                pos = np.where(use_after, after, before)
+            valid = pos >= 0
+            pos = np.maximum(pos, 0)
+            if tolerance_ns is not None:
+                valid &= np.abs(base - s.timestamps[pos]) <= tolerance_ns
+            column[valid] = s.values[pos[valid]]
+        columns[name] = column
+    index = pd.DatetimeIndex(base.view("datetime64[ns]"), name=TIMESTAMP_FIELD).tz_localize("UTC")
+    return pd.DataFrame(columns, index=index, copy=False)
+
+
+class CachedResponse:
+    """Minimal stand-in for ``httpx.Response`` served from the signal store."""
+
+    status_code = 200
+    is_success = True
+
+    def __init__(self, url: str, payload: Dict[str, Any]):
+        self.url = url
+        self._payload = payload
+        self.headers = {"content-type": "application/json", "x-signal-cache": "hit"}
+
+    def json(self) -> Dict[str, Any]:
+        return self._payload
+
+    @property
+    def text(self) -> str:
+        import json
+        return json.dumps(self._payload)
+
+    @property
+    def content(self) -> bytes:
+        return self.text.encode()
+
+    def raise_for_status(self) -> "CachedResponse":
+        return self
+
+
+class SignalStore:
+    """Disk-backed signal cache with a byte-budgeted in-memory LRU in front."""
+
+    def __init__(
+        self,
+        root: str,
+        memory_budget_bytes: int,
+        live_trip_ids: Iterable[str] = (),
+        live_ttl_seconds: float = 30.0,
+        pyramid_widths_ns: Iterable[int] = (),
+        summary_compression: int = DEFAULT_COMPRESSION,
+        empty_ttl_seconds: float = 300.0,
+    ):
+        self.root = root
+        self.pyramid_widths_ns = sorted(set(pyramid_widths_ns))
+        self.summary_compression = summary_compression
+        self.memory_budget_bytes = memory_budget_bytes
+        self.live_trip_ids = {str(t) for t in live_trip_ids}
+        self.live_ttl_seconds = live_ttl_seconds
+        # A signal with no samples may just not be uploaded yet: look again after this long
+        self.empty_ttl_seconds = empty_ttl_seconds
+        # Raw series under (vehicle, trip, signal); pyramid levels and summaries under
+        # (vehicle, trip, signal, width | "summary")
+        self._memory: "OrderedDict[Tuple, Any]" = OrderedDict()
+        # Data version of live-trip entries when they were loaded
+        self._versions: Dict[Tuple, str] = {}
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bucket_reads = 0
+        self.summary_reads = 0
+        self.appends = 0
+        os.makedirs(root, exist_ok=True)
+
+    def trip_dir(self, vehicle_id: str, trip_id: str) -> str:
+        return os.path.join(self.root, _SAFE_NAME.sub("_", vehicle_id), _SAFE_NAME.sub("_", trip_id))
+
+    def _path(self, vehicle_id: str, trip_id: str, signal_name: str) -> str:
+        return os.path.join(self.trip_dir(vehicle_id, trip_id), f"{_SAFE_NAME.sub('_', signal_name)}.npz")
+
+    def _pyramid_path(self, vehicle_id: str, trip_id: str, signal_name: str) -> str:
+        return self._path(vehicle_id, trip_id, signal_name)[:-len(".npz")] + ".pyr.npz"
+
+    def _summary_path(self, vehicle_id: str, trip_id: str, signal_name: str) -> str:
+        return self._path(vehicle_id, trip_id, signal_name)[:-len(".npz")] + ".summary.json"
+
+    def _version_path(self, vehicle_id: str, trip_id: str) -> str:
+        return os.path.join(self.trip_dir(vehicle_id, trip_id), ".version")
+
+    def _follow_path(self, vehicle_id: str, trip_id: str) -> str:
+        return os.path.join(self.trip_dir(vehicle_id, trip_id), ".following")
+
+    def data_version(self, vehicle_id: str, trip_id: str) -> str:
+        """Token that changes whenever data for a live trip is stored; finished trips are always "final"."""
+        if trip_id not in self.live_trip_ids:
+            return "final"
+        try:
+            with open(self._version_path(vehicle_id, trip_id)) as fh:
+                return fh.read()
+        except OSError:
+            return "0"
+
+    def _bump_version(self, vehicle_id: str, trip_id: str) -> Optional[str]:
+        path = self._version_path(vehicle_id, trip_id)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        version = f"{time_ns()}-{os.getpid()}"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, "w") as fh:
+                fh.write(version)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Signal store version update failed for trip {trip_id}: {e}")
+            return None
+        return version
+
+    def mark_followed(self, vehicle_id: str, trip_id: str) -> None:
+        """Heartbeat of a live-trip follower: while it is recent, the trip's cached data counts as current."""
+        path = self._follow_path(vehicle_id, trip_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "a"):
+            os.utime(path)
+
+    def is_followed(self, vehicle_id: str, trip_id: str) -> bool:
+        try:
+            return time() - os.stat(self._follow_path(vehicle_id, trip_id)).st_mtime < self.live_ttl_seconds
+        except OSError:
+            return False
+
+    def cached_signals(self, vehicle_id: str, trip_id: str) -> List[str]:
+        """Signals with a stored series for the trip."""
+        try:
+            files = os.listdir(self.trip_dir(vehicle_id, trip_id))
+        except OSError:
+            return []
+        return sorted(f[:-len(".npz")] for f in files if f.endswith(".npz") and not f.endswith(".pyr.npz"))
+
+    def _is_fresh(self, vehicle_id: str, trip_id: str, item: Any) -> bool:
+        empty = item.count == 0 if isinstance(item, SignalSummary) else len(item) == 0
+        if empty and (time() - item.fetched_at) >= self.empty_ttl_seconds:
+            return False
+        if trip_id not in self.live_trip_ids:
+            return True
+        return (time() - item.fetched_at) < self.live_ttl_seconds or self.is_followed(vehicle_id, trip_id)
+
+    def _remember(self, key: Tuple, item: Any, version: Optional[str] = None) -> None:
+        with self._lock:
+            old = self._memory.pop(key, None)
+            self._versions.pop(key, None)
+            if old is not None:
+                self._memory_bytes -= old.nbytes
+            if item.nbytes > self.memory_budget_bytes:
+                return
+            self._memory[key] = item
+            if version is not None:
+                self._versions[key] = version
+            self._memory_bytes += item.nbytes
+            while self._memory_bytes > self.memory_budget_bytes and self._memory:
+                evicted_key, evicted = self._memory.popitem(last=False)
+                self._versions.pop(evicted_key, None)
+                self._memory_bytes -= evicted.nbytes
+
+    def _current(self, key: Tuple) -> Optional[Any]:
+        """In-memory entry, unless it belongs to a live trip whose data has changed since it was loaded."""
+        with self._lock:
+            item = self._memory.get(key)
+            if item is None:
+                return None
+            self._memory.move_to_end(key)
+            version = self._versions.get(key)
+        vehicle_id, trip_id = key[0], key[1]
+        if trip_id in self.live_trip_ids and version != self.data_version(vehicle_id, trip_id):
+            return None
+        return item
+
+    def _recall(self, key: Tuple) -> Optional[Any]:
+        """In-memory entry that is current and fresh."""
+        item = self._current(key)
+        if item is None or not self._is_fresh(key[0], key[1], item):
+            return None
+        return item
+
+    def _live_version(self, vehicle_id: str, trip_id: str) -> Optional[str]:
+        # Read before loading from disk, so a concurrent update at worst makes the copy look older
+        return self.data_version(vehicle_id, trip_id) if trip_id in self.live_trip_ids else None
+
+    def get(self, vehicle_id: str, trip_id: str, signal_name: str) -> Optional[SignalSeries]:
+        """Return a fresh cached series from memory or disk, or None."""
+        key = (vehicle_id, trip_id, signal_name)
+        series = self._recall(key)
+        if series is not None:
+            self.hits += 1
+            return series
+
+        version = self._live_version(vehicle_id, trip_id)
+        series = self._load_series(vehicle_id, trip_id, signal_name)
+        if series is None or not self._is_fresh(vehicle_id, trip_id, series):
+            self.misses += 1
+            return None
+        self.disk_hits += 1
+        self._remember(key, series, version)
+        return series
+
+    def _load_series(self, vehicle_id: str, trip_id: str, signal_name: str) -> Optional[SignalSeries]:
+        try:
+            with np.load(self._path(vehicle_id, trip_id, signal_name)) as npz:
+                return SignalSeries(
+                    timestamps=npz["timestamps"],
+                    values=npz["values"],
+                    fetched_at=float(npz["fetched_at"]),
+                )
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def _write(self, path: str, **arrays: Any) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as fh:
+                np.savez(fh, **arrays)
+            # Atomic so concurrent readers never see a partial file
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Signal store write failed for {path}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def _write_pyramid(self, vehicle_id: str, trip_id: str, signal_name: str, series: SignalSeries) -> List[BucketLevel]:
+        levels = build_pyramid(series.timestamps, series.values, self.pyramid_widths_ns, series.fetched_at)
+        self._save_pyramid(vehicle_id, trip_id, signal_name, levels, series.fetched_at)
+        return levels
+
+    def _save_pyramid(self, vehicle_id: str, trip_id: str, signal_name: str, levels: List[BucketLevel], fetched_at: float) -> None:
+        arrays: Dict[str, Any] = {"fetched_at": np.float64(fetched_at)}
+        for level in levels:
+            arrays.update(level.to_arrays(f"w{level.width_ns}_"))
+        self._write(self._pyramid_path(vehicle_id, trip_id, signal_name), **arrays)
+
+    def _load_pyramid(self, vehicle_id: str, trip_id: str, signal_name: str) -> Optional[List[BucketLevel]]:
+        """Every configured level of a stored pyramid, or None if it is missing or was built with other widths."""
+        try:
+            with np.load(self._pyramid_path(vehicle_id, trip_id, signal_name)) as npz:
+                fetched_at = float(npz["fetched_at"])
+                return [BucketLevel.from_arrays(npz, f"w{w}_", w, fetched_at) for w in self.pyramid_widths_ns]
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def _write_summary(self, vehicle_id: str, trip_id: str, signal_name: str, series: SignalSeries) -> SignalSummary:
+        summary = SignalSummary.from_series(series.timestamps, series.values, series.fetched_at, self.summary_compression)
+        self._save_summary(vehicle_id, trip_id, signal_name, summary)
+        return summary
+
+    def _save_summary(self, vehicle_id: str, trip_id: str, signal_name: str, summary: SignalSummary) -> None:
+        path = self._summary_path(vehicle_id, trip_id, signal_name)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w") as fh:
+                json.dump(summary.to_dict(), fh)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Signal summary write failed for {signal_name}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def put(self, vehicle_id: str, trip_id: str, signal_name: str, series: SignalSeries) -> None:
+        self._write(
+            self._path(vehicle_id, trip_id, signal_name),
+            timestamps=series.timestamps,
+            values=series.values,
+            fetched_at=np.float64(series.fetched_at),
+        )
+        if self.pyramid_widths_ns:
+            self._write_pyramid(vehicle_id, trip_id, signal_name, series)
+        summary = self._write_summary(vehicle_id, trip_id, signal_name, series)
+        self._replace_cached(vehicle_id, trip_id, signal_name, series, summary)
+
+    def _replace_cached(
+        self, vehicle_id: str, trip_id: str, signal_name: str, series: SignalSeries, summary: SignalSummary
+    ) -> None:
+        """After a series was rewritten: bump a live trip's version and cache the new copies."""
+        version = self._bump_version(vehicle_id, trip_id) if trip_id in self.live_trip_ids else None
+        with self._lock:
+            # Drop levels cached from the previous copy of this series
+            for key in [k for k in self._memory if len(k) == 4 and k[:3] == (vehicle_id, trip_id, signal_name)]:
+                self._memory_bytes -= self._memory.pop(key).nbytes
+                self._versions.pop(key, None)
+        self._remember((vehicle_id, trip_id, signal_name, "summary"), summary, version)
+        self._remember((vehicle_id, trip_id, signal_name), series, version)
+
+    def append(self, vehicle_id: str, trip_id: str, signal_name: str, new: SignalSeries) -> int:
+        """Add the samples of ``new`` that are later than the stored series; returns how many.
+
+        The summary is merged with a summary of the new samples and every
+        pyramid level with the new samples' buckets, so the cost depends on the
+        size of the update, not of the trip (the raw file is still rewritten).
+        Without a stored series this is ``put``.
+        """
+        key = (vehicle_id, trip_id, signal_name)
+        current = self._current(key) or self._load_series(vehicle_id, trip_id, signal_name)
+        if current is None:
+            self.put(vehicle_id, trip_id, signal_name, new)
+            return len(new)
+        if current.end_ns is not None:
+            new = new.between(current.end_ns + 1, np.iinfo(np.int64).max)
+        if not len(new):
+            return 0
+        series = SignalSeries(
+            timestamps=np.concatenate((current.timestamps, new.timestamps)),
+            values=np.concatenate((current.values, new.values)),
+            fetched_at=new.fetched_at,
+        )
+        self._write(
+            self._path(vehicle_id, trip_id, signal_name),
+            timestamps=series.timestamps,
+            values=series.values,
+            fetched_at=np.float64(series.fetched_at),
+        )
+        if self.pyramid_widths_ns:
+            levels = self._load_pyramid(vehicle_id, trip_id, signal_name)
+            if levels is None:
+                self._write_pyramid(vehicle_id, trip_id, signal_name, series)
+            else:
+                added = build_pyramid(new.timestamps, new.values, self.pyramid_widths_ns, new.fetched_at)
+                levels = [old.append(level) for old, level in zip(levels, added)]
+                self._save_pyramid(vehicle_id, trip_id, signal_name, levels, new.fetched_at)
+        summary = self._current((vehicle_id, trip_id, signal_name, "summary")) or self._load_summary(vehicle_id, trip_id, signal_name)
+        if summary is None or summary.count != len(current):
+            summary = SignalSummary.from_series(series.timestamps, series.values, series.fetched_at, self.summary_compression)
+        else:
+            summary = summary.merge(
+                SignalSummary.from_series(new.timestamps, new.values, new.fetched_at, self.summary_compression)
+            )
+        self._save_summary(vehicle_id, trip_id, signal_name, summary)
+        self._replace_cached(vehicle_id, trip_id, signal_name, series, summary)
+        self.appends += 1
+        return len(new)
+
+    def last_timestamp(self, vehicle_id: str, trip_id: str, signal_name: str) -> Optional[int]:
+        """Epoch ns of the latest stored sample, read from the summary (None if not stored or empty)."""
+        summary = self._current((vehicle_id, trip_id, signal_name, "summary")) or self._load_summary(vehicle_id, trip_id, signal_name)
+        if summary is None:
+            series = self._load_series(vehicle_id, trip_id, signal_name)
+            return series.end_ns if series is not None else None
+        return summary.last_ns
+
+    def _load_summary(self, vehicle_id: str, trip_id: str, signal_name: str) -> Optional[SignalSummary]:
+        try:
+            with open(self._summary_path(vehicle_id, trip_id, signal_name)) as fh:
+                return SignalSummary.from_dict(json.load(fh))
+        except (OSError, KeyError, TypeError, ValueError):
+            return None
+
+    def get_summary(self, vehicle_id: str, trip_id: str, signal_name: str) -> Optional[SignalSummary]:
+        """Return the fresh summary of a cached signal without loading its samples, or None."""
+        key = (vehicle_id, trip_id, signal_name, "summary")
+        summary = self._recall(key)
+        if summary is None:
+            version = self._live_version(vehicle_id, trip_id)
+            summary = self._load_summary(vehicle_id, trip_id, signal_name)
+            if summary is None:
+                # Cached before summaries existed: build it from the raw series
+                series = self.get(vehicle_id, trip_id, signal_name)
+                if series is None:
+                    return None
+                summary = self._write_summary(vehicle_id, trip_id, signal_name, series)
+            if not self._is_fresh(vehicle_id, trip_id, summary):
+                return None
+            self._remember(key, summary, version)
+        self.summary_reads += 1
+        return summary
+
+    def summaries(self, vehicle_id: str, trip_id: str, signals: Iterable[str]) -> Dict[str, Optional[SignalSummary]]:
+        return {name: self.get_summary(vehicle_id, trip_id, name) for name in signals}
+
+    def get_buckets(self, vehicle_id: str, trip_id: str, signal_name: str, width_ns: int) -> Optional[BucketLevel]:
+        """Return a fresh cached signal aggregated into ``width_ns`` buckets, or None.
+
+        Reads only the coarsest pyramid level that divides ``width_ns``;
+        falls back to bucketing the raw series when no level does.
+        """
+        base_width = best_level_width(self.pyramid_widths_ns, width_ns)
+        if base_width is None:
+            series = self.get(vehicle_id, trip_id, signal_name)
+            return None if series is None else bucket_series(series.timestamps, series.values, width_ns, series.fetched_at)
+
+        key = (vehicle_id, trip_id, signal_name, base_width)
+        level = self._recall(key)
+        if level is None:
+            version = self._live_version(vehicle_id, trip_id)
+            try:
+                with np.load(self._pyramid_path(vehicle_id, trip_id, signal_name)) as npz:
+                    # NpzFile reads members lazily: only this level's arrays are loaded
+                    level = BucketLevel.from_arrays(npz, f"w{base_width}_", base_width, float(npz["fetched_at"]))
+            except (OSError, KeyError, ValueError):
+                # No pyramid yet (or built with other widths): rebuild it from the raw series
+                series = self.get(vehicle_id, trip_id, signal_name)
+                if series is None:
+                    return None
+                levels = self._write_pyramid(vehicle_id, trip_id, signal_name, series)
+                level = next(l for l in levels if l.width_ns == base_width)
+            if not self._is_fresh(vehicle_id, trip_id, level):
+                return None
+            self._remember(key, level, version)
+        self.bucket_reads += 1
+        return level.rebucket(width_ns)
+
+    @contextmanager
+    def fetch_lock(self, vehicle_id: str, trip_id: str, signals: Iterable[str]) -> Iterator[None]:
+        """Hold per-signal file locks so only one process fetches a given signal at a time."""
+        if fcntl is None:
+            yield
+            return
+        handles = []
+        try:
+            # Sorted acquisition keeps concurrent overlapping fetches deadlock-free
+            for name in sorted(set(signals)):
+                path = self._path(vehicle_id, trip_id, name)[:-len(".npz")] + ".lock"
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                handle = open(path, "a+")
+                handles.append(handle)
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+            yield
+        finally:
+            for handle in handles:
+                try:
+                    fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+                finally:
+                    handle.close()
+
+    def missing(self, vehicle_id: str, trip_id: str, signals: Iterable[str]) -> List[str]:
+        return [s for s in signals if self.get(vehicle_id, trip_id, s) is None]
+
+    def ingest(self, vehicle_id: str, trip_id: str, payload: Any, signals: Iterable[str]) -> Dict[str, SignalSeries]:
+        """Decode an upstream response and store the requested signals.
+
+        When the response mentions none of them (an error body, a trip not
+        uploaded yet) nothing is stored, so the next read fetches again. Signals
+        missing from a response that has others are stored empty, and empty
+        series expire after ``empty_ttl_seconds``.
+        """
+        decoded, absent = split_signals_payload(payload, signals)
+        if len(absent) == len(decoded):
+            if decoded:
+                logger.warning(f"Vehicle API response for trip {trip_id} has none of {sorted(decoded)[:5]}; not caching")
+            return decoded
+        for name, series in decoded.items():
+            self.put(vehicle_id, trip_id, name, series)
+        return decoded
+
+    def ensure(
+        self,
+        vehicle_id: str,
+        trip_id: str,
+        signals: Iterable[str],
+        fetch: Callable[[List[str]], Any],
+        batch_size: int = 0,
+    ) -> Dict[str, SignalSeries]:
+        """Return all requested series, fetching only the missing ones in one upstream call
+        (or in batches of ``batch_size`` signals to keep request URLs bounded).
+
+        Concurrent callers in other processes that need the same signals wait
+        on the fetch lock and then read what the first one stored.
+        """
+        signals = list(dict.fromkeys(signals))
+        found: Dict[str, SignalSeries] = {}
+        missing: List[str] = []
+        for name in signals:
+            series = self.get(vehicle_id, trip_id, name)
+            if series is None:
+                missing.append(name)
+            else:
+                found[name] = series
+        if missing:
+            with self.fetch_lock(vehicle_id, trip_id, missing):
+                still_missing = []
+                for name in missing:
+                    series = self.get(vehicle_id, trip_id, name)
+                    if series is None:
+                        still_missing.append(name)
+                    else:
+                        found[name] = series
+                step = batch_size if batch_size > 0 else max(1, len(still_missing))
+                for i in range(0, len(still_missing), step):
+                    batch = still_missing[i:i + step]
+                    found.update(self.ingest(vehicle_id, trip_id, fetch(batch), batch))
+        return {name: found[name] for name in signals}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = len(self._memory)
+            memory_bytes = self._memory_bytes
+        return {
+            "memory_entries": entries,
+            "memory_bytes": memory_bytes,
+            "memory_budget_bytes": self.memory_budget_bytes,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "bucket_reads": self.bucket_reads,
+            "summary_reads": self.summary_reads,
+            "appends": self.appends,
+        }
@@ -0,0 +1,229 @@
+"""Per-signal summary index: exact moments plus a mergeable quantile sketch.
+
+A ``SignalSummary`` is built once when a series is ingested and answers
+count/min/max/mean/stddev/first/last in O(1) and quantiles approximately from
+a t-digest. Summaries merge exactly (moments via Chan et al.'s parallel
+update), so partial summaries of one signal can be combined without the raw
+samples.
+"""
+import math
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+DEFAULT_COMPRESSION = 200
+
+
+def _iso(ns: Optional[int]) -> Optional[str]:
+    if ns is None:
+        return None
+    return str(np.datetime_as_string(np.datetime64(ns, "ns"), unit="ms", timezone="UTC"))
+
+
+class QuantileSketch:
+    """Merging t-digest: weighted centroids, at most about ``compression`` of them.
+
+    The arcsine scale function keeps centroids small near both tails, so
+    extreme quantiles stay accurate while the sketch stays a few KB.
+    """
+
+    def __init__(
+        self,
+        means: Optional[np.ndarray] = None,
+        weights: Optional[np.ndarray] = None,
+        min_value: float = math.nan,
+        max_value: float = math.nan,
+        compression: int = DEFAULT_COMPRESSION,
+    ):
+        self.compression = compression
+        self.means = np.empty(0, dtype=np.float64) if means is None else np.asarray(means, dtype=np.float64)
+        self.weights = np.empty(0, dtype=np.float64) if weights is None else np.asarray(weights, dtype=np.float64)
+        self.min = min_value
+        self.max = max_value
+        self._compress()
+
+    @classmethod
+    def from_values(cls, values: np.ndarray, compression: int = DEFAULT_COMPRESSION) -> "QuantileSketch":
+        values = np.asarray(values, dtype=np.float64)
+        if values.size == 0:
+            return cls(compression=compression)
+        return cls(values, np.ones(values.size), float(values.min()), float(values.max()), compression)
+
+    @property
+    def total(self) -> float:
+        return float(self.weights.sum())
+
+    def _compress(self) -> None:
+        if self.means.size <= 1:
+            return
+        order = np.argsort(self.means, kind="stable")
+        means, weights = self.means[order], self.weights[order]
+        cum = np.cumsum(weights)
+        q_left = (cum - weights) / cum[-1]
+        # Centroids whose left edge falls in the same k-unit are merged
+        k = np.floor(self.compression * (np.arcsin(2 * q_left - 1) / np.pi + 0.5)).astype(np.int64)
+        edges = np.concatenate(([0], np.flatnonzero(k[1:] != k[:-1]) + 1))
+        self.weights = np.add.reduceat(weights, edges)
+        self.means = np.add.reduceat(means * weights, edges) / self.weights
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        return QuantileSketch(
+            np.concatenate((self.means, other.means)),
+            np.concatenate((self.weights, other.weights)),
+            float(np.fmin(self.min, other.min)),
+            float(np.fmax(self.max, other.max)),
+            max(self.compression, other.compression),
+        )
+
+    def quantile(self, q: float) -> float:
+        """Approximate value at quantile ``q`` in [0, 1]; NaN when empty."""
+        if self.means.size == 0:
+            return math.nan
+        q = min(max(q, 0.0), 1.0)
+        total = self.total
+        centers = np.cumsum(self.weights) - self.weights / 2
+        xs = np.concatenate(([0.0], centers, [total]))
+        ys = np.concatenate(([self.min], self.means, [self.max]))
+        return float(np.interp(q * total, xs, ys))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "compression": self.compression,
+            "means": self.means.tolist(),
+            "weights": self.weights.tolist(),
+            "min": None if math.isnan(self.min) else self.min,
+            "max": None if math.isnan(self.max) else self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "QuantileSketch":
+        return cls(
+            np.asarray(data["means"], dtype=np.float64),
+            np.asarray(data["weights"], dtype=np.float64),
+            math.nan if data.get("min") is None else data["min"],
+            math.nan if data.get("max") is None else data["max"],
+            data.get("compression", DEFAULT_COMPRESSION),
+        )
+
+
+@dataclass
+class SignalSummary:
+    """Summary statistics of one signal of one trip."""
+    count: int = 0
+    min: float = math.nan
+    max: float = math.nan
+    mean: float = math.nan
+    m2: float = 0.0  # sum of squared deviations from the mean
+    first_ns: Optional[int] = None
+    last_ns: Optional[int] = None
+    sketch: QuantileSketch = field(default_factory=QuantileSketch)
+    fetched_at: float = 0.0
+
+    @classmethod
+    def from_series(
+        cls,
+        timestamps: np.ndarray,
+        values: np.ndarray,
+        fetched_at: float,
+        compression: int = DEFAULT_COMPRESSION,
+    ) -> "SignalSummary":
+        values = np.asarray(values, dtype=np.float64)
+        if values.size == 0:
+            return cls(sketch=QuantileSketch(compression=compression), fetched_at=fetched_at)
+        mean = float(values.mean())
+        return cls(
+            count=int(values.size),
+            min=float(values.min()),
+            max=float(values.max()),
+            mean=mean,
+            m2=float(np.square(values - mean).sum()),
+            first_ns=int(timestamps[0]),
+            last_ns=int(timestamps[-1]),
+            sketch=QuantileSketch.from_values(values, compression),
+            fetched_at=fetched_at,
+        )
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.sketch.means.nbytes + self.sketch.weights.nbytes + 128)
+
+    @property
+    def stddev(self) -> float:
+        """Sample standard deviation (ddof=1), 0 for a single sample."""
+        if self.count == 0:
+            return math.nan
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    def quantile(self, q: float) -> float:
+        return self.sketch.quantile(q)
+
+    def merge(self, other: "SignalSummary") -> "SignalSummary":
+        """Summary of both sample sets combined (they must not overlap)."""
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            return other
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        return SignalSummary(
+            count=count,
+            min=min(self.min, other.min),
+            max=max(self.max, other.max),
+            mean=self.mean + delta * other.count / count,
+            m2=self.m2 + other.m2 + delta * delta * self.count * other.count / count,
+            first_ns=min(self.first_ns, other.first_ns),
+            last_ns=max(self.last_ns, other.last_ns),
+            sketch=self.sketch.merge(other.sketch),
+            fetched_at=max(self.fetched_at, other.fetched_at),
+        )
+
+    def describe(self) -> Dict[str, Any]:
+        """JSON-friendly view for the API; quantiles are sketch estimates."""
+        def num(value: float) -> Optional[float]:
+            return None if value != value else value
+
+        return {
+            "count": self.count,
+            "min": num(self.min),
+            "max": num(self.max),
+            "mean": num(self.mean),
+            "stddev": num(self.stddev),
+            "first": _iso(self.first_ns),
+            "last": _iso(self.last_ns),
+            "p50": num(self.quantile(0.5)),
+            "p95": num(self.quantile(0.95)),
+            "p99": num(self.quantile(0.99)),
+            "centroids": int(self.sketch.means.size),
+            "fetched_at": self.fetched_at,
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "min": None if self.count == 0 else self.min,
+            "max": None if self.count == 0 else self.max,
+            "mean": None if self.count == 0 else self.mean,
+            "m2": self.m2,
+            "first_ns": self.first_ns,
+            "last_ns": self.last_ns,
+            "sketch": self.sketch.to_dict(),
+            "fetched_at": self.fetched_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "SignalSummary":
+        def num(value: Optional[float]) -> float:
+            return math.nan if value is None else float(value)
+
+        return cls(
+            count=int(data["count"]),
+            min=num(data["min"]),
+            max=num(data["max"]),
+            mean=num(data["mean"]),
+            m2=float(data["m2"]),
+            first_ns=data["first_ns"],
+            last_ns=data["last_ns"],
+            sketch=QuantileSketch.from_dict(data["sketch"]),
+            fetched_at=float(data["fetched_at"]),
+        )
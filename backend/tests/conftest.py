@@ -0,0 +1,14 @@
+"""Test setup: backend modules import each other flat (as ``main.py`` does), and
+``main`` is configured from the environment at import time, so point its caches
+at a scratch directory before any test imports it."""
+import os
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+os.environ.setdefault("SIGNAL_CACHE_DIR", tempfile.mkdtemp(prefix="signal-cache-"))
+os.environ.setdefault("GEMINI_API_KEY", "test-key")
+os.environ.setdefault("CACHE_BACKEND", "memory")
@@ -0,0 +1,113 @@
+import sqlite3
+
+import pytest
+
+from cache import LRUCache, SQLiteCache, create_cache
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "cache.sqlite3")
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert "b" not in cache
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_lru_expires_entries(monkeypatch):
+    cache = LRUCache(10, ttl_seconds=10)
+    cache.set("a", 1)
+    monkeypatch.setattr("cache.time", lambda: 1e12)
+    assert cache.get("a") is None
+
+
+def test_lru_persists_to_json(tmp_path):
+    path = str(tmp_path / "scripts.json")
+    cache = LRUCache(10, persist_path=path)
+    cache.set("a", {"script": "x"})
+    cache.save()
+    assert LRUCache(10, persist_path=path).get("a") == {"script": "x"}
+
+
+def test_sqlite_is_shared_between_instances(db_path):
+    writer = SQLiteCache(db_path, "scripts", 10)
+    reader = SQLiteCache(db_path, "scripts", 10)
+    other = SQLiteCache(db_path, "results", 10)
+    writer.set("k", {"script": "x"})
+    assert reader.get("k") == {"script": "x"}
+    assert other.get("k") is None
+    value, age = reader.get_with_age("k")
+    assert 0 <= age < 5
+
+
+def test_sqlite_expires_entries(db_path, monkeypatch):
+    cache = SQLiteCache(db_path, "results", 10, ttl_seconds=10)
+    cache.set("k", 1)
+    monkeypatch.setattr("cache.time", lambda: 1e12)
+    assert cache.get("k") is None
+    cache.set("other", 2)
+    assert len(cache) == 1 and cache.stats()["expirations"] == 1
+
+
+def test_sqlite_lru_touch_is_written_with_the_next_set(db_path, monkeypatch):
+    clock = iter(range(100, 200))
+    monkeypatch.setattr("cache.time", lambda: float(next(clock)))
+    cache = SQLiteCache(db_path, "scripts", 2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # now more recent than "b", but only in this process
+    cache.set("c", 3)
+    assert cache.get("a") == 1 and cache.get("b") is None and cache.get("c") == 3
+
+
+def test_sqlite_lookups_do_not_write(db_path):
+    cache = SQLiteCache(db_path, "scripts", 10, timeout=0.05)
+    cache.set("k", 1)
+    blocker = sqlite3.connect(db_path, isolation_level=None)
+    blocker.execute("BEGIN IMMEDIATE")
+    try:
+        # Another process holds the write lock: a hit is still served
+        assert cache.get("k") == 1
+        assert cache.stats()["errors"] == 0
+    finally:
+        blocker.execute("ROLLBACK")
+        blocker.close()
+
+
+def test_sqlite_locked_write_is_skipped(db_path):
+    cache = SQLiteCache(db_path, "results", 10, timeout=0.05)
+    blocker = sqlite3.connect(db_path, isolation_level=None)
+    blocker.execute("BEGIN IMMEDIATE")
+    try:
+        cache.set("k", 1)  # must not raise
+    finally:
+        blocker.execute("ROLLBACK")
+        blocker.close()
+    assert cache.get("k") is None
+    assert cache.stats()["errors"] == 1
+    cache.set("k", 1)
+    assert cache.get("k") == 1
+
+
+def test_sqlite_read_error_is_a_miss(db_path):
+    cache = SQLiteCache(db_path, "results", 10)
+    cache.set("k", 1)
+    other = sqlite3.connect(db_path, isolation_level=None)
+    other.execute("DROP TABLE cache")
+    other.close()
+    assert cache.get("k") is None
+    assert cache.stats()["errors"] >= 1
+
+
+def test_create_cache(db_path):
+    assert isinstance(create_cache("memory", "scripts", 10), LRUCache)
+    assert isinstance(create_cache("sqlite", "scripts", 10, sqlite_path=db_path), SQLiteCache)
+    with pytest.raises(ValueError):
+        create_cache("redis", "scripts", 10)
@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+
+from downsample import (
+    BucketLevel,
+    TimeWindow,
+    best_level_width,
+    bucket_series,
+    build_pyramid,
+    parse_duration_ns,
+    parse_levels,
+    parse_time_ns,
+)
+from signal_store import SignalSeries, SignalStore
+
+S = 10**9
+MIN = 60 * S
+T0 = 1_714_557_600 * S  # 2024-05-01T10:00:00Z
+LEVELS = parse_levels("1s,10s,1min,10min")
+
+
+def test_parse_times_and_durations():
+    assert parse_time_ns("2024-05-01T10:00:00Z") == T0
+    assert parse_time_ns("2024-05-01T10:00:00") == T0  # naive means UTC
+    assert parse_time_ns(1_714_557_600) == parse_time_ns(1_714_557_600_000) == parse_time_ns(str(T0)) == T0
+    assert parse_duration_ns("5min") == parse_duration_ns(300) == 5 * MIN
+    assert LEVELS == [S, 10 * S, MIN, 10 * MIN]
+    with pytest.raises(ValueError):
+        parse_duration_ns("0s")
+
+
+def test_last_n_minutes_counts_back_from_the_end_of_the_data():
+    window = TimeWindow.from_params({"last": "10min"})
+    assert not window.is_unbounded
+    lo, hi = window.bounds(T0 + 60 * MIN)
+    assert (lo, hi) == (T0 + 50 * MIN, np.iinfo(np.int64).max)
+    # ... or from an explicit end, and never before an explicit start
+    window = TimeWindow.from_params({"last": "10min", "end": "2024-05-01T10:30:00Z", "start": "2024-05-01T10:25:00Z"})
+    assert window.bounds(T0 + 60 * MIN) == (T0 + 25 * MIN, T0 + 30 * MIN)
+    # No data to anchor to: nothing is cut
+    assert TimeWindow(last_ns=10 * MIN).bounds(None)[0] == np.iinfo(np.int64).min
+
+
+def test_open_ended_windows():
+    ns_min, ns_max = np.iinfo(np.int64).min, np.iinfo(np.int64).max
+    assert TimeWindow.from_params({"start": "2024-05-01T10:05:00Z"}).bounds(T0 + MIN) == (T0 + 5 * MIN, ns_max)
+    assert TimeWindow.from_params({"end": "2024-05-01T10:05:00Z", "last": ""}).bounds(None) == (ns_min, T0 + 5 * MIN)
+    assert TimeWindow.from_params({}).is_unbounded
+
+    ts = T0 + np.arange(10, dtype=np.int64) * MIN
+    series = SignalSeries(ts, np.arange(10, dtype=np.float32), 0.0)
+    lo, hi = TimeWindow.from_params({"start": "2024-05-01T10:05:00Z"}).bounds(series.end_ns)
+    assert series.between(lo, hi).values.tolist() == [5, 6, 7, 8, 9]
+    lo, hi = TimeWindow.from_params({"last": "3min"}).bounds(series.end_ns)
+    assert series.between(lo, hi).values.tolist() == [6, 7, 8, 9]
+
+
+def test_bucket_window_rounds_out_to_whole_buckets():
+    ts = T0 + np.arange(0, 600, dtype=np.int64) * S
+    level = bucket_series(ts, np.ones(600), MIN, 0.0)
+    assert len(level) == 10
+    part = level.window(T0 + 90 * S, T0 + 150 * S)
+    assert part.starts.tolist() == [T0 + MIN, T0 + 2 * MIN]
+    assert part.count.tolist() == [60, 60]
+    assert len(level.window(np.iinfo(np.int64).min, T0)) == 1
+
+
+@pytest.mark.parametrize("resolution, expected", [
+    (S, S),
+    (30 * S, 10 * S),
+    (2 * MIN, MIN),
+    (MIN, MIN),
+    (60 * MIN, 10 * MIN),
+    (7 * S, S),
+    (S // 2, None),
+])
+def test_coarsest_dividing_level_is_chosen(resolution, expected):
+    assert best_level_width(LEVELS, resolution) == expected
+
+
+def test_pyramid_levels_match_direct_bucketing(tmp_path):
+    rng = np.random.default_rng(1)
+    ts = np.sort(T0 + rng.integers(0, 30 * MIN, 5000)).astype(np.int64)
+    values = rng.normal(size=5000).astype(np.float32)
+    for level in build_pyramid(ts, values, LEVELS, 0.0):
+        direct = bucket_series(ts, values, level.width_ns, 0.0)
+        assert np.array_equal(level.starts, direct.starts) and np.array_equal(level.count, direct.count)
+        assert np.allclose(level.sum, direct.sum) and np.array_equal(level.min, direct.min)
+
+    store = SignalStore(str(tmp_path), 10**8, pyramid_widths_ns=LEVELS)
+    store.put("v", "1", "a", SignalSeries(ts, values, 0.0))
+    for resolution in (30 * S, 2 * MIN, 7 * S, S // 2):
+        read = store.get_buckets("v", "1", "a", resolution)
+        direct = bucket_series(ts, values, resolution, 0.0)
+        assert isinstance(read, BucketLevel) and read.width_ns == resolution
+        assert np.array_equal(read.starts, direct.starts) and np.array_equal(read.count, direct.count)
+        assert np.allclose(read.sum, direct.sum)
+    # Only resolutions some level divides read the pyramid; the others bucket the raw series
+    assert store.stats()["bucket_reads"] == 3
@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+from executor import ScriptExecutor, ScriptFailedError, _Worker
+
+
+class _DeadProcess:
+    def is_alive(self):
+        return False
+
+    def kill(self):
+        pass
+
+    def join(self, timeout=None):
+        pass
+
+
+class _Conn:
+    def close(self):
+        pass
+
+
+def _executor(**kwargs):
+    executor = ScriptExecutor(1, config={}, timeout=kwargs.pop("timeout", 1.0), **kwargs)
+    executor.RESPAWN_BACKOFF_SECONDS = 0.01
+    return executor
+
+
+def test_failed_respawn_is_retried_with_backoff(monkeypatch):
+    executor = _executor()
+    replacement = _Worker(process=_DeadProcess(), conn=_Conn())
+    attempts = []
+
+    async def spawn():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise ScriptFailedError("Script worker did not become ready in time")
+        return replacement
+
+    monkeypatch.setattr(executor, "_spawn", spawn)
+
+    async def scenario():
+        executor._idle = asyncio.Queue()
+        dead = _Worker(process=_DeadProcess(), conn=_Conn())
+        executor._workers.append(dead)
+        await executor._replace(dead)
+        return executor._idle.get_nowait()
+
+    assert asyncio.run(scenario()) is replacement
+    assert len(attempts) == 3
+    assert executor.stats()["respawn_failures"] == 2
+
+
+def test_run_without_free_worker_fails_after_the_timeout():
+    executor = _executor(timeout=0.2)
+
+    async def scenario():
+        executor._idle = asyncio.Queue()
+        executor._started = True
+        await executor.run(compile("x = 1", "<script>", "exec"), {})
+
+    with pytest.raises(ScriptFailedError, match="No script worker became free"):
+        asyncio.run(asyncio.wait_for(scenario(), 5))
+
+
+def test_worker_freed_as_the_wait_is_cancelled_stays_in_the_pool():
+    executor = _executor(timeout=5)
+    worker = _Worker(process=_DeadProcess(), conn=_Conn())
+
+    async def scenario():
+        executor._idle = asyncio.Queue()
+        executor._started = True
+        waiting = asyncio.ensure_future(executor.run(compile("x = 1", "<script>", "exec"), {}))
+        await asyncio.sleep(0.01)
+        # The worker is handed over and the caller gives up in the same loop iteration
+        executor._idle.put_nowait(worker)
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        return executor._idle.qsize(), executor._idle.get_nowait()
+
+    assert asyncio.run(scenario()) == (1, worker)
@@ -0,0 +1,109 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+import main
+from fast_path import QueryPlan, execute_plan, execute_plan_from_summary, plan_query, summary_supports
+from query_parser import canonicalize_query
+from signal_catalog import SignalCatalog
+from signal_store import SignalSeries
+from summary import SignalSummary
+
+CATALOG = SignalCatalog.load()
+
+
+def plan(question, default_trip="4"):
+    return plan_query(canonicalize_query(question, CATALOG), default_trip)
+
+
+def series(values):
+    values = np.asarray(values, dtype=np.float32)
+    return SignalSeries(np.arange(values.size, dtype=np.int64) * 10**9, values, 0.0)
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("max mobile_speed", {"signal": "mobile_speed", "trip_id": "4", "ops": ["max"]}),
+    ("max mobile speed on trip 5", {"signal": "mobile_speed", "trip_id": "5", "ops": ["max"]}),
+    ("min and max mobile_speed", {"signal": "mobile_speed", "trip_id": "4", "ops": ["min", "max"]}),
+    ("95th percentile of mobile_speed on trip 5", {"signal": "mobile_speed", "trip_id": "5", "percentile": 95.0}),
+    ("top 5 mobile_speed values", {"signal": "mobile_speed", "trip_id": "4", "ops": ["top"], "top_n": 5}),
+    ("bottom 3 mobile_speed", {"signal": "mobile_speed", "trip_id": "4", "ops": ["bottom"], "top_n": 3}),
+])
+def test_simple_aggregates_are_planned(question, expected):
+    assert plan(question).to_dict() == expected
+
+
+@pytest.mark.parametrize("question", [
+    # time windows
+    "max mobile_speed in the last 10 minutes",
+    "max mobile_speed between 10:00 and 10:05",
+    "mobile_speed over 30 seconds",
+    # comparisons
+    "is mobile_speed higher than inverter current dc",
+    "compare max mobile_speed on trip 5 and trip 6",
+    # thresholds
+    "how many times mobile_speed above 100",
+    # units
+    "max mobile_speed in mph",
+    "max mobile_speed in km/h",
+    # no known signal, or out of range
+    "average speed",
+    "top 500 mobile_speed",
+    "150th percentile of mobile_speed",
+])
+def test_anything_else_goes_to_the_llm(question):
+    assert plan(question) is None
+
+
+def test_answers_are_formatted():
+    data = series([3.0, 1.0, 4.0, 1.5, 9.0])
+    answer = execute_plan(QueryPlan("mobile_speed", "5", ops=["min", "max", "mean", "count", "range"]), data)
+    assert answer == "mobile_speed for trip 5 — Min: 1; Max: 9; Mean: 3.7; Sample count: 5; Range: 8"
+    assert execute_plan(QueryPlan("mobile_speed", "5", ops=["top"], top_n=2), data) == "mobile_speed for trip 5 — Top 2: 9, 4"
+    assert execute_plan(QueryPlan("mobile_speed", "5", ops=["bottom"], top_n=2), data) == "mobile_speed for trip 5 — Bottom 2: 1, 1.5"
+    assert execute_plan(QueryPlan("mobile_speed", "5", percentile=50.0), data) == "mobile_speed for trip 5 — P50: 3"
+
+
+def test_summary_answers_match_the_samples():
+    data = series([3.0, 1.0, 4.0, 1.5, 9.0])
+    summary = SignalSummary.from_series(data.timestamps, data.values, 0.0)
+    query = QueryPlan("mobile_speed", "5", ops=["min", "max", "mean", "count"])
+    assert summary_supports(query)
+    assert execute_plan_from_summary(query, summary) == execute_plan(query, data)
+    assert not summary_supports(QueryPlan("mobile_speed", "5", ops=["top"], top_n=2))
+
+
+def test_no_data():
+    query = QueryPlan("mobile_speed", "404", ops=["max"])
+    assert execute_plan(query, None) == "No data found for mobile_speed for trip 404."
+    assert execute_plan(query, series([])) == "No data found for mobile_speed for trip 404."
+
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Vehicle API that has no data for any trip; returns the list of requested signal batches."""
+    calls = []
+
+    async def fetch_vehicle_data(signals, trip_id, hints=None):
+        calls.append((signals, trip_id))
+        return {"error": f"trip {trip_id} not found"}
+
+    async def generate_pandas_script(message, params):
+        raise AssertionError("the fast path fell back to Gemini")
+
+    monkeypatch.setattr(main, "fetch_vehicle_data", fetch_vehicle_data)
+    monkeypatch.setattr(main, "generate_pandas_script", generate_pandas_script)
+    monkeypatch.setattr(main, "FAST_PATH_ENABLED", True)
+    return calls
+
+
+@pytest.mark.parametrize("question", ["max mobile_speed on trip 404", "median mobile_speed on trip 405"])
+def test_trip_without_data_is_answered_after_one_fetch(upstream, question):
+    response = asyncio.run(main.process_query(question))
+    assert response.success
+    assert response.message.startswith("No data found for mobile_speed for trip 40")
+    assert response.data["debug"]["path"] == "fast_path"
+    assert response.data["debug"]["samples"] == 0
+    assert len(upstream) == 1
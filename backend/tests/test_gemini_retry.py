@@ -0,0 +1,73 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+import main
+from upstream import AsyncRateLimiter, parse_retry_after, retry_delay
+
+OK = {"candidates": [{"content": {"parts": [{"text": "print(1)"}]}}]}
+
+
+@pytest.fixture
+def gemini(monkeypatch):
+    """Serve Gemini calls from a list of (status, headers) answers; returns the requests seen."""
+    answers = []
+    seen = []
+    pauses = []
+
+    def handler(request):
+        seen.append(request)
+        status, headers = answers.pop(0) if answers else (200, {})
+        return httpx.Response(status, headers=headers, json=OK if status == 200 else {"error": {}})
+
+    limiter = AsyncRateLimiter(0, 1, 4)
+    original_pause = limiter.pause
+    monkeypatch.setattr(limiter, "pause", lambda seconds: (pauses.append(seconds), original_pause(seconds)))
+    monkeypatch.setattr(main, "gemini_limiter", limiter)
+    monkeypatch.setattr(main, "GEMINI_RETRY_BACKOFF", 0.01)
+    monkeypatch.setattr(main, "GEMINI_MAX_RETRIES", 2)
+    monkeypatch.setattr(main, "_http_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    return answers, seen, pauses
+
+
+def test_429_without_retry_after_backs_off_and_retries(gemini):
+    answers, seen, pauses = gemini
+    answers.extend([(429, {}), (429, {})])
+    assert asyncio.run(main.call_gemini("prompt")) == "print(1)"
+    assert len(seen) == 3
+    assert len(pauses) == 2 and all(0 <= p <= 0.04 for p in pauses)
+
+
+def test_429_without_retry_after_gives_up_after_max_retries(gemini):
+    answers, seen, pauses = gemini
+    answers.extend([(429, {})] * 3)
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(main.call_gemini("prompt"))
+    assert excinfo.value.status_code == 429
+    assert not excinfo.value.headers
+    assert len(seen) == 3
+
+
+def test_long_retry_after_is_passed_to_the_caller(gemini):
+    answers, seen, pauses = gemini
+    answers.append((429, {"Retry-After": "120"}))
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(main.call_gemini("prompt"))
+    assert excinfo.value.headers == {"Retry-After": "120"}
+    assert len(seen) == 1 and not pauses
+
+
+def test_short_retry_after_is_honoured(gemini, monkeypatch):
+    answers, seen, pauses = gemini
+    answers.append((429, {"Retry-After": "0"}))
+    assert asyncio.run(main.call_gemini("prompt")) == "print(1)"
+    assert len(seen) == 2 and len(pauses) == 1
+
+
+def test_retry_delay():
+    assert 0 <= retry_delay(3, 0.5) <= 4.0
+    assert 10 <= retry_delay(0, 0.5, "10") <= 10.5
+    assert retry_delay(0, 1.0, "120", cap=30) == 30
+    assert parse_retry_after(None) is None and parse_retry_after("x") is None
@@ -0,0 +1,61 @@
+import asyncio
+import logging
+
+import numpy as np
+
+from live import TripFollower, _iso_ms
+from signal_store import SignalSeries, SignalStore
+
+T0 = 1_714_557_600 * 10**9
+
+
+def _rows(start, stop):
+    return {"data": [{"produced_at": _iso_ms(T0 + i * 10**9), "a": float(i)} for i in range(start, stop)]}
+
+
+def _store(tmp_path):
+    store = SignalStore(str(tmp_path), 10**8, live_trip_ids={"7"}, pyramid_widths_ns=[10 * 10**9])
+    ts = (T0 + np.arange(10) * 10**9).astype(np.int64)
+    store.put("v", "7", "a", SignalSeries(ts, np.arange(10, dtype=np.float32), 1.0))
+    return store
+
+
+def test_poll_asks_only_for_the_tail_with_start_pushdown(tmp_path):
+    store = _store(tmp_path)
+    calls = []
+
+    async def fetch(signals, trip_id, hints):
+        calls.append(hints)
+        return _rows(10, 15)
+
+    follower = TripFollower(store, "v", fetch, 2, push_start=True)
+    assert asyncio.run(follower.poll("7")) == 5
+    assert calls == [{"start": _iso_ms(T0 + 9 * 10**9)}]
+    assert follower.interval_s == 2
+    assert len(store.get("v", "7", "a")) == 15
+    assert store.get_summary("v", "7", "a").count == 15
+
+
+def test_without_start_pushdown_polls_at_the_full_interval(tmp_path, caplog):
+    store = _store(tmp_path)
+    calls = []
+
+    async def fetch(signals, trip_id, hints):
+        calls.append(hints)
+        return _rows(0, 12)
+
+    follower = TripFollower(store, "v", fetch, 2, full_interval_s=60)
+    assert follower.interval_s == 60
+    assert asyncio.run(follower.poll("7")) == 2
+    assert calls == [{}]
+
+    async def run_once():
+        task = asyncio.ensure_future(follower.run(["7"]))
+        await asyncio.sleep(0.2)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    with caplog.at_level(logging.WARNING, logger="live"):
+        asyncio.run(run_once())
+    assert "does not filter by start" in caplog.text
+    assert len(calls) == 2  # one poll, then waiting out the 60 s interval
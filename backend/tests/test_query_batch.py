@@ -0,0 +1,41 @@
+import asyncio
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def fetches(monkeypatch):
+    """Record background fetches instead of starting them; returns the list of (stage, by_trip)."""
+    calls = []
+    monkeypatch.setattr(main, "fetch_in_background", lambda stage, by_trip: calls.append((stage, by_trip)))
+    monkeypatch.setattr(main, "SPECULATIVE_PREFETCH_ENABLED", True)
+    monkeypatch.setattr(main.signal_catalog, "suggest", lambda message, limit, ignored: ["mobile_speed"])
+    return calls
+
+
+def test_single_query_speculates(fetches):
+    canonical = main.canonicalize_query("average speed", main.signal_catalog)
+    speculation = main.speculate_signals("average speed", canonical)
+    assert speculation["signals"] == ["mobile_speed"]
+    assert [stage for stage, _ in fetches] == ["speculative_prefetch"]
+
+
+def test_batch_items_reuse_the_batch_prefetch(fetches, monkeypatch):
+    speculations = []
+
+    async def process_query(message, emit=main._ignore_event, include_trace=False):
+        canonical = main.canonicalize_query(message, main.signal_catalog)
+        speculations.append(main.speculate_signals(message, canonical))
+        return main.ChatResponse(success=True, message=message)
+
+    monkeypatch.setattr(main, "process_query", process_query)
+    request = main.BatchQueryRequest(messages=["average speed", "max speed", "speed at the end"])
+    responses = asyncio.run(main.handle_query_batch(request))
+
+    assert [r.message for r in responses] == request.messages
+    assert [stage for stage, _ in fetches] == ["batch_prefetch"]
+    # Still recorded per question, for the speculation hit rate
+    assert [s["signals"] for s in speculations] == [["mobile_speed"]] * 3
+    assert main.batch_prefetched.get() is None
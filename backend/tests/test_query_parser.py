@@ -0,0 +1,67 @@
+import pytest
+
+from query_parser import canonicalize_query
+from signal_catalog import SignalCatalog
+
+CATALOG = SignalCatalog.load()
+
+
+def canonical(question):
+    return canonicalize_query(question, CATALOG)
+
+
+@pytest.mark.parametrize("question", [
+    "max mobile_speed",
+    "What's the maximum mobile speed?",
+    "show me the highest mobile speed value",
+    "Max Mobile_Speed",
+])
+def test_phrasings_share_one_key(question):
+    query = canonical(question)
+    assert (query.key, query.literal_key) == ("max mobile_speed", "max mobile_speed")
+    assert query.signals == ["mobile_speed"]
+    assert not query.has_params
+
+
+def test_trip_ids_become_placeholders():
+    four, five = canonical("max mobile_speed on trip 4"), canonical("highest mobile speed for trip 5")
+    assert four.key == five.key == "max mobile_speed trip <trip>"
+    assert (four.literal_key, five.literal_key) == ("max mobile_speed trip 4", "max mobile_speed trip 5")
+    assert (four.params, five.params) == ({"trip_ids": ["4"], "numbers": []}, {"trip_ids": ["5"], "numbers": []})
+    assert canonical("max mobile speed on trips 4 and 5").params["trip_ids"] == ["4", "5"]
+
+
+def test_other_numbers_become_n():
+    query = canonical("95th percentile of cell 12 temp")
+    assert query.key == "<n> th percentile acu_cell12_temp"
+    assert query.literal_key == "95 th percentile acu_cell12_temp"
+    assert query.params["numbers"] == [95]
+    assert canonical("mobile_speed above 100").key == canonical("mobile_speed above 120.5").key == "mobile_speed above <n>"
+    assert canonical("mobile_speed above 120.5").params["numbers"] == [120.5]
+
+
+@pytest.mark.parametrize("a, b", [
+    # Numbers inside signal names are part of the signal, not parameters
+    ("mean acu cell 12 temp", "mean acu cell 13 temp"),
+    ("max mobile_speed", "min mobile_speed"),
+    ("mean mobile_speed", "median mobile_speed"),
+    ("max mobile_speed", "max inverter current dc"),
+    ("mobile_speed above 100", "mobile_speed below 100"),
+    ("top 5 mobile_speed", "bottom 5 mobile_speed"),
+])
+def test_different_questions_keep_different_keys(a, b):
+    assert canonical(a).key != canonical(b).key
+
+
+def test_signal_resolution():
+    assert CATALOG.resolve("acu cell 12 temp and mobile speed") == ["acu_cell12_temp", "mobile_speed"]
+    # Ambiguous short forms are left to the model
+    assert CATALOG.resolve("speed") == []
+    assert canonical("average speed").signals == []
+
+
+def test_suggest():
+    assert CATALOG.suggest("cell 12")[:2] == ["acu_cell12_temp", "acu_cell12_voltage"]
+    assert CATALOG.suggest("mobil sped") == ["mobile_speed"]
+    assert CATALOG.suggest("max", ignore={"max"}) == []
+    assert len(CATALOG.suggest("cell temp", limit=3)) == 3
@@ -0,0 +1,70 @@
+import asyncio
+import json
+
+from starlette.requests import Request
+
+import main
+
+
+def make_request(disconnect: asyncio.Event) -> Request:
+    async def receive():
+        await disconnect.wait()
+        return {"type": "http.disconnect"}
+
+    return Request({"type": "http", "method": "POST", "path": "/query/stream", "headers": []}, receive)
+
+
+def test_disconnect_cancels_generation(monkeypatch):
+    gemini_finished = []
+
+    async def slow_generation(message, params=None):
+        await asyncio.sleep(30)
+        gemini_finished.append(message)
+        return "set_result('late')"
+
+    monkeypatch.setattr(main, "generate_pandas_script", slow_generation)
+    monkeypatch.setattr(main, "SPECULATIVE_PREFETCH_ENABLED", False)
+    # No heartbeat writes during the test: the disconnect must be noticed on its own
+    monkeypatch.setattr(main, "STREAM_HEARTBEAT_SECONDS", 60)
+    main._script_cache.clear()
+
+    async def go():
+        disconnect = asyncio.Event()
+        request = main.ChatRequest(message="correlation between mobile_speed and acu_cell1_temp in trip 4")
+        response = await main.handle_query_stream(request, make_request(disconnect))
+        body = response.body_iterator
+        events = [json.loads(await body.__anext__())["event"]]
+        while main._generation_flights.stats()["in_flight"] == 0:
+            events.append(json.loads(await asyncio.wait_for(body.__anext__(), 5))["event"])
+        disconnect.set()
+        rest = [line async for line in body]
+        for _ in range(40):
+            if main._generation_flights.stats()["in_flight"] == 0:
+                break
+            await asyncio.sleep(0.05)
+        return events, rest, main._generation_flights.stats()["in_flight"]
+
+    events, rest, in_flight = asyncio.run(asyncio.wait_for(go(), 10))
+    assert events[0] == "accepted"
+    assert rest == []
+    assert in_flight == 0
+    assert not gemini_finished
+
+
+def test_stream_ends_with_result(monkeypatch):
+    async def fail_generation(message, params=None):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(main, "generate_pandas_script", fail_generation)
+    monkeypatch.setattr(main, "SPECULATIVE_PREFETCH_ENABLED", False)
+    main._script_cache.clear()
+
+    async def go():
+        request = main.ChatRequest(message="correlation between mobile_speed and acu_cell2_temp in trip 4")
+        response = await main.handle_query_stream(request, make_request(asyncio.Event()))
+        return [json.loads(line) async for line in response.body_iterator]
+
+    events = asyncio.run(asyncio.wait_for(go(), 10))
+    assert events[0]["event"] == "accepted"
+    assert events[-1]["event"] == "result"
+    assert events[-1]["response"]["success"] is False
@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+
+import main
+from executor import ScriptRun
+from script_analysis import compile_script
+
+SCRIPT = 'df = fetch_signals(["mobile_speed"])\nprint(f"mean {df[\'mobile_speed\'].mean():.2f}")\n'
+READ = {"4": {"mobile_speed": 1200}}
+
+
+def make_run(output="mean 12.50", stderr_len=0, signals_read=READ, **debug):
+    return ScriptRun(
+        output=output,
+        debug={"stderr_len": stderr_len, "signals_read": signals_read, **debug},
+        queue_wait_ms=0,
+        run_ms=5,
+    )
+
+
+@pytest.fixture
+def runs(monkeypatch):
+    """Serve script runs from a list instead of the worker pool; returns the list."""
+    queue = []
+
+    async def run(code, context, timeout=None, on_event=None):
+        return queue.pop(0)
+
+    monkeypatch.setattr(main.script_executor, "run", run)
+    monkeypatch.setattr(main, "SCRIPT_PREFETCH_ENABLED", False)
+    main._result_cache.clear()
+    return queue
+
+
+def execute(script=SCRIPT):
+    return asyncio.run(main.execute_pandas_script(script, {"trip_ids": ["4"], "numbers": []}))
+
+
+def test_clean_run():
+    analysis = compile_script(SCRIPT).analysis
+    assert main.is_clean_run(make_run(), analysis)
+    assert not main.is_clean_run(make_run(stderr_len=12), analysis)
+    assert not main.is_clean_run(make_run(output="Error: 'mobile_speed'"), analysis)
+    assert not main.is_clean_run(make_run(reason="no stdout and no fallback variable"), analysis)
+    assert not main.is_clean_run(make_run(signals_read={}), analysis)
+    assert not main.is_clean_run(make_run(signals_read={"4": {}}), analysis)
+    assert not main.is_clean_run(make_run(signals_read={"4": {"mobile_speed": 0}}), analysis)
+    # A script that reads no vehicle data needs no signal reads
+    assert main.is_clean_run(make_run(signals_read={}), compile_script("print(1 + 1)\n").analysis)
+
+
+def test_clean_result_is_served_from_the_cache(runs):
+    runs.append(make_run())
+    output, debug = execute()
+    assert debug["result_cache"] == {"hit": False, "age_s": None, "live": False, "clean": True}
+    output, debug = execute()
+    assert output == "mean 12.50"
+    assert debug["result_cache"]["hit"] and debug["result_cache"]["clean"]
+    assert not runs
+
+
+def test_failed_result_expires_after_the_failure_ttl(runs, monkeypatch):
+    monkeypatch.setattr(main, "RESULT_CACHE_FAILURE_TTL_SECONDS", 30)
+    runs.append(make_run(output="Error fetching data: boom", signals_read={}))
+    execute()
+    assert execute()[1]["result_cache"]["hit"]  # briefly kept
+
+    monkeypatch.setattr(main, "RESULT_CACHE_FAILURE_TTL_SECONDS", 0.0)
+    runs.append(make_run())
+    output, debug = execute()
+    assert not debug["result_cache"]["hit"]
+    assert output == "mean 12.50"
+
+
+def test_failed_result_is_not_stored_without_a_failure_ttl(runs, monkeypatch):
+    monkeypatch.setattr(main, "RESULT_CACHE_FAILURE_TTL_SECONDS", 0.0)
+    runs.append(make_run(stderr_len=40))
+    execute()
+    assert len(main._result_cache) == 0
+
+
+def test_answer_from_a_signal_not_uploaded_yet_is_not_kept(runs, monkeypatch):
+    # A finished trip's key never changes, so only the failure TTL stops a day of "no data" answers
+    monkeypatch.setattr(main, "RESULT_CACHE_FAILURE_TTL_SECONDS", 0.0)
+    runs.append(make_run(output="mean nan", signals_read={"4": {"mobile_speed": 0}}))
+    output, debug = execute()
+    assert output == "mean nan" and not debug["result_cache"]["clean"]
+
+    runs.append(make_run())
+    output, debug = execute()
+    assert not debug["result_cache"]["hit"]
+    assert output == "mean 12.50"
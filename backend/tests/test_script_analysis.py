@@ -0,0 +1,79 @@
+import asyncio
+
+import main
+from query_parser import canonicalize_query
+from script_analysis import compile_script, sanitize_generated_code
+
+HARD_CODED_THRESHOLD = """
+signals = ["mobile_speed"]
+df = fetch_signals(signals, trip_id=PARAMS["trip_ids"][0])
+result = f"{(df['mobile_speed'] > 50).mean():.1%} of samples above 50"
+set_result(result)
+"""
+
+TEMPLATED = """
+signals = ["mobile_speed"]
+threshold = float(PARAMS["numbers"][0])
+df = fetch_signals(signals, trip_id=PARAMS["trip_ids"][0])
+result = f"{(df['mobile_speed'] > threshold).mean():.1%} of samples above {threshold}"
+set_result(result)
+"""
+
+PARAMS = {"trip_ids": ["4"], "numbers": [50]}
+
+
+def test_sanitize_strips_fences():
+    assert sanitize_generated_code("```python\nprint(1)\n```") == "print(1)"
+
+
+def test_reads_signals_and_trips():
+    analysis = compile_script(TEMPLATED).analysis
+    assert analysis.signals == ["mobile_speed"]
+    assert analysis.complete and analysis.trip_reusable
+    assert analysis.signals_by_trip({"trip_id": "4", "params": PARAMS}) == {"4": ["mobile_speed"]}
+
+
+def test_hard_coded_threshold_is_not_a_template():
+    analysis = compile_script(HARD_CODED_THRESHOLD).analysis
+    assert analysis.uses_params
+    assert "numbers" not in analysis.params_read
+    assert not analysis.fits_template(PARAMS)
+
+
+def test_threshold_read_from_params_is_a_template():
+    assert compile_script(TEMPLATED).analysis.fits_template(PARAMS)
+
+
+def test_number_read_but_also_hard_coded_is_not_a_template():
+    script = TEMPLATED.replace("> threshold", "> 50")
+    assert not compile_script(script).analysis.fits_template(PARAMS)
+
+
+def test_default_trip_counts_as_reading_trip_ids():
+    analysis = compile_script('df = fetch_signals(["mobile_speed"])\nset_result(str(df["mobile_speed"].mean()))\n').analysis
+    assert analysis.fits_template({"trip_ids": ["4"], "numbers": []})
+
+
+def test_hard_coded_trip_is_not_a_template():
+    analysis = compile_script('df = fetch_signals(["mobile_speed"], trip_id="4")\n').analysis
+    assert not analysis.trip_reusable
+    assert not analysis.fits_template({"trip_ids": ["4"], "numbers": []})
+
+
+def test_hard_coded_threshold_script_is_cached_under_literal_key(monkeypatch):
+    async def generate(message, params=None):
+        return HARD_CODED_THRESHOLD.replace("50", "80") if "80" in message else HARD_CODED_THRESHOLD
+
+    monkeypatch.setattr(main, "generate_pandas_script", generate)
+    monkeypatch.setattr(main, "SPECULATIVE_PREFETCH_ENABLED", False)
+    main._script_cache.clear()
+
+    async def ask(message):
+        return await main.get_or_generate_script(message, canonicalize_query(message, main.signal_catalog))
+
+    first = asyncio.run(ask("share of mobile_speed above 50 in trip 4"))
+    second = asyncio.run(ask("share of mobile_speed above 80 in trip 4"))
+    assert not first[1] and not second[1]
+    assert "80" in second[0]
+    # The literal question itself is still served from the cache
+    assert asyncio.run(ask("share of mobile_speed above 50 in trip 4"))[1]
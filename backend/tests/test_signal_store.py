@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from signal_store import SignalSeries, SignalStore, decode_signals_payload, split_signals_payload
+
+T0 = 1_714_557_600 * 10**9
+WIDTHS = [10**9, 10 * 10**9, 60 * 10**9]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SignalStore(str(tmp_path), 10**8, pyramid_widths_ns=WIDTHS, empty_ttl_seconds=60)
+
+
+def test_decode_row_column_and_long_forms():
+    rows = {"data": [{"produced_at": "2024-05-01T10:00:00Z", "a": 1.0}, {"produced_at": "2024-05-01T10:00:01Z", "a": 2.0}]}
+    columns = {"signals": {"a": [{"produced_at": "2024-05-01T10:00:00Z", "value": 1.0}, {"produced_at": "2024-05-01T10:00:01Z", "value": 2.0}]}}
+    long_form = [
+        {"produced_at": "2024-05-01T10:00:00Z", "name": "a", "value": 1.0},
+        {"produced_at": "2024-05-01T10:00:01Z", "name": "a", "value": 2.0},
+    ]
+    for payload in (rows, columns, long_form):
+        series = decode_signals_payload(payload, ["a"])["a"]
+        assert series.values.tolist() == [1.0, 2.0]
+        assert (series.timestamps[1] - series.timestamps[0]) == 10**9
+
+
+def test_split_reports_signals_the_payload_does_not_mention():
+    payload = {"data": [{"produced_at": "2024-05-01T10:00:00Z", "a": 1.0}]}
+    decoded, absent = split_signals_payload(payload, ["a", "b"])
+    assert set(decoded) == {"a", "b"} and len(decoded["b"]) == 0
+    assert absent == ["b"]
+    assert split_signals_payload({"error": "trip not found"}, ["a"])[1] == ["a"]
+
+
+def test_error_body_is_not_cached(store):
+    decoded = store.ingest("v", "1", {"error": "trip not found"}, ["a", "b"])
+    assert len(decoded["a"]) == 0
+    assert store.missing("v", "1", ["a", "b"]) == ["a", "b"]
+    assert store.cached_signals("v", "1") == []
+
+
+def test_signal_missing_from_partial_payload_expires(store, monkeypatch):
+    payload = {"data": [{"produced_at": "2024-05-01T10:00:00Z", "a": 1.0}]}
+    store.ingest("v", "1", payload, ["a", "b"])
+    assert store.missing("v", "1", ["a", "b"]) == []
+
+    import signal_store
+    later = signal_store.time() + 61
+    monkeypatch.setattr(signal_store, "time", lambda: later)
+    fresh = SignalStore(store.root, 10**8, pyramid_widths_ns=WIDTHS, empty_ttl_seconds=60)
+    # A signal with samples never expires on a finished trip; an empty one is looked up again
+    assert fresh.missing("v", "1", ["a", "b"]) == ["b"]
+
+
+def test_append_matches_full_rebuild(tmp_path):
+    ts = (T0 + np.arange(3000) * 10**8).astype(np.int64)
+    vals = np.random.default_rng(0).normal(size=3000).astype(np.float32)
+    live = SignalStore(str(tmp_path / "live"), 10**8, live_trip_ids={"7"}, pyramid_widths_ns=WIDTHS)
+    live.put("v", "7", "a", SignalSeries(ts[:1000], vals[:1000], 1.0))
+    assert live.append("v", "7", "a", SignalSeries(ts[500:2000], vals[500:2000], 2.0)) == 1000
+    assert live.append("v", "7", "a", SignalSeries(ts[1500:], vals[1500:], 3.0)) == 1000
+    assert live.append("v", "7", "a", SignalSeries(ts[1500:], vals[1500:], 4.0)) == 0
+    live.mark_followed("v", "7")
+
+    full = SignalStore(str(tmp_path / "full"), 10**8, pyramid_widths_ns=WIDTHS)
+    full.put("v", "x", "a", SignalSeries(ts, vals, 3.0))
+
+    a, b = live.get_summary("v", "7", "a"), full.get_summary("v", "x", "a")
+    assert a.count == b.count == 3000
+    assert a.mean == pytest.approx(b.mean, abs=1e-6)
+    assert a.stddev == pytest.approx(b.stddev, abs=1e-6)
+    assert (a.min, a.max, a.last_ns) == (b.min, b.max, b.last_ns)
+    for width in WIDTHS + [120 * 10**9]:
+        x, y = live.get_buckets("v", "7", "a", width), full.get_buckets("v", "x", "a", width)
+        assert np.array_equal(x.starts, y.starts) and np.array_equal(x.count, y.count)
+        assert np.allclose(x.sum, y.sum) and np.array_equal(x.min, y.min) and np.array_equal(x.max, y.max)
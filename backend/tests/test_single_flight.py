@@ -0,0 +1,99 @@
+import asyncio
+
+from cache import SingleFlight
+
+
+def test_concurrent_calls_share_one_run():
+    flights = SingleFlight("test")
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "done"
+
+    async def go():
+        return await asyncio.gather(*(flights.do("k", work) for _ in range(5)))
+
+    results = asyncio.run(go())
+    assert calls == [1]
+    assert [r for r, _ in results] == ["done"] * 5
+    assert sum(shared for _, shared in results) == 4
+    assert flights.stats() == {"in_flight": 0, "started": 1, "coalesced": 4}
+
+
+def test_work_survives_until_every_waiter_is_cancelled():
+    flights = SingleFlight("test")
+    finished = []
+
+    async def work():
+        await asyncio.sleep(0.05)
+        finished.append(1)
+        return "done"
+
+    async def go():
+        first = asyncio.ensure_future(flights.do("k", work))
+        second = asyncio.ensure_future(flights.do("k", work))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(go()) == ("done", True)
+    assert finished == [1]
+
+
+def test_cancelling_every_waiter_cancels_the_work():
+    flights = SingleFlight("test")
+
+    async def go():
+        waiter = asyncio.ensure_future(flights.do("k", lambda: asyncio.sleep(10)))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        await asyncio.sleep(0)
+        return flights.stats()["in_flight"]
+
+    assert asyncio.run(go()) == 0
+
+
+def test_swallowed_cancel_is_redelivered():
+    flights = SingleFlight("test")
+    finished = []
+
+    async def stubborn():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            # What anyio's connect_tcp does when a cancel races the connection
+            asyncio.current_task().uncancel()
+        await asyncio.sleep(10)
+        finished.append(1)
+
+    async def go():
+        waiter = asyncio.ensure_future(flights.do("k", stubborn))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        for _ in range(40):
+            if not flights.stats()["in_flight"]:
+                break
+            await asyncio.sleep(0.05)
+        return flights.stats()["in_flight"]
+
+    assert asyncio.run(go()) == 0
+    assert not finished
+
+
+def test_do_batch_starts_one_call_for_keys_not_in_flight():
+    flights = SingleFlight("test")
+    batches = []
+
+    async def fetch(keys):
+        batches.append(sorted(keys))
+        await asyncio.sleep(0.01)
+
+    async def go():
+        return await asyncio.gather(flights.do_batch(["a", "b"], fetch), flights.do_batch(["b", "c"], fetch))
+
+    assert asyncio.run(go()) == [0, 1]
+    assert batches == [["a", "b"], ["c"]]
@@ -0,0 +1,126 @@
+"""Shared HTTP plumbing for upstream services (Gemini and the vehicle API).
+
+One pooled HTTP/2 client is created for the lifetime of the app, retries back
+off without blocking the event loop, and a limiter queues Gemini calls so we
+stay under the quota instead of bouncing 429s back to users.
+"""
+import asyncio
+import logging
+import random
+from email.utils import parsedate_to_datetime
+from time import monotonic, time
+from typing import Any, Optional
+
+import httpx
+
+try:
+    import orjson
+except ImportError:  # optional: faster decoding of large signal payloads
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+
+def create_http_client(max_connections: int, max_keepalive: int, timeout: float) -> httpx.AsyncClient:
+    """Build the shared AsyncClient, using HTTP/2 when the h2 package is available."""
+    limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_keepalive,
+        keepalive_expiry=30.0,
+    )
+    try:
+        import h2  # noqa: F401
+        http2 = True
+    except ImportError:
+        logger.warning("h2 not installed; upstream client falls back to HTTP/1.1")
+        http2 = False
+    return httpx.AsyncClient(http2=http2, limits=limits, timeout=timeout)
+
+
+def json_loads(data: bytes) -> Any:
+    """Decode a JSON body, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    import json
+    return json.loads(data)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header (delta-seconds or HTTP-date) into seconds."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time())
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_delay(attempt: int, base: float, retry_after: Optional[str] = None, cap: float = 30.0) -> float:
+    """Exponential backoff with full jitter, never shorter than Retry-After."""
+    delay = random.uniform(0, base * (2 ** attempt))
+    server_delay = parse_retry_after(retry_after)
+    if server_delay is not None:
+        delay = server_delay + random.uniform(0, base)
+    return min(delay, cap)
+
+
+class AsyncRateLimiter:
+    """Concurrency cap plus token bucket; callers queue instead of being rejected.
+
+    ``rate_per_minute <= 0`` disables the token bucket. ``pause`` holds every
+    queued caller back, e.g. after the upstream answered 429 with Retry-After.
+    """
+
+    def __init__(self, rate_per_minute: float, burst: int, max_concurrency: int):
+        self.rate = rate_per_minute / 60.0
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = monotonic()
+        self._paused_until = 0.0
+        self._max_concurrency = max(1, max_concurrency)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self.waiting = 0
+
+    def pause(self, seconds: float) -> None:
+        self._paused_until = max(self._paused_until, monotonic() + seconds)
+
+    async def _take_token(self) -> None:
+        async with self._lock:
+            while True:
+                now = monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                if self.rate <= 0:
+                    return
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    async def __aenter__(self) -> "AsyncRateLimiter":
+        # Created lazily so they bind to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+            self._lock = asyncio.Lock()
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+            try:
+                await self._take_token()
+            except BaseException:
+                self._semaphore.release()
+                raise
+        finally:
+            self.waiting -= 1
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self._semaphore.release()
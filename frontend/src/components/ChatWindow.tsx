@@ -1,14 +1,31 @@
 import { useState, useRef, useEffect } from 'react';
-import type { Message, ChatWindowProps } from '../types/chatbot';
-import { sendMessage, logError } from '../services/api';
+import type { Message, ChatWindowProps, QueryStreamEvent } from '../types/chatbot';
+import { streamMessage, logError } from '../services/api';
 import MessageBubble from './MessageBubble';
 import InputBox from './InputBox';
 // Theme toggle removed; default dark mode enforced at app root
 
+const describeStage = (event: QueryStreamEvent): string | null => {
+  switch (event.event) {
+    case 'planned':
+      return event.path === 'fast_path' ? 'Computing directly...' : 'Writing analysis script...';
+    case 'script_generated':
+      return event.cache_hit ? 'Reusing cached script...' : 'Script generated...';
+    case 'executing':
+      return 'Running analysis...';
+    case 'data_fetched':
+      return `Fetched ${event.rows?.toLocaleString() ?? 0} rows...`;
+    default:
+      return null;
+  }
+};
+
 const ChatWindow = ({ className = '' }: ChatWindowProps) => {
   const [messages, setMessages] = useState<Message[]>([]);
   const [isLoading, setIsLoading] = useState(false);
+  const [status, setStatus] = useState('');
   const messagesEndRef = useRef<HTMLDivElement>(null);
+  const abortRef = useRef<AbortController | null>(null);
 
   const scrollToBottom = () => {
     messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
@@ -28,9 +45,19 @@ const ChatWindow = ({ className = '' }: ChatWindowProps) => {
 
     setMessages(prev => [...prev, userMessage]);
     setIsLoading(true);
+    setStatus('');
+    const controller = new AbortController();
+    abortRef.current = controller;
 
     try {
-      const response = await sendMessage(content);
+      const response = await streamMessage(
+        content,
+        (event) => {
+          const stage = describeStage(event);
+          if (stage) setStatus(stage);
+        },
+        controller.signal,
+      );
       
       const botMessage: Message = {
         id: (Date.now() + 1).toString(),
@@ -41,6 +68,15 @@ const ChatWindow = ({ className = '' }: ChatWindowProps) => {
 
       setMessages(prev => [...prev, botMessage]);
     } catch (error) {
+      if (controller.signal.aborted) {
+        setMessages(prev => [...prev, {
+          id: (Date.now() + 1).toString(),
+          content: 'Query cancelled.',
+          sender: 'bot',
+          timestamp: new Date(),
+        }]);
+        return;
+      }
       console.error('Error sending message:', error);
       
       const errorMessage: Message = {
@@ -59,10 +95,16 @@ const ChatWindow = ({ className = '' }: ChatWindowProps) => {
         timestamp: new Date().toISOString(),
       }));
     } finally {
+      abortRef.current = null;
       setIsLoading(false);
+      setStatus('');
     }
   };
 
+  const handleCancel = () => {
+    abortRef.current?.abort();
+  };
+
   return (
     <div className={`flex flex-col h-screen bg-gray-50 dark:bg-gray-900 ${className}`}>
       {/* Header */}
@@ -89,7 +131,7 @@ const ChatWindow = ({ className = '' }: ChatWindowProps) => {
           <MessageBubble
             message={{
               id: 'loading',
-              content: '',
+              content: status,
               sender: 'bot',
               timestamp: new Date(),
               isLoading: true,
@@ -103,6 +145,7 @@ const ChatWindow = ({ className = '' }: ChatWindowProps) => {
       {/* Input */}
       <InputBox
         onSendMessage={handleSendMessage}
+        onCancel={isLoading ? handleCancel : undefined}
         disabled={isLoading}
         placeholder="Ask about vehicle data..."
       />
@@ -3,6 +3,7 @@ import type { InputBoxProps } from "../types/chatbot";
 
 const InputBox = ({
   onSendMessage,
+  onCancel,
   disabled = false,
   placeholder = "Ask about vehicle data...",
 }: InputBoxProps) => {
@@ -33,6 +34,14 @@ const InputBox = ({
         disabled={disabled}
         className="flex-1 px-4 py-2 border border-gray-300 dark:border-gray-600 rounded-lg focus:outline-none focus:ring-2 focus:ring-blue-500 dark:bg-gray-700 dark:text-white text-black placeholder-gray-500 dark:placeholder-gray-400 disabled:opacity-50 disabled:cursor-not-allowed"
       />
+      {onCancel && (
+        <button
+          onClick={onCancel}
+          className="px-4 py-2 bg-gray-500 text-white rounded-lg hover:bg-gray-600 transition-colors duration-200"
+        >
+          Stop
+        </button>
+      )}
       <button
         onClick={handleSend}
         disabled={disabled || !message.trim()}
@@ -18,7 +18,7 @@ const MessageBubble = ({ message }: MessageBubbleProps) => {
             <div className="w-2 h-2 bg-current rounded-full animate-bounce"></div>
             <div className="w-2 h-2 bg-current rounded-full animate-bounce" style={{ animationDelay: '0.1s' }}></div>
             <div className="w-2 h-2 bg-current rounded-full animate-bounce" style={{ animationDelay: '0.2s' }}></div>
-            <span className="ml-2">Thinking...</span>
+            <span className="ml-2">{message.content || 'Thinking...'}</span>
           </div>
         ) : (
           <p className="text-sm">{message.content}</p>
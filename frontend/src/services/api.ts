@@ -1,7 +1,8 @@
-import type { ChatResponse, LogRequest } from '../types/chatbot';
+import type { ChatResponse, LogRequest, QueryStreamEvent } from '../types/chatbot';
 
 const API_BASE_URL = 'http://localhost:8000';
 const DEFAULT_TIMEOUT_MS = 20000; // 20s client-side timeout
+const STREAM_IDLE_TIMEOUT_MS = 30000; // abort a stream that sends nothing (not even heartbeats) for 30s
 
 export const sendMessage = async (message: string, timeoutMs: number = DEFAULT_TIMEOUT_MS): Promise<ChatResponse> => {
   const controller = new AbortController();
@@ -32,6 +33,65 @@ export const sendMessage = async (message: string, timeoutMs: number = DEFAULT_T
   }
 };
 
+// Streams stage events from /query/stream and resolves with the final response.
+// Aborting `signal` closes the connection, which cancels the query on the server.
+export const streamMessage = async (
+  message: string,
+  onEvent: (event: QueryStreamEvent) => void,
+  signal?: AbortSignal,
+): Promise<ChatResponse> => {
+  const controller = new AbortController();
+  const abort = () => controller.abort();
+  signal?.addEventListener('abort', abort);
+  let idleTimer = setTimeout(abort, STREAM_IDLE_TIMEOUT_MS);
+  try {
+    const response = await fetch(`${API_BASE_URL}/query/stream`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({ message }),
+      signal: controller.signal,
+    });
+
+    if (!response.ok || !response.body) {
+      throw new Error(`HTTP error! status: ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    for (;;) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      clearTimeout(idleTimer);
+      idleTimer = setTimeout(abort, STREAM_IDLE_TIMEOUT_MS);
+      buffer += decoder.decode(value, { stream: true });
+      const lines = buffer.split('\n');
+      buffer = lines.pop() ?? '';
+      for (const line of lines) {
+        if (!line.trim()) continue;
+        const event = JSON.parse(line) as QueryStreamEvent;
+        onEvent(event);
+        if (event.event === 'result' && event.response) {
+          reader.cancel().catch(() => undefined);
+          return event.response;
+        }
+      }
+    }
+    throw new Error('Stream ended without a result');
+  } catch (error: unknown) {
+    if (error instanceof DOMException && error.name === 'AbortError') {
+      throw new Error(signal?.aborted ? 'Request cancelled' : 'Request timed out');
+    }
+    console.error('Error streaming message:', error);
+    throw error;
+  } finally {
+    clearTimeout(idleTimer);
+    signal?.removeEventListener('abort', abort);
+  }
+};
+
 export const logError = async (error: string): Promise<void> => {
   try {
     await fetch(`${API_BASE_URL}/log`, {
@@ -13,6 +13,26 @@ export interface ChatResponse {
   error?: string;
 }
 
+export type QueryStage =
+  | 'accepted'
+  | 'planned'
+  | 'script_generated'
+  | 'executing'
+  | 'data_fetched'
+  | 'heartbeat'
+  | 'result';
+
+export interface QueryStreamEvent {
+  event: QueryStage;
+  elapsed_ms: number;
+  path?: 'fast_path' | 'llm';
+  signals?: string[];
+  cache_hit?: boolean;
+  rows?: number;
+  trip_id?: string;
+  response?: ChatResponse;
+}
+
 export interface LogRequest {
   error: string;
   timestamp: string;
@@ -31,6 +51,7 @@ export interface MessageBubbleProps {
 
 
 export interface InputBoxProps {
+  onCancel?: () => void;
   onSendMessage: (message: string) => void;
   disabled?: boolean;
   placeholder?: string;